@@ -31,6 +31,27 @@ const float adc_scaler = 9.7 / 4095.0; // max voltage / 2^(adc bits)
 // JSON Vars
 StaticJsonDocument<256> doc; // JSON doc
 
+// Binary Framing Vars - layout must match Vector/ADCS/imu_frame.py
+#define FRAME_SYNC_0 0xA5
+#define FRAME_SYNC_1 0x5A
+#define FRAME_DATA 0x01
+#define FRAME_TEXT 0x02
+#define FLAG_IMU_FOUND 0x01
+
+bool binary_mode = false; // Serial1 sends JSON lines at 9600 until the Pi sends "BINARY <baud>"
+uint16_t frame_seq = 0;
+
+struct __attribute__((packed)) DataPayload {
+  uint16_t seq;
+  uint32_t timestamp; // millis()
+  float gyro_z;       // rad/s
+  float yaw;          // deg
+  float bms_voltage;
+  float bms_current;
+  float bms_temp;
+  uint8_t flags;
+};
+
 //// Generic Functions ////
 
 float to_degrees(float radians) {
@@ -41,9 +62,36 @@ float to_radians(float degrees) {
   return degrees * M_PI / 180;
 }
 
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)
+uint16_t crc16_ccitt(const uint8_t *data, size_t length, uint16_t crc) {
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// sync (2) | type (1) | length (1) | payload | crc16 (2, little-endian) over type, length and payload
+void send_frame(uint8_t type, const uint8_t *payload, uint8_t length) {
+  uint8_t header[4] = {FRAME_SYNC_0, FRAME_SYNC_1, type, length};
+  uint16_t crc = crc16_ccitt(header + 2, 2, 0xFFFF);
+  crc = crc16_ccitt(payload, length, crc);
+  uint8_t crc_bytes[2] = {(uint8_t)(crc & 0xFF), (uint8_t)(crc >> 8)};
+
+  Serial1.write(header, sizeof(header));
+  Serial1.write(payload, length);
+  Serial1.write(crc_bytes, sizeof(crc_bytes));
+}
+
 void serial_msg(String msg) {
   Serial.println(msg);
-  Serial1.println(msg);
+  if (binary_mode) {
+    send_frame(FRAME_TEXT, (const uint8_t *)msg.c_str(), min((int)msg.length(), 255));
+  } else {
+    Serial1.println(msg);
+  }
 }
 
 //// Generic Functions END ////
@@ -280,29 +328,58 @@ void setup() {
 }
 
 
+void handle_command(String cmd) {
+  cmd.trim();
+
+  // Link negotiation: "BINARY <baud>" switches Serial1 to CRC-checked frames, "JSON" switches back
+  if (cmd.startsWith("BINARY")) {
+    long baud = cmd.substring(6).toInt();
+    if (baud <= 0) {
+      baud = 115200;
+    }
+    serial_msg("BINARY OK"); // Acknowledge on the old protocol and baud rate
+    Serial1.flush();
+    Serial1.updateBaudRate(baud);
+    binary_mode = true;
+    return;
+  }
+  if (cmd.equalsIgnoreCase("JSON")) {
+    serial_msg("JSON OK");
+    Serial1.flush();
+    Serial1.updateBaudRate(9600);
+    binary_mode = false;
+    return;
+  }
+
+  if (imu_found == true) {
+    if (cmd.equalsIgnoreCase("CALIBRATE")) {
+      calibrate();
+    } else if(cmd.equalsIgnoreCase("ZERO")) {
+      zero();
+    }
+  }
+}
+
+void send_data_frame() {
+  DataPayload payload;
+  payload.seq = frame_seq++;
+  payload.timestamp = millis();
+  payload.gyro_z = gyro_z;
+  payload.yaw = yaw;
+  payload.bms_voltage = bms_voltage;
+  payload.bms_current = bms_current;
+  payload.bms_temp = bms_temp;
+  payload.flags = imu_found ? FLAG_IMU_FOUND : 0;
+  send_frame(FRAME_DATA, (const uint8_t *)&payload, sizeof(payload));
+}
+
 void loop() {
-  // Check for calibration commands
+  // Check for calibration and link commands
   if (Serial.available()) {
-    String cmd = Serial.readStringUntil('\n');
-    cmd.trim();
-    if (imu_found == true) {
-      if (cmd.equalsIgnoreCase("CALIBRATE")) {
-        calibrate();
-      } else if(cmd.equalsIgnoreCase("ZERO")) {
-        zero();
-      }
-    }
+    handle_command(Serial.readStringUntil('\n'));
   }
   if (Serial1.available()) {
-    String cmd = Serial1.readStringUntil('\n');
-    cmd.trim();
-    if (imu_found == true) {
-      if (cmd.equalsIgnoreCase("CALIBRATE")) {
-        calibrate();
-      } else if(cmd.equalsIgnoreCase("ZERO")) {
-        zero();
-      }
-    }
+    handle_command(Serial1.readStringUntil('\n'));
   }
   // Clear the JSON document for new data
   doc.clear();
@@ -318,12 +395,16 @@ void loop() {
   doc["bms_current"] = bms_current;
   doc["bms_temp"] = bms_temp;
 
-  // Serialize the JSON document directly to Serial1
-  // This is the most efficient way as it avoids creating an intermediate String object.
-  size_t bytesSentSerial1 = serializeJson(doc, Serial1);
+  if (binary_mode) {
+    // Fixed-layout frame to the Pi, JSON stays on the USB serial for debugging
+    send_data_frame();
+  } else {
+    // Serialize the JSON document directly to Serial1
+    // This is the most efficient way as it avoids creating an intermediate String object.
+    size_t bytesSentSerial1 = serializeJson(doc, Serial1);
+    Serial1.println(","); // Add a newline after the JSON object for better readability in a terminal
+  }
   size_t bytesSentSerial = serializeJson(doc, Serial);
-
-  Serial1.println(","); // Add a newline after the JSON object for better readability in a terminal
   Serial.println();
 
   delay(10);
@@ -0,0 +1,303 @@
+import queue
+import threading
+import time
+import numpy as np
+import ADCS
+import ADCS.adcs_controller
+from ADCS.attitude_estimator import AttitudeEstimator
+from ADCS.control_loop import ControlLoop, PidController
+from ADCS.adcs_controller import AdcsController
+from ADCS.imu import Imu, SampleBuffer
+from ADCS.fake_esp import FakeEsp
+from ADCS.reaction_wheel import control_to_duty
+from ADCS.simulator import RecordingPipe, SatellitePlant, SimulatedBrushedMotor, SimulatedImu, SimulatedSunSensor, Simulator
+from ADCS.sun_calibration import SunCalibrationRecorder, fit_offset, get_esp_boot_time
+from ADCS.wheel_tuner import pareto_front, simulate_gains, tune
+from ADCS.imu_frame import FrameDecoder, encode_data_frame, encode_frame, FRAME_TEXT
+from timeline import StartupTimeline
+
+def test_sample_buffer_latest_and_since():
+    buffer = SampleBuffer(size=4)
+    assert buffer.latest() is None
+
+    for i in range(6):
+        buffer.append({"orientation": [i]}, timestamp=float(i))
+
+    # Only the newest 4 samples are kept
+    assert buffer.latest()["orientation"] == [5]
+    assert buffer.latest()["seq"] == 6
+    assert [s["orientation"][0] for s in buffer.since(-1)] == [2, 3, 4, 5]
+    assert [s["orientation"][0] for s in buffer.since(3.0)] == [4, 5]
+
+def test_sample_buffer_wait_newer():
+    buffer = SampleBuffer(size=8)
+    buffer.append({"orientation": [0]})
+
+    # Nothing newer arrives -> timeout
+    assert buffer.wait_newer(1, timeout=0.05) is None
+
+    threading.Timer(0.05, buffer.append, args=({"orientation": [1]},)).start()
+    start = time.monotonic()
+    sample = buffer.wait_newer(1, timeout=2)
+    assert sample["orientation"] == [1]
+    assert time.monotonic() - start < 1
+
+def test_frame_decoder_roundtrip_and_resync():
+    frames = [encode_data_frame(seq, seq * 10, 0.5, float(seq), 7.4, 1.0, 25.0) for seq in range(1, 4)]
+    corrupted = bytearray(frames[1])
+    corrupted[8] ^= 0xFF
+    stream = b"noise" + frames[0] + bytes(corrupted) + encode_frame(FRAME_TEXT, b"Calibration complete!") + frames[2]
+
+    decoder = FrameDecoder()
+    samples, messages = [], []
+    # Feed in small chunks to exercise partial frames
+    for i in range(0, len(stream), 7):
+        new_samples, new_messages = decoder.decode(stream[i:i + 7])
+        samples += new_samples
+        messages += new_messages
+
+    assert [s["orientation"] for s in samples] == [[1.0], [3.0]]
+    assert samples[0]["gyroscope"] == [28.65]
+    assert messages == ["Calibration complete!"]
+    assert decoder.crc_errors == 1
+    assert decoder.lost_frames == 1
+
+def test_imu_finds_esp_already_streaming_binary():
+    for esp in (FakeEsp(), FakeEsp(baudrate=115200, binary=True)):
+        # A fresh ESP is switched to binary, one left in binary mode by an earlier run is picked up as it is
+        esp.start()
+        imu = Imu(port=esp.port, binary=True)
+        try:
+            assert imu.get_link_statistics()["mode"] == "binary"
+            assert imu.get_link_statistics()["baudrate"] == 115200
+            first = imu.get_latest_sample()
+            assert imu.samples.wait_newer(first["seq"], timeout=1)["orientation"]
+            assert imu.calibrate(timeout=2)
+        finally:
+            imu.stop_reader()
+            imu.serial_connection.close()
+            esp.stop()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_control_loop_fixed_rate_and_overruns():
+    clock = FakeClock()
+    ticks = []
+
+    def slow_feedback():
+        # Every 5th tick the sensor read takes longer than the period
+        clock.now += 0.15 if len(ticks) % 5 == 4 else 0.02
+        return 0.0
+
+    loop = ControlLoop(lambda: 1.0, slow_feedback, lambda control, dt: control, PidController(1, 0, 0), rate=10, on_tick=ticks.append, clock=clock)
+    stats = loop.run(duration=2.0)
+
+    # Ticks stay on the 100 ms grid despite the 20 ms read time, a late tick runs late without shifting the grid
+    assert [round(t["time"], 3) for t in ticks[:7]] == [0.0, 0.1, 0.2, 0.3, 0.4, 0.55, 0.6]
+    assert abs(ticks[5]["dt"] - 0.15) < 1e-9
+    assert stats["overruns"] == 4
+    assert abs(stats["max_overrun"] - 0.05) < 1e-9
+    assert ticks[0]["output"] == 1.0
+
+def test_control_loop_response_does_not_depend_on_rate():
+    def run(rate):
+        clock = FakeClock()
+        plant = SatellitePlant(clock)
+        motor = SimulatedBrushedMotor(plant)
+
+        def actuate(control, dt):
+            duty_cycle = control_to_duty(control)
+            motor.set_speed(duty_cycle)
+            return duty_cycle
+
+        # Angular velocity at each whole second, holding 1 deg/s like activate_wheel_with_speed_desired
+        response = {}
+        loop = ControlLoop(lambda: 1.0, lambda: plant.get_state()["angular_velocity"], actuate, PidController(2, 0.1, 0.05), rate=rate, on_tick=lambda tick: response.setdefault(round(tick["time"]), tick["feedback"]), clock=clock)
+        loop.run(duration=60)
+        return response
+
+    slow, fast = run(10), run(50)
+    assert slow[59] > 0.1
+    assert max(abs(slow[t] - fast[t]) for t in slow) < 0.01
+
+def test_pid_controller_uses_measured_dt():
+    pid = PidController(0, 1, 1)
+    assert pid.update(2.0, 0.1) == 0.2  # No derivative kick on the first update
+    assert abs(pid.update(1.0, 0.5) - (0.7 - 2.0)) < 1e-9
+
+def test_plant_conserves_momentum():
+    clock = FakeClock()
+    plant = SatellitePlant(clock, damping=0.0)
+    wheel = plant.add_wheel()
+    plant.set_wheel_target(wheel, 1000)
+
+    clock.sleep(10)
+    state = plant.get_state()
+    # Wheel has spun up and the body counter-rotates with equal and opposite momentum
+    assert abs(wheel.speed - 1000) < 1e-6
+    assert abs(plant.inertia * state["angular_velocity"] + wheel.inertia * wheel.speed * 6) < 1e-9
+    assert state["yaw"] < 0
+
+def test_simulator_runs_phase2_rotation_headless():
+    simulator = Simulator(speedup=500)
+    adcs_controller = AdcsController(queue.Queue(), simulator=simulator)
+    start_yaw = simulator.plant.get_state()["yaw"]
+
+    pipe = RecordingPipe()
+    start = time.monotonic()
+    adcs_controller.phase2_rotate(pipe)
+
+    assert abs(simulator.plant.get_state()["yaw"] - start_yaw) >= 350
+    assert sum(1 for msg, args in pipe.sent if msg == "take_picture") > 10
+    assert adcs_controller.current_reaction_wheel.get_loop_statistics()["ticks"] > 10
+    assert time.monotonic() - start < 5
+
+def test_pareto_front():
+    objectives = np.array([[1, 5], [2, 2], [3, 3], [5, 1], [1, 6]])
+    assert list(pareto_front(objectives)) == [0, 1, 3]
+
+def test_tuner_scores_gain_sets_and_returns_pareto_set():
+    results = simulate_gains([0.0, 1.6], [0.0, 0.02], [0.0, 0.1], duration=10)
+    # Zero gains never move the wheel, the default gains settle on the setpoint
+    assert np.isinf(results["settling_time"][0]) and results["effort"][0] == 0
+    assert np.isfinite(results["settling_time"][1]) and abs(results["final_error"][1]) < 2
+
+    result = tune(samples=200, seed=1, duration=10)
+    assert result["samples"] == 201
+    assert result["recommended"] in result["candidates"]
+    settling_times = [candidate["settling_time"] for candidate in result["candidates"]]
+    assert settling_times == sorted(settling_times)
+
+class FailingTunerController:
+    """AdcsController stand-in whose gain tuner fails"""
+    def __init__(self, log_queue, timeline=None):
+        self.timeline = StartupTimeline("ADCS")
+
+    def get_state(self):
+        return "READY"
+
+    def tune_reaction_wheel(self, samples=2000, seed=None):
+        raise ValueError("samples must be positive")
+
+class ScriptedPipe:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.replies = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        return self.messages.pop(0)
+
+    def reply(self, value):
+        self.replies.append(value)
+
+def test_failed_tuning_is_answered_with_an_error(monkeypatch):
+    monkeypatch.setattr(ADCS.adcs_controller, "AdcsController", FailingTunerController)
+    pipe = ScriptedPipe([("tune_wheel", {"samples": 0}), ("get_state", {}), ("stop", {})])
+    log_queue = queue.Queue()
+    ADCS.start(pipe, log_queue)
+
+    # ADCS keeps answering after the tuner failed
+    assert pipe.replies == [{"error": "samples must be positive"}, "READY"]
+    assert ("ADCS", "Error: Reaction wheel tuning failed: samples must be positive") in list(log_queue.queue)
+
+def test_attitude_estimator_learns_gyro_bias_and_unwraps_yaw():
+    clock = FakeClock()
+    plant = SatellitePlant(clock, damping=0.0)
+    imu = SimulatedImu(plant, gyro_bias=2.0, seed=0)
+    sun_sensors = [SimulatedSunSensor(i, plant, read_time=0.0) for i in range(3)]
+    estimator = AttitudeEstimator(imu, sun_sensors, clock=clock)
+
+    for _ in range(500):
+        clock.sleep(0.02)
+        estimator.update()
+    estimate = estimator.get_estimate()
+    assert abs(estimate["gyro_bias"] - 2.0) < 0.3
+    assert abs(estimate["yaw_rate"]) < 0.3
+    assert estimate["yaw_variance"] < 1.0
+
+    # First sun fix anchors the sun azimuth, later fixes correct the estimate
+    assert not estimator.update_sun()
+    assert estimator.update_sun()
+
+    # Spin at 90 deg/s: the IMU wraps yaw, the estimate keeps counting and extrapolates between samples
+    plant.angular_velocity = 90.0
+    for _ in range(300):
+        clock.sleep(0.02)
+        estimator.update()
+    assert abs(estimator.get_current_yaw() - plant.get_state()["yaw"]) < 3
+    clock.now += 0.01
+    assert abs(estimator.get_current_yaw() - plant.get_state()["yaw"]) < 3
+
+def test_failed_sun_fixes_are_reported_to_the_log_queue():
+    clock = FakeClock()
+    plant = SatellitePlant(clock)
+    log_queue = queue.Queue()
+    estimator = AttitudeEstimator(SimulatedImu(plant), [SimulatedSunSensor(0, plant)], clock=clock, log_queue=log_queue)
+    outcomes = [OSError("I2C read failed")] * 3 + [True, OSError("I2C read failed")]
+
+    def update_sun():
+        outcome = outcomes.pop(0)
+        if not outcomes:
+            estimator.stop_event.set()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    estimator.update_sun = update_sun
+    estimator._run_sun()
+
+    # Reported once for the run of failures, again after a fix succeeded
+    assert estimator.sun_failures == 4
+    assert list(log_queue.queue) == [("ADCS", "Error: Sun fix failed: I2C read failed")] * 2
+
+def test_sun_calibration_binning_and_circular_offset():
+    recorder = SunCalibrationRecorder(capacity=8)
+    rng = np.random.default_rng(0)
+    # Peak at 358.3°, wrapping through 0°
+    for yaw in rng.uniform(0, 720, 5000):
+        recorder.add(yaw, 20 + 1000 * max(0.0, np.cos(np.radians(yaw - 358.3))))
+
+    binned = recorder.bin()
+    assert recorder.count == 5000
+    assert binned.shape == (360,) and binned.min() >= 20
+    offset = fit_offset(binned)
+    assert min(abs(offset - 358.3), 360 - abs(offset - 358.3)) < 1.0
+    assert fit_offset(np.zeros(360)) is None
+
+def test_orientation_calibration_is_cached_for_warm_start(tmp_path):
+    cache_path = str(tmp_path / "calibration.json")
+    simulator = Simulator(speedup=500)
+    adcs_controller = AdcsController(queue.Queue(), simulator=simulator, calibration_cache_path=cache_path)
+    offset = adcs_controller.imu.calibration_offset
+    esp_boot_time = get_esp_boot_time(adcs_controller.imu, simulator.clock)
+    adcs_controller.attitude.stop()
+
+    # Only the Pi side restarted, the ESP kept running
+    log_queue = queue.Queue()
+    simulator = Simulator(speedup=500, esp_boot_time=esp_boot_time)
+    start = simulator.clock.monotonic()
+    warm_controller = AdcsController(log_queue, simulator=simulator, calibration_cache_path=cache_path)
+    warm_controller.attitude.stop()
+
+    assert warm_controller.imu.calibration_offset == offset
+    assert simulator.clock.monotonic() - start < 5  # No 40 s calibration rotation
+    assert any("LOADED from cache" in msg for _, msg in log_queue.queue)
+
+    # The ESP rebooted, or its boot time cannot be known on the JSON link: the full calibration runs again
+    for simulator in (Simulator(speedup=500, esp_boot_time=esp_boot_time + 60), Simulator(speedup=500, esp_boot_time=esp_boot_time, binary=False)):
+        log_queue = queue.Queue()
+        cold_controller = AdcsController(log_queue, simulator=simulator, calibration_cache_path=cache_path)
+        cold_controller.attitude.stop()
+        assert not any("LOADED from cache" in msg for _, msg in log_queue.queue)
+        assert any("CALIBRATION COMPLETE" in msg for _, msg in log_queue.queue)
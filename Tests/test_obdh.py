@@ -1,8 +1,22 @@
 import logging
+import multiprocessing as mp
 import sys
 import pytest
+import threading
+import time
+from types import SimpleNamespace
 from unittest import mock
+from enums import OBDHState
 from OBDH.logger import Logger  # Replace with actual import path
+from OBDH.main import OBDH
+import OBDH.process_manager as process_manager
+from OBDH.process_manager import ProcessManager
+from OBDH.telemetry import Telemetry
+from OBDH.ttc_handler import TTCHandler
+from timeline import StartupTimeline, format_timeline
+from rpc import RpcChannel, RpcEndpoint
+from frame_ring import FrameRing
+import numpy as np
 
 # Mock TTCHandler from OBDH.ttc_handler
 @pytest.fixture(autouse=True)
@@ -50,4 +64,258 @@ def test_set_ttc_handler(mock_ttc_handler):
     mock_ttc_handler.assert_called_once_with(dummy_pipe)
 
     # Assert that the TTCHandler was added to the logger
-    assert any(isinstance(h, mock.MagicMock) for h in logger_instance.get_logger().handlers)
\ No newline at end of file
+    assert any(isinstance(h, mock.MagicMock) for h in logger_instance.get_logger().handlers)
+
+def test_startup_timeline():
+    class FakeClock:
+        now = 10.0
+        def monotonic(self):
+            return self.now
+
+    clock = FakeClock()
+    timeline = StartupTimeline("ADCS", clock=clock)
+    clock.now = 10.5
+    timeline.mark("import")
+    clock.now = 12.5
+    assert timeline.mark("hardware") == 2.0
+
+    result = timeline.to_dict()
+    assert result["stages"] == [("import", 0.5), ("hardware", 2.0)]
+    assert result["total"] == 2.5
+    assert format_timeline(result, spawned=9.75) == "ADCS ready after 2.75 s (spawn 0.25 s, import 0.50 s, hardware 2.00 s)"
+
+class StubSubsystem:
+    """Subsystem module that reports ready and runs until stopped, or exits during start-up without a word"""
+    def __init__(self, ready=True):
+        self.ready = ready
+
+    def start(self, pipe, log_queue, timeline=None):
+        if not self.ready:
+            return
+        pipe.send(("ready", {"ready": True, "timeline": timeline.to_dict()}))
+        while pipe.recv()[0] != "stop":
+            pass
+
+def test_degraded_start_continues_without_a_subsystem_that_exits(monkeypatch, tmp_path, caplog):
+    monkeypatch.chdir(tmp_path)
+    subsystems = {"TTC": StubSubsystem(), "ADCS": StubSubsystem(ready=False), "Payload": StubSubsystem()}
+    # The subsystem processes are forked, so they import the stubs instead of the real packages
+    monkeypatch.setattr(process_manager, "importlib", SimpleNamespace(import_module=subsystems.__getitem__))
+    monkeypatch.setattr(Logger, "set_ttc_handler", lambda self, pipe: None)
+
+    started = time.monotonic()
+    obdh = OBDH(required_subsystems=["TTC"], startup_timeout=10)
+    try:
+        # The subsystem that exited does not hold up the start until the timeout
+        assert time.monotonic() - started < 10
+        assert obdh.state == OBDHState.READY
+        assert obdh.manager.is_ready("TTC") and obdh.manager.is_ready("Payload")
+        assert not obdh.manager.is_ready("ADCS")
+        assert "ADCS failed to start, continuing without it." in caplog.text
+        assert "still starting: ADCS" in caplog.text
+    finally:
+        obdh.manager.shutdown()
+
+def test_rpc_correlates_replies_and_routes_events():
+    obdh_end, subsystem_end = mp.Pipe()
+    channel = RpcChannel("ADCS", obdh_end, logging.getLogger("test"))
+    endpoint = RpcEndpoint(subsystem_end)
+
+    pictures = []
+    channel.subscribe("take_picture", pictures.append)
+    slow = channel.call("health_check")
+    fast = channel.call("get_state")
+    lost = channel.call("tune_wheel", timeout=0.05)
+
+    requests = [endpoint.recv() + (endpoint.request_id,) for _ in range(3)]
+    assert [msg for msg, _, _ in requests] == ["health_check", "get_state", "tune_wheel"]
+
+    # Replies out of order, with events in between
+    endpoint.send(("take_picture", {"current_yaw": 90}))
+    endpoint.reply("READY", requests[1][2])
+    endpoint.send(("target_lost", {}))
+    endpoint.reply("STATUS: OK", requests[0][2])
+    assert fast.result(timeout=1) == "READY"
+    assert slow.result(timeout=1) == "STATUS: OK"
+    with pytest.raises(TimeoutError):
+        lost.result(timeout=1)
+    endpoint.reply("late", requests[2][2])  # Dropped, the call already timed out
+
+    assert channel.receive(timeout=1) == ("target_lost", {})
+    assert pictures == [{"current_yaw": 90}]
+
+    statistics = channel.get_statistics()
+    assert statistics["get_state"]["answered"] == 1
+    assert statistics["tune_wheel"]["timeouts"] == 1
+
+    endpoint.close()
+    assert channel.closed.wait(1)
+    assert channel.receive(timeout=1) is None
+
+def make_process_manager(names):
+    """ProcessManager (without the log listener) over a pipe per subsystem, with the subsystem ends"""
+    manager = ProcessManager.__new__(ProcessManager)
+    manager.logger = logging.getLogger("test")
+    manager._inbox_changed = threading.Condition()
+    manager.pipes, endpoints = {}, {}
+    for name in names:
+        obdh_end, subsystem_end = mp.Pipe()
+        manager.pipes[name] = RpcChannel(name, obdh_end, manager.logger, on_message=manager._notify_inbox_changed)
+        endpoints[name] = RpcEndpoint(subsystem_end)
+    return manager, endpoints
+
+def test_wait_blocks_until_a_subsystem_has_a_message():
+    manager, endpoints = make_process_manager(["ADCS", "Payload"])
+    started = time.monotonic()
+    assert manager.wait(timeout=0.1) == []
+    assert time.monotonic() - started >= 0.1
+
+    # Woken by a message on any of the pipes, not by the timeout
+    threading.Timer(0.1, endpoints["Payload"].send, (("target_found", {"last_speed": 10}),)).start()
+    started = time.monotonic()
+    assert manager.wait(timeout=5) == ["Payload"]
+    assert time.monotonic() - started < 2
+    assert manager.receive("Payload", timeout=1)["command"] == "target_found"
+    assert manager.wait(timeout=0.05) == []
+
+    # And by a pipe closing
+    threading.Timer(0.1, endpoints["ADCS"].close).start()
+    started = time.monotonic()
+    assert manager.wait(["ADCS"], timeout=5) == ["ADCS"]
+    assert time.monotonic() - started < 2
+    assert manager.pipes["ADCS"].closed.is_set()
+
+def test_none_reply_is_not_mistaken_for_a_closed_pipe():
+    obdh_end, subsystem_end = mp.Pipe()
+    channel = RpcChannel("ADCS", obdh_end, logging.getLogger("test"))
+    endpoint = RpcEndpoint(subsystem_end)
+    manager = ProcessManager.__new__(ProcessManager)  # Without starting the log listener
+    manager.logger = logging.getLogger("test")
+    manager.pipes = {"ADCS": channel}
+
+    # test_wheel is sent with notify and answered with None, then an event arrives
+    channel.notify("test_wheel", {"kp": 1})
+    endpoint.recv()
+    endpoint.reply(None)
+    endpoint.send(("target_found", {"last_speed": 10}))
+    assert channel.receive(timeout=1, default="nothing") is None
+    endpoint.reply(None)
+    assert manager.receive_event("ADCS", timeout=1) == {"response": ("target_found", {"last_speed": 10}), "command": "target_found", "arguments": {"last_speed": 10}}
+    assert manager.receive_event("ADCS", timeout=0.05) is None
+
+    endpoint.close()
+    assert channel.closed.wait(1)
+    assert manager.receive("ADCS", timeout=1) is None
+    with pytest.raises(ConnectionError):
+        manager.receive_event("ADCS", timeout=1)
+
+class ScriptedManager:
+    """ProcessManager stand-in handing out TT&C commands in turn, with a reply (or an exception to raise) per request"""
+    def __init__(self, commands, replies):
+        self.commands = list(commands)
+        self.replies = replies
+        self.requests = []
+
+    def receive_event(self, name, timeout=None):
+        if not self.commands:
+            raise EOFError  # Ends handle_input once the script is done
+        command, arguments = self.commands.pop(0)
+        return {"response": (command, arguments), "command": command, "arguments": arguments}
+
+    def request(self, name, msg, args=None, timeout=None):
+        self.requests.append((name, msg, timeout))
+        reply = self.replies[msg]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def is_ready(self, name):
+        return True
+
+def test_command_loop_survives_a_request_that_fails(caplog):
+    obdh = OBDH.__new__(OBDH)  # Without starting the subsystems
+    obdh.state, obdh.logger = OBDHState.READY, logging.getLogger("test")
+    obdh.manager = ScriptedManager([("payload_get_numbers", {}), ("payload_take_distance", {}), ("payload_get_state", {})], {
+        "get_numbers": TimeoutError("Payload did not answer get_numbers within 60 s"),
+        "take_distance": ConnectionError("Payload is not running"),
+        "get_state": "READY"
+    })
+    with caplog.at_level(logging.INFO), pytest.raises(EOFError):
+        obdh.handle_input()
+
+    assert [msg for _, msg, _ in obdh.manager.requests] == ["get_numbers", "take_distance", "get_state"]
+    assert all(timeout is not None for _, _, timeout in obdh.manager.requests)
+    assert "(payload_get_numbers) failed: Payload did not answer get_numbers within 60 s" in caplog.text
+    assert "(payload_take_distance) failed: Payload is not running" in caplog.text
+    assert "(payload_get_state) state: READY" in caplog.text
+    assert obdh.state == OBDHState.READY
+
+def test_failed_wheel_tuning_is_reported(caplog):
+    obdh = OBDH.__new__(OBDH)
+    obdh.state, obdh.logger = OBDHState.READY, logging.getLogger("test")
+    obdh.manager = ScriptedManager([("tune_wheel", {"samples": 0})], {"tune_wheel": {"error": "samples must be positive"}})
+    with pytest.raises(EOFError):
+        obdh.handle_input()
+    assert "(tune_wheel) tuning failed: samples must be positive" in caplog.text
+
+def test_telemetry_skips_a_sample_adcs_does_not_answer():
+    manager = ScriptedManager([], {"health_check": TimeoutError("ADCS did not answer health_check within 10 s")})
+    manager.logger = logging.getLogger("test")
+    telemetry = Telemetry(manager)
+    assert telemetry.collect_telemetry() is None
+
+    manager.replies["health_check"] = "Gyroscope: OK\nBattery: 80 %\n"
+    assert telemetry.collect_telemetry() == "Gyroscope: OK\n"
+
+def test_frame_ring_reads_published_frames():
+    ring = FrameRing.create(f"test_frames_{mp.current_process().pid}", slots=2, slot_bytes=64 * 48 * 3)
+    reader = FrameRing.attach(ring.memory.name)
+    try:
+        assert reader.read() is None
+
+        first = ring.write(np.full((48, 64, 3), 1, np.uint8), timestamp=1.5, yaw=90.0, camera=0)
+        frame, metadata = reader.read(copy=False)
+        assert frame.shape == (48, 64, 3) and frame[0, 0, 0] == 1
+        assert metadata == {"sequence": first, "timestamp": 1.5, "yaw": 90.0, "camera": 0}
+
+        ring.write(np.full((48, 64), 2, np.uint8), timestamp=2.0)
+        gray, gray_metadata = reader.read()
+        assert gray.shape == (48, 64) and gray_metadata["yaw"] is None
+        assert reader.is_valid(metadata)
+
+        # Two slots, so the third frame overwrites the first one
+        ring.write(np.full((48, 64, 3), 3, np.uint8), timestamp=2.5)
+        assert not reader.is_valid(metadata)
+        assert reader.read(first) is None
+        del frame, gray
+
+        with pytest.raises(ValueError):
+            ring.write(np.zeros((100, 100, 3), np.uint8), timestamp=3.0)
+    finally:
+        reader.close()
+        ring.close()
+
+def test_ttc_handler_batches_and_rate_limits():
+    sent = []
+    pipe = mock.Mock(send=sent.append)
+    handler = TTCHandler(pipe, flush_interval=60, max_records=50, rate=0.001, burst=20)
+    logger = logging.getLogger("test_ttc_handler")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        for i in range(200):
+            logger.info(f"Record {i}")
+        logger.warning("Disk almost full")
+        handler.flush()
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    # One message per batch, the burst gets through, the rest is counted, warnings always go through
+    assert all(command == "log" for command, _ in sent)
+    messages = [line for _, args in sent for line in args["messages"]]
+    assert len(sent) == 1 and len(messages) == 21
+    assert messages[-1] == "Disk almost full"
+    assert sum(args["dropped"] for _, args in sent) == 180
+    assert handler.statistics == {"forwarded": 21, "dropped": 180, "batches": 1}
@@ -0,0 +1,485 @@
+import os
+import queue
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import pytest
+import threading
+import Payload.camera
+from Payload.camera import Camera, FrameGrabber
+import Payload.number_identifier as number_identifier
+from Payload.number_identifier import (FOV, NumberIdentificationEngine, NumberPipeline, TemplateRecogniser, find_number_rois,
+                                       get_numbers, get_recogniser, identify_numbers_from_files, identify_numbers_in_image,
+                                       render_target_image)
+from Payload.ocr_cache import OcrCache
+import Payload.payload_controller as payload_controller
+from Payload.payload_controller import PayloadController
+from Payload.stereo_camera import StereoCamera
+import Payload.tag_finder as tag_finder
+from Payload.tag_finder import DetectorService
+
+PANORAMA_TARGETS = {20: 47, 95: 63, 170: 28, 250: 81, 320: 35}  # deg: number
+LEFT_PARAMS = (1000.0, 1000.0, 960.0, 540.0)
+RIGHT_PARAMS = (1010.0, 1005.0, 950.0, 530.0)
+
+class StubStereoCamera:
+    """Stereo camera whose images come from each of sides in turn, with a lores stream at lores_scale of main"""
+    def __init__(self, shape=(1080, 1920, 3), sides=("left", "right"), lores_scale=0.5):
+        self.shape = shape
+        self.sides = sides
+        self.lores_scale = lores_scale
+        self.captures = 0
+
+    def _next_side(self):
+        self.captures += 1
+        return self.sides[(self.captures - 1) % len(self.sides)]
+
+    def get_available_image(self):
+        return np.full(self.shape, 128, np.uint8), self._next_side()
+
+    def get_available_gray_image(self, stream="lores"):
+        scale_x, scale_y = self.get_stream_scale(stream)
+        return np.full((round(self.shape[0] * scale_y), round(self.shape[1] * scale_x)), 128, np.uint8), self._next_side()
+
+    def get_camera_params(self, side, stream="main"):
+        fx, fy, cx, cy = LEFT_PARAMS if side == "left" else RIGHT_PARAMS
+        scale_x, scale_y = self.get_stream_scale(stream)
+        return (fx * scale_x, fy * scale_y, (cx + 0.5) * scale_x - 0.5, (cy + 0.5) * scale_y - 0.5)
+
+    def get_stream_scale(self, stream="main"):
+        return (1.0, 1.0) if stream == "main" else (self.lores_scale, self.lores_scale)
+
+class FakeTagDetector:
+    """Records what it is asked to search and reports one tag in the middle of it"""
+    def __init__(self):
+        self.calls = []
+
+    def locate(self, gray, camera_params):
+        """Center (x, y) and half size of the tag in the searched image"""
+        return gray.shape[1] / 2, gray.shape[0] / 2, 50.0
+
+    def detect(self, gray, estimate_tag_pose, camera_params, tag_size):
+        self.calls.append((gray, camera_params, tag_size))
+        x, y, half = self.locate(gray, camera_params)
+        corners = [(x - half, y + half), (x + half, y + half), (x + half, y - half), (x - half, y - half)]
+        return [SimpleNamespace(pose_R=np.eye(3), pose_t=np.array([[0.1], [0.0], [0.5]]), tag_family=b"tag25h9", tag_id=3,
+                                center=np.array([x, y]), corners=np.array(corners))]
+
+class TrackedTagDetector(FakeTagDetector):
+    """Reports one tag at a fixed full frame position, mapped into whatever region and decimation it is asked to search"""
+    def __init__(self, center, size, params=LEFT_PARAMS):
+        super().__init__()
+        self.center, self.size, self.params = center, size, params
+
+    def locate(self, gray, camera_params):
+        decimate = self.params[0] / camera_params[0]
+        x0, y0 = self.params[2] - camera_params[2] * decimate, self.params[3] - camera_params[3] * decimate
+        return (self.center[0] - x0) / decimate, (self.center[1] - y0) / decimate, self.size / decimate / 2
+
+def test_detector_service_builds_its_detector_once(monkeypatch):
+    built = []
+    def build_detector(**kwargs):
+        built.append(FakeTagDetector())
+        return built[-1]
+    monkeypatch.setattr(tag_finder.dt_april, "Detector", build_detector)
+    camera = StubStereoCamera()
+    service = DetectorService(0.05, camera, tracking=False)
+
+    poses = [service.detect() for _ in range(3)]
+    assert len(built) == 1
+    assert camera.captures == 3  # One frame per detection
+    calls = built[0].calls
+    # The grayscale buffer is reused, and each frame is detected with the calibration of the camera that took it
+    assert all(gray is calls[0][0] for gray, _, _ in calls)
+    assert [params for _, params, _ in calls] == [LEFT_PARAMS, RIGHT_PARAMS, LEFT_PARAMS]
+    assert all(tag_size == 0.05 for _, _, tag_size in calls)
+
+    assert poses[0][0]["translation"] == (100.0, 0.0, 500.0)
+    assert poses[0][0]["tag_family"] == "tag25h9" and poses[0][0]["tag_id"] == 3
+    assert service.detections == 3
+    timings = service.get_timings()
+    assert set(timings) == set(DetectorService.STAGES)
+    assert all(0 <= timings[stage]["last"] <= timings[stage]["max"] for stage in DetectorService.STAGES)
+
+def test_detector_roi_is_clamped_to_the_frame():
+    service = DetectorService(0.05, StubStereoCamera())
+    service.track = {"center": (10.0, 500.0), "size": 60.0, "velocity": 0.0, "time": 10.0}
+    assert service._predict_roi((1080, 1920, 3), LEFT_PARAMS, 10.1) == ((0, 380, 130, 620), 1)
+
+def test_detector_searches_the_full_frame_without_a_cheaper_roi():
+    service = DetectorService(0.05, StubStereoCamera())
+    # A close tag whose ROI would cover more than half the frame
+    service.track = {"center": (960.0, 540.0), "size": 400.0, "velocity": 0.0, "time": 10.0}
+    assert service._predict_roi((1080, 1920, 3), LEFT_PARAMS, 10.1) is None
+    # A track older than track_timeout
+    service.track = {"center": (960.0, 540.0), "size": 60.0, "velocity": 0.0, "time": 10.0}
+    assert service._predict_roi((1080, 1920, 3), LEFT_PARAMS, 10.0 + service.track_timeout + 0.1) is None
+
+def test_detector_maps_decimated_roi_detections_to_the_full_frame():
+    service = DetectorService(0.05, StubStereoCamera(sides=("left",)))
+    service.dt_detector = TrackedTagDetector(center=(1000.0, 600.0), size=240.0)
+
+    for _ in range(2):
+        poses = service.detect()
+        assert len(poses) == 1
+        assert poses[0]["center"] == pytest.approx((1000.0, 600.0))
+        assert poses[0]["size"] == pytest.approx(240.0)
+
+    # Full frame first, then the 960 px region around the track, decimated so the tag keeps about min_tag_pixels
+    (full, full_params, _), (roi, roi_params, _) = service.dt_detector.calls
+    assert full.shape == (1080, 1920) and full_params == LEFT_PARAMS
+    assert roi.shape == (240, 240) and roi_params == (250.0, 250.0, 110.0, 105.0)
+    assert service.roi_detections == 1
+    assert service.full_frame_searches == 1
+
+def test_detector_maps_lores_detections_to_main_stream_pixels():
+    camera = StubStereoCamera(sides=("left",))
+    service = DetectorService(0.05, camera, stream="lores")
+    # A 240 px tag at (1000, 600) in the main stream is a 120 px tag at (500, 300) in lores
+    lores_params = camera.get_camera_params("left", "lores")
+    service.dt_detector = TrackedTagDetector(center=(500.0, 300.0), size=120.0, params=lores_params)
+
+    for _ in range(2):
+        poses = service.detect()
+        assert len(poses) == 1
+        assert poses[0]["center"] == pytest.approx((1000.0, 600.0))
+        assert poses[0]["size"] == pytest.approx(240.0)
+
+    # The track is kept in main stream pixels and scaled to lores for the ROI and its decimation
+    (full, full_params, _), (roi, roi_params, _) = service.dt_detector.calls
+    assert full.shape == (540, 960) and full_params == lores_params
+    assert roi.shape == (240, 240)
+    assert roi_params == pytest.approx((250.0, 250.0, (lores_params[2] - 260) / 2, (lores_params[3] - 60) / 2))
+
+class FakeRequest:
+    def __init__(self, picam2, arrays, timestamp):
+        self.picam2, self.arrays, self.timestamp = picam2, arrays, timestamp
+
+    def get_metadata(self):
+        return {"SensorTimestamp": int(self.timestamp * 1e9)}
+
+    def release(self):
+        self.picam2.released += 1
+
+class FakeMappedArray:
+    def __init__(self, request, stream):
+        self.array = request.arrays[stream]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class FakePicamera2:
+    """
+    Free running camera whose frame n (from 1) is filled with n % 256 and, through capture_request, starts at
+    start + offset + n * period (s). Lores frames are YUV420 with a padded stride: the Y plane is n % 256, the U and
+    V rows below it 255 - n % 256 and the padding 0.
+    """
+    def __init__(self, main_size=(64, 48), lores_size=(32, 24), lores_stride=40, period=0.01, offset=0.0, start=None):
+        self.main_size, self.lores_size, self.lores_stride = main_size, lores_size, lores_stride
+        self.period, self.offset = period, offset
+        self.start = time.monotonic() if start is None else start
+        self.frames = 0
+        self.released = 0
+
+    def make_arrays(self, value):
+        (width, height), (lores_width, lores_height) = self.main_size, self.lores_size
+        lores = np.zeros((lores_height * 3 // 2, self.lores_stride), np.uint8)
+        lores[:lores_height, :lores_width] = value
+        lores[lores_height:, :lores_width] = 255 - value
+        return {"main": np.full((height, width, 3), value, np.uint8), "lores": lores}
+
+    def capture_array(self, stream="main"):
+        self.frames += 1
+        self.last_array = self.make_arrays(self.frames % 256)[stream]
+        return self.last_array
+
+    def capture_request(self):
+        self.frames += 1
+        timestamp = self.start + self.offset + self.frames * self.period
+        time.sleep(max(0.0, timestamp - time.monotonic()))
+        return FakeRequest(self, self.make_arrays(self.frames % 256), timestamp)
+
+    def stop(self):
+        pass
+
+def make_camera(picam2, index=0):
+    """Camera over a fake picam2, without the hardware initialisation"""
+    camera = Camera.__new__(Camera)
+    camera.camera_index, camera.is_initialized, camera.picam2 = index, True, picam2
+    camera.framerate, camera.grabber = round(1 / picam2.period), None
+    camera.sizes = {"main": picam2.main_size, "lores": picam2.lores_size}
+    camera.camera_params = None
+    return camera
+
+def test_lores_gray_frame_is_a_view_of_the_y_plane():
+    picam2 = FakePicamera2()
+    camera = make_camera(picam2)
+
+    gray = camera.get_gray_frame("lores")
+    assert gray.shape == (24, 32) and (gray == 1).all()
+    assert np.shares_memory(gray, picam2.last_array)  # No copy
+
+    gray = camera.get_gray_frame("main")
+    assert gray.shape == (48, 64)
+    assert (gray == cv2.cvtColor(picam2.last_array, cv2.COLOR_BGR2GRAY)).all()
+
+def test_camera_params_are_scaled_to_the_stream():
+    camera = make_camera(FakePicamera2(main_size=(1920, 1080), lores_size=(640, 480)))
+    assert camera.get_camera_params("lores") is None  # Not calibrated
+    camera.camera_params = (1000.0, 1000.0, 959.5, 539.5)
+    assert camera.get_stream_scale("lores") == pytest.approx((1 / 3, 4 / 9))
+    assert camera.get_camera_params("main") == pytest.approx(camera.camera_params)
+    # The principal point stays at the same pixel center
+    assert camera.get_camera_params("lores") == pytest.approx((1000.0 / 3, 4000.0 / 9, 319.5, 239.5))
+
+def test_frame_grabber_double_buffer_and_sequence(monkeypatch):
+    monkeypatch.setattr(Payload.camera, "MappedArray", FakeMappedArray)
+    picam2 = FakePicamera2()
+    grabber = FrameGrabber(picam2, streams=("main",))
+    assert grabber.get_latest("main", timeout=0.05) is None  # Not started
+    grabber.start()
+    try:
+        frame, timestamp, sequence = grabber.get_latest("main", timeout=1.0)
+        assert sequence >= 1 and (frame == sequence).all()
+
+        newer, newer_timestamp, newer_sequence = grabber.get_latest("main", newer_than=sequence, timeout=1.0)
+        assert newer_sequence > sequence and newer_timestamp > timestamp
+        assert (newer == newer_sequence).all()
+        assert (frame == sequence).all()  # A returned frame is a copy, later captures do not touch it
+        assert newer_timestamp == pytest.approx(picam2.start + newer_sequence * picam2.period)
+        assert grabber._front["main"] is not grabber._back["main"]
+
+        assert grabber.get_latest("main", newer_than=newer_sequence + 1000, timeout=0.05) is None
+        with pytest.raises(ValueError):
+            grabber.get_latest("lores")
+    finally:
+        grabber.stop()
+    assert picam2.released == picam2.frames
+    assert grabber.errors == 0
+
+def test_grabbed_lores_gray_frame_is_a_copy_of_the_y_plane(monkeypatch):
+    monkeypatch.setattr(Payload.camera, "MappedArray", FakeMappedArray)
+    camera = make_camera(FakePicamera2())
+    assert camera.start_grabbing()
+    try:
+        gray, _, sequence = camera.get_latest("lores", gray=True)
+        assert gray.shape == (24, 32) and (gray == sequence).all()
+        assert not np.shares_memory(gray, camera.grabber._front["lores"])
+        assert camera.get_gray_frame("lores").shape == (24, 32)
+    finally:
+        camera.stop_grabbing()
+
+def make_stereo_camera(left_picam2, right_picam2):
+    stereo = object.__new__(StereoCamera)  # Not the singleton, without the hardware initialisation
+    stereo.left_camera, stereo.right_camera = make_camera(left_picam2, 0), make_camera(right_picam2, 1)
+    stereo.left_camera_available = stereo.right_camera_available = True
+    return stereo
+
+def test_synced_pair_is_within_max_skew(monkeypatch):
+    monkeypatch.setattr(Payload.camera, "MappedArray", FakeMappedArray)
+    start = time.monotonic()
+    # Free running at the same rate, the right camera 0.3 frame behind
+    left, right = FakePicamera2(period=1 / 30, start=start), FakePicamera2(period=1 / 30, offset=0.3 / 30, start=start)
+    stereo = make_stereo_camera(left, right)
+    stereo.left_camera.start_grabbing(("main",))
+    stereo.right_camera.start_grabbing(("main",))
+    try:
+        for _ in range(3):
+            left_image, right_image, left_timestamp, right_timestamp = stereo.get_synced_pair()
+            assert abs(left_timestamp - right_timestamp) <= 0.5 / 30
+            # Each image is the frame of its timestamp
+            assert (left_image == round((left_timestamp - start) * 30) % 256).all()
+            assert (right_image == round((right_timestamp - start - 0.01) * 30) % 256).all()
+
+        # Never closer than 0.3 frame (10 ms)
+        with pytest.raises(RuntimeError):
+            stereo.get_synced_pair(max_skew=0.002, timeout=0.3)
+    finally:
+        stereo.left_camera.stop_grabbing()
+        stereo.right_camera.stop_grabbing()
+
+class FakeNumberIdentification:
+    """identify_numbers_in_image finding number_at(yaw) in the middle of each picture, once release is set"""
+    def __init__(self, number_at):
+        self.number_at = number_at
+        self.release = threading.Event()
+        self.release.set()
+        self.grays = []
+
+    def __call__(self, gray, yaw, recogniser=None, cache_path=None, selector=None):
+        self.release.wait()
+        self.grays.append(gray)
+        return [(yaw, self.number_at(yaw), 0.0)]
+
+def test_number_pipeline_collects_the_numbers_of_submitted_pictures(monkeypatch):
+    identification = FakeNumberIdentification(lambda yaw: 10 + int(yaw) // 10)
+    monkeypatch.setattr(number_identifier, "identify_numbers_in_image", identification)
+    pipeline = NumberPipeline(workers=2)
+    for yaw in (0, 90, 180):
+        pipeline.submit(np.zeros((48, 64, 3), np.uint8), yaw)
+    assert pipeline.result(timeout=5) == {0: 10, 90: 19, 180: 28}
+    assert all(gray.shape == (48, 64) for gray in identification.grays)  # Only the grayscale version is queued
+    assert pipeline.get_statistics()["processed"] == 3
+
+    # A picture still being identified holds up result(), unless partial
+    identification.release.clear()
+    pipeline.submit(np.zeros((48, 64), np.uint8), 270)
+    assert pipeline.result(timeout=0.1) is None
+    assert pipeline.result(timeout=0.1, partial=True) == {0: 10, 90: 19, 180: 28}
+    identification.release.set()
+    assert pipeline.result(timeout=5) == {0: 10, 90: 19, 180: 28, 270: 37}
+
+def test_number_pipeline_writes_pictures_and_resets(monkeypatch, tmp_path):
+    identification = FakeNumberIdentification(lambda yaw: 47)
+    monkeypatch.setattr(number_identifier, "identify_numbers_in_image", identification)
+    pipeline = NumberPipeline(workers=1)
+    identification.release.clear()
+    path = tmp_path / "90_left.jpg"
+    pipeline.submit(np.full((48, 64, 3), 128, np.uint8), 90, path=str(path))
+    # Written on its own thread while the OCR is still blocked
+    pipeline.wait_written()
+    assert cv2.imread(str(path)).shape == (48, 64, 3)
+
+    # The picture submitted before the reset does not count for the new rotation
+    pipeline.reset()
+    identification.release.set()
+    pipeline.submit(np.zeros((48, 64, 3), np.uint8), 200)
+    assert pipeline.result(timeout=5) == {200: 47}
+    statistics = pipeline.get_statistics()
+    assert statistics["submitted"] == 1 and statistics["processed"] == 1
+    assert statistics["write_errors"] == 0
+
+def test_engine_matches_the_serial_path(tmp_path):
+    rng = np.random.default_rng(11)
+    pictures = [(render_target_image(numbers, rng), yaw) for numbers, yaw in (([12, 57, 93], 40), ([68, 24], 130), ([75], 250))]
+    folder = tmp_path / "images" / "phase2"
+    folder.mkdir(parents=True)
+    paths = []
+    for image, yaw in pictures:
+        paths.append(str(folder / f"{yaw}_left.jpg"))
+        cv2.imwrite(paths[-1], image)
+
+    engine = NumberIdentificationEngine(2, recogniser="template")
+    try:
+        for image, yaw in pictures:
+            located = engine.submit(image, yaw).result(timeout=60)
+            assert located
+            assert located == identify_numbers_in_image(image, yaw, recogniser="template")
+        numbers = engine.identify_files(paths)
+    finally:
+        engine.close()
+
+    assert numbers
+    assert numbers == identify_numbers_from_files(paths, recogniser="template")
+
+def test_template_recogniser_reads_the_target_numbers():
+    recogniser = TemplateRecogniser()
+    _, rois, _, _ = find_number_rois(render_target_image([47, 63, 28], np.random.default_rng(5)))
+    assert [recogniser.read(roi) for roi in rois] == ["47", "63", "28"]
+
+    # A blob that is no digit is rejected rather than read as the nearest one
+    blob = np.zeros((100, 140), np.uint8)
+    cv2.circle(blob, (70, 50), 40, 255, -1)
+    assert recogniser.read(blob) == ""
+
+def test_template_recogniser_learns_labelled_samples(tmp_path):
+    # A cross, far from every template digit
+    cross = np.zeros((120, 100), np.uint8)
+    cv2.line(cross, (10, 10), (90, 110), 255, 12)
+    cv2.line(cross, (90, 10), (10, 110), 255, 12)
+    recogniser = TemplateRecogniser()
+    assert recogniser.read(cross) == ""
+
+    samples_path = str(tmp_path / "samples.npz")
+    assert recogniser.fit([cross] * 3 + [np.zeros((10, 10), np.uint8)], ["4"] * 3 + ["5"], samples_path=samples_path) == 3
+    assert recogniser.read(cross) == "4"
+    # And the next runs load the saved samples
+    assert TemplateRecogniser(samples_path=samples_path).read(cross) == "4"
+
+def test_ocr_cache_evicts_the_least_recently_read_entry(tmp_path):
+    cache = OcrCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    keys = [OcrCache.key("roi", f"content {i}", "template:1") for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, str(i))
+        time.sleep(0.01)
+    assert cache.get(keys[0]) == "0"  # Now read more recently than the other two
+    time.sleep(0.01)
+
+    cache.put(keys[3], "3")
+    assert len(cache) == 3
+    assert cache.get(keys[1]) is None
+    assert [cache.get(key) for key in (keys[0], keys[2], keys[3])] == ["0", "2", "3"]
+
+    # Same content read by another recogniser
+    assert cache.get(OcrCache.key("roi", "content 0", "tesseract:5")) is None
+
+def test_get_numbers_answers_a_repeat_from_the_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "40_left.jpg")
+    cv2.imwrite(path, render_target_image([36, 82], np.random.default_rng(5)))
+    cache_path = str(tmp_path / "cache.sqlite3")
+    numbers, width = get_numbers(path, recogniser="template", cache_path=cache_path)
+    assert numbers
+
+    def read(roi):
+        raise AssertionError("The recogniser should not be called for a cached picture")
+    monkeypatch.setattr(get_recogniser("template"), "read", read)
+    assert get_numbers(path, recogniser="template", cache_path=cache_path) == (numbers, width)
+
+def test_serial_fallback_answers_a_repeat_from_the_picture_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(payload_controller, "OCR_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(payload_controller, "NUMBERS_RECOGNISER", "template")
+    os.makedirs("images/phase2")
+    rng = np.random.default_rng(3)
+    for numbers, yaw in (([36, 82], 40), ([57], 130)):
+        cv2.imwrite(f"images/phase2/{yaw}_left.jpg", render_target_image(numbers, rng))
+    controller = PayloadController.__new__(PayloadController)  # Without the cameras and the engine
+    controller.number_engine, controller.log_queue = None, queue.Queue()
+    numbers = controller.identify_numbers_from_files()
+    assert numbers
+
+    def preprocess_image(img):
+        raise AssertionError("A cached picture should not be processed again")
+    monkeypatch.setattr(number_identifier, "preprocess_image", preprocess_image)
+    assert controller.identify_numbers_from_files() == numbers
+
+def render_panorama_view(yaw, rng, width=1920, height=1080):
+    """Picture taken at yaw (deg) of a ring of numbered cards, each in view at about seven 10 deg steps"""
+    image = np.full((height, width, 3), 60, np.uint8)
+    for angle, number in PANORAMA_TARGETS.items():
+        x0 = int(width / 2 + ((angle - yaw + 180) % 360 - 180) * width / FOV) - 230
+        a, b = max(0, x0), min(width, x0 + 460)
+        if b > a:
+            card = np.full((420, 460, 3), 235, np.uint8)
+            cv2.putText(card, str(number), (40, 300), cv2.FONT_HERSHEY_DUPLEX, 6, (20, 20, 20), 24)
+            image[300:720, a:b] = card[:, a - x0:b - x0]
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    return np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_frame_selection_does_not_change_the_numbers_found(direction):
+    rng = np.random.default_rng(7)
+    pictures = []
+    for step in range(36):
+        yaw = (3 + direction * 10 * step) % 360
+        pictures.append((render_panorama_view(yaw, rng), yaw))
+        if step == 12:
+            # The other camera of the stereo pair, same view with its own noise
+            pictures.append((render_panorama_view(yaw, rng), yaw))
+
+    results = {}
+    for select_frames in (False, True):
+        pipeline = NumberPipeline(workers=2, recogniser="template", select_frames=select_frames)
+        for image, yaw in pictures:
+            pipeline.submit(image, yaw)
+        results[select_frames] = pipeline.result(timeout=120)
+        statistics = pipeline.get_statistics()["selection"]
+
+    assert sorted(results[False].values()) == sorted(PANORAMA_TARGETS.values())
+    assert results[True] == results[False]
+    assert statistics["duplicates"] == 1
+    assert statistics["skipped_candidates"] > 0
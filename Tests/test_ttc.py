@@ -1,6 +1,16 @@
 import asyncio
+import io
+import json
+import queue
+import zipfile
 import pytest
 import websockets
+from enums import DownlinkPriority
+from TTC.downlink_queue import DownlinkQueue
+from TTC.link import LinkMonitor, LEGACY_CODECS
+from TTC.main import TTC
+from TTC.transfer import FileReceiver, OutgoingTransfer
+from TTC.utils import archive_files, zip_stream
 
 # Example WebSocket server that echoes back any received message
 async def echo_server(websocket, path):
@@ -24,4 +34,269 @@ async def test_websocket_communication(websocket_server):
         await websocket.send(test_message)
 
         response = await websocket.recv()
-        assert response == f"Echo: {test_message}"
\ No newline at end of file
+        assert response == f"Echo: {test_message}"
+
+
+@pytest.mark.asyncio
+async def test_chunked_transfer_recovers_from_corruption_and_resumes():
+    data = bytes(range(256)) * 40
+    transfer = OutgoingTransfer("test.bin", data, chunk_size=100)
+    receiver = FileReceiver(ack_every=4)
+    receiver.handle_metadata(transfer.metadata())
+    received = []
+    sent = [0]
+
+    async def send(message):
+        sent[0] += 1
+        if sent[0] == 5:
+            message = message[:-1] + bytes([message[-1] ^ 0xFF])  # Corrupted on the way
+        if sent[0] == 30:
+            raise ConnectionError("link dropped")
+        replies, complete = receiver.handle_chunk(message)
+        if complete is not None:
+            received.append(complete)
+        for reply in replies:
+            kind, _, *sequence = reply.split(" ")
+            if kind == "ack":
+                transfer.acknowledge(int(sequence[0]))
+            elif kind == "nack":
+                transfer.rewind(int(sequence[0]))
+            else:
+                transfer.finish()
+
+    with pytest.raises(ConnectionError):
+        await transfer.run(send, window=8, ack_timeout=0.1)
+    assert receiver.corrupted == 1
+
+    # After reconnecting, Ground asks to carry on from the first chunk it is missing
+    (resume,) = receiver.resume_messages()
+    transfer.resume(int(resume.split(" ")[2]))
+    assert transfer.next > 0
+    assert await transfer.run(send, window=8, ack_timeout=0.1)
+    assert received == [("test.bin", data)]
+    assert transfer.sent < 2 * transfer.chunks
+
+@pytest.mark.asyncio
+async def test_streamed_archive_transfer_recovers_and_is_verified(tmp_path):
+    for name, content in (("numbers.txt", b"23 45 67\n" * 500), ("picture.jpg", bytes(range(256)) * 40)):
+        (tmp_path / name).write_bytes(content)
+    files = archive_files(str(tmp_path))
+    transfer = OutgoingTransfer("images.zip", chunk_size=100, stream=lambda: zip_stream(files, block_size=512))
+    receiver = FileReceiver(ack_every=4)
+    receiver.handle_metadata(transfer.metadata())
+    received = []
+    sent = [0]
+
+    def reply(replies, complete):
+        if complete is not None:
+            received.append(complete)
+        for message in replies:
+            kind, _, *sequence = message.split(" ")
+            if kind == "ack":
+                transfer.acknowledge(int(sequence[0]))
+            elif kind == "nack":
+                transfer.rewind(int(sequence[0]))
+            else:
+                transfer.finish()
+
+    async def send(message):
+        sent[0] += 1
+        if sent[0] == 5:
+            message = message[:-1] + bytes([message[-1] ^ 0xFF])  # Corrupted on the way
+        if sent[0] == 30:
+            raise ConnectionError("link dropped")
+        reply(*receiver.handle_chunk(message))
+
+    async def send_summary(summary):
+        reply(*receiver.handle_summary(summary))
+
+    with pytest.raises(ConnectionError):
+        await transfer.run(send, send_summary, window=8, ack_timeout=0.1)
+    assert receiver.corrupted == 1
+
+    # The size and digest of the stream are only known from the summary sent after the last chunk
+    (resume,) = receiver.resume_messages()
+    transfer.resume(int(resume.split(" ")[2]))
+    assert await transfer.run(send, send_summary, window=8, ack_timeout=0.1)
+    assert transfer.sent < 1.5 * transfer.chunks
+
+    (name, data), = received
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("numbers.txt") == (tmp_path / "numbers.txt").read_bytes()
+        assert archive.read("picture.jpg") == (tmp_path / "picture.jpg").read_bytes()
+        # Already compressed formats are stored as they are
+        assert archive.getinfo("picture.jpg").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("numbers.txt").compress_type == zipfile.ZIP_DEFLATED
+
+def test_link_monitor_adapts_chunk_size_and_codec(tmp_path):
+    (tmp_path / "telemetry.log").write_bytes(b"yaw 10.5 roll 0.1 pitch -0.2\n" * 5000)
+    (tmp_path / "picture.jpg").write_bytes(bytes(range(256)) * 40)
+    sample = (tmp_path / "telemetry.log").read_bytes()[:65536]
+    link = LinkMonitor(window=32)
+    assert link.chunk_size() == 1024  # Nothing measured yet
+
+    # Fast link: large chunks, nothing worth compressing hard
+    link.record_delivery(4e6, 0.05)
+    assert link.chunk_size() == 16384
+    assert link.choose_codec(str(tmp_path / "picture.jpg"), b"")[0] == "stored"
+    fast = link.choose_codec(str(tmp_path / "telemetry.log"), sample)
+
+    # Slow, lossy link: small chunks, compressed harder (without LZMA for the dashboard)
+    link = LinkMonitor(window=32)
+    link.record_delivery(2e4, 0.2)
+    for _ in range(100):
+        link.record_sent(True)
+    assert link.chunk_size() == 1024
+    slow = link.choose_codec(str(tmp_path / "telemetry.log"), sample, LEGACY_CODECS)
+    assert slow[0] in ("deflate-6", "deflate-9") and slow != fast
+
+@pytest.mark.asyncio
+async def test_chunk_size_follows_the_link_during_a_transfer():
+    # The Ground gets the file whatever the chunks
+    data = bytes(range(256)) * 1200
+    transfer = OutgoingTransfer("frame.zip", data, monitor=LinkMonitor())
+    receiver = FileReceiver(ack_every=4)
+    receiver.handle_metadata(transfer.metadata())
+    received = []
+
+    async def send(message):
+        replies, complete = receiver.handle_chunk(message)
+        for reply in replies:
+            if reply.startswith("ack"):
+                transfer.acknowledge(int(reply.split(" ")[2]))
+            else:
+                transfer.finish()
+        if complete is not None:
+            received.append(complete)
+
+    async def send_summary(summary):
+        replies, complete = receiver.handle_summary(summary)
+        transfer.finish()
+        received.append(complete)
+
+    assert await transfer.run(send, send_summary, ack_timeout=0.5)
+    assert len(transfer.chunk_sizes) > 1
+    assert received == [("frame.zip", data)]
+
+def test_downlink_queue_drains_by_priority_and_survives_restart(tmp_path):
+    queue = DownlinkQueue(str(tmp_path))
+    queue.put(DownlinkPriority.FILE, "file", "/home/vector/images/phase2")
+    queue.put(DownlinkPriority.LOG, "message", "log")
+    queue.put(DownlinkPriority.RESULT, "message", "phase 2 numbers")
+    queue.put(DownlinkPriority.REPLY, "message", "Starting phase 2...")
+    assert queue.backlog(DownlinkPriority.TELEMETRY) and queue.pending_bytes(DownlinkPriority.TELEMETRY) == 0
+
+    priority, record = queue.peek()
+    assert (priority, record["payload"]) == (DownlinkPriority.REPLY, "Starting phase 2...")
+    queue.pop(priority, record)
+    queue.flush()
+
+    # After a restart (with a record cut short by it), the rest is still there in order
+    with open(tmp_path / "log.jsonl", "ab") as journal:
+        journal.write(b'{"time": 1, "ki')
+    queue = DownlinkQueue(str(tmp_path))
+    sent = []
+    while (queued := queue.peek()) is not None:
+        sent.append(queued[1]["payload"])
+        queue.pop(*queued)
+    assert sent == ["phase 2 numbers", "log", "/home/vector/images/phase2"]
+    assert queue.pending_bytes() == 0
+
+    # Full, the least urgent records go first
+    queue = DownlinkQueue(str(tmp_path / "full"), max_bytes=2000)
+    for _ in range(20):
+        queue.put(DownlinkPriority.LOG, "message", "x" * 100)
+    queue.put(DownlinkPriority.RESULT, "message", "distances")
+    assert queue.pending_bytes() <= 2000
+    assert queue.evicted[DownlinkPriority.LOG] > 0 and queue.peek()[1]["payload"] == "distances"
+
+def make_ttc(queue_directory):
+    """TTC over the chunked protocol, without its WebSocket server"""
+    ttc = TTC.__new__(TTC)
+    ttc.log_queue = queue.Queue()
+    ttc.BUFFER_SIZE, ttc.MAX_RETRIES, ttc.MAX_TRANSFERS = 1024, 3, 8
+    ttc.transfer_protocol, ttc.transfers = 2, {}
+    ttc.link, ttc.link_queried = LinkMonitor(), True
+    ttc.downlink_queue, ttc.drain_task = DownlinkQueue(str(queue_directory)), None
+    ttc.connection = None
+    return ttc
+
+class FakeGround:
+    """Ground end of the connection, receiving chunked transfers and holding back its done until released"""
+    remote_address = ("127.0.0.1", 8000)
+
+    def __init__(self, ttc):
+        self.ttc = ttc
+        self.receiver = FileReceiver(ack_every=4)
+        self.received = []
+        self.held = []
+        self.holding = True
+
+    async def send(self, message):
+        if isinstance(message, bytes):
+            replies, complete = self.receiver.handle_chunk(message)
+        else:
+            message = json.loads(message)
+            if message["type"] == "filemetadata":
+                replies, complete = self.receiver.handle_metadata(message["data"]), None
+            else:
+                replies, complete = self.receiver.handle_summary(message["data"])
+        if complete is not None:
+            self.received.append(complete)
+        for reply in replies:
+            if reply.startswith("done") and self.holding:
+                self.held.append(reply)
+            else:
+                self.ttc.handle_acknowledgement(reply)
+
+    def release(self):
+        self.holding = False
+        for reply in self.held:
+            self.ttc.handle_acknowledgement(reply)
+
+class DroppedConnection:
+    remote_address = ("127.0.0.1", 8000)
+
+    async def send(self, message):
+        raise websockets.exceptions.ConnectionClosedError(None, None)
+
+@pytest.mark.asyncio
+async def test_queued_file_is_popped_once_ground_has_all_of_it(tmp_path):
+    path = tmp_path / "numbers.txt"
+    path.write_bytes(b"23 45 67\n" * 500)
+    ttc = make_ttc(tmp_path / "queue")
+    ground = FakeGround(ttc)
+    ttc.connection = ground
+    ttc.downlink_queue.put(DownlinkPriority.FILE, "file", str(path))
+
+    drain = asyncio.ensure_future(ttc.drain_downlink())
+    while not ground.held:
+        await asyncio.sleep(0.01)
+    # Every chunk is out, but Ground has not answered done yet
+    assert ground.received and ttc.downlink_queue.peek()[1]["payload"] == str(path)
+
+    ground.release()
+    await asyncio.wait_for(drain, 5)
+    assert ttc.downlink_queue.peek() is None
+    (name, data), = ground.received
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("numbers.txt") == path.read_bytes()
+
+@pytest.mark.asyncio
+async def test_queued_files_stay_queued_when_the_link_drops(tmp_path):
+    paths = [str(tmp_path / name) for name in ("left.jpg", "right.jpg")]
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(bytes(range(256)) * 40)
+    ttc = make_ttc(tmp_path / "queue")
+    # Closed before the connection handler noticed, so TTC still has it
+    ttc.connection = DroppedConnection()
+    for path in paths:
+        ttc.downlink_queue.put(DownlinkPriority.FILE, "file", path)
+
+    await asyncio.wait_for(ttc.drain_downlink(), 5)
+    queued = []
+    while (record := ttc.downlink_queue.peek()) is not None:
+        queued.append(record[1]["payload"])
+        ttc.downlink_queue.pop(*record)
+    assert sorted(queued) == paths
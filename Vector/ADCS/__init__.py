@@ -1,42 +1,53 @@
-from ADCS.adcs_controller import AdcsController
-
 import time, random
 
-def start(pipe, log_queue):
+def start(pipe, log_queue, timeline=None):
+    # Imported here so ADCS tooling (e.g. ADCS.fake_esp) can be used without the motor and sensor drivers
+    from ADCS.adcs_controller import AdcsController
+    if timeline is not None:
+        timeline.mark("driver import")
+
     log_queue.put(("ADCS", "Starting Subsystem"))
-    adcs_controller = AdcsController(log_queue)
+    adcs_controller = AdcsController(log_queue, timeline=timeline)
+    pipe.send(("ready", {"ready": adcs_controller.get_state() == "READY", "timeline": adcs_controller.timeline.to_dict()}))
     
     running = True
     while running:
         line, args = pipe.recv()
         if line == "health_check":
             variable = adcs_controller.health_check()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "test_wheel":
             kp = args["kp"]
             ki = args["ki"]
             kd = args["kd"]
             variable = adcs_controller.test_reaction_wheel(kp, ki, kd, t=60)
-            pipe.send(variable)
+            pipe.reply(variable)
+        elif line == "tune_wheel":
+            try:
+                variable = adcs_controller.tune_reaction_wheel(samples=args.get("samples", 2000), seed=args.get("seed", None))
+            except Exception as e:
+                log_queue.put(("ADCS", f"Error: Reaction wheel tuning failed: {e}"))
+                variable = {"error": str(e)}
+            pipe.reply(variable)
         elif line == "eps_health_check":
             variable = adcs_controller.get_eps_health_check()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "is_ready":
             variable = adcs_controller.get_state() == "READY"
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "get_state":
             variable = adcs_controller.get_state()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "phase2_rotate":
             adcs_controller.phase2_rotate(pipe)
-            pipe.send(("rotation_complete", None))
+            pipe.reply(("rotation_complete", None))
         elif line == "phase2_sequence":
             sequence = args.get("sequence", None)
             numbers = args.get("numbers", None)
             if sequence is None or numbers is None:
                 log_queue.put(("ADCS", "Error: Sequence or numbers not provided. Phase 2 Failed."))
             degree_distances = adcs_controller.phase2_sequence_rotation(pipe, sequence, numbers)
-            pipe.send(("phase2_sequence_response", degree_distances))
+            pipe.reply(("phase2_sequence_response", degree_distances))
         elif line == "phase3_search_target":
             adcs_controller.phase3_search_target(pipe)
         elif line == "phase3_reacquire_target":
@@ -45,8 +56,8 @@ def start(pipe, log_queue):
             adcs_controller.phase3a_read_target(pipe)
         elif line == "phase3a_complete":
             current_wheel_velocity = adcs_controller.current_reaction_wheel.get_current_speed()
-            current_satellite_velocity = adcs_controller.imu.get_current_angular_velocity()
-            pipe.send(("readings_phase3a", {
+            current_satellite_velocity = adcs_controller.attitude.get_current_angular_velocity()
+            pipe.reply(("readings_phase3a", {
                 "current_wheel_velocity": current_wheel_velocity,
                 "current_satellite_velocity": current_satellite_velocity
             }))
@@ -1,17 +1,24 @@
+from ADCS.attitude_estimator import AttitudeEstimator
 from ADCS.imu import Imu
 from ADCS.reaction_wheel import ReactionWheel
-from ADCS.sun_sensor import SunSensor
+from ADCS.sun_calibration import CALIBRATION_CACHE_PATH, CalibrationCache, SunCalibrationRecorder, fit_offset, get_esp_boot_time
+from timeline import StartupTimeline
 import time
 import threading
 import queue
-import numpy as np
-
-from ADCS.brushed_motor import BrushedMotor
 
 class AdcsController:
-    def __init__(self, log_queue):
+    def __init__(self, log_queue, simulator=None, calibration_cache_path=None, timeline=None):
         self.state = "INITIALIZING"
         self.log_queue = log_queue
+        self.timeline = timeline if timeline is not None else StartupTimeline("ADCS")
+        # Devices and time come from ADCS.simulator when given, otherwise from the hardware drivers
+        self.simulator = simulator
+        self.clock = simulator.clock if simulator is not None else time
+        # Simulated runs only use a calibration cache when given one
+        if calibration_cache_path is None and simulator is None:
+            calibration_cache_path = CALIBRATION_CACHE_PATH
+        self.calibration_cache = CalibrationCache(calibration_cache_path) if calibration_cache_path else None
         self.initialize_sun_sensors()
         self.initialize_orientation_system()
         self.calibrating_orientation_system = False
@@ -25,15 +32,47 @@ class AdcsController:
         self.log_queue.put(("ADCS", msg))
 
     def initialize_orientation_system(self):
-        self.imu = Imu()
-        self.main_reaction_wheel = ReactionWheel(self.imu, motor_type="brushless")
-        self.backup_reaction_wheel = ReactionWheel(self.imu, motor_type="brushed")
+        if self.simulator is not None:
+            self.imu = self.simulator.imu
+        else:
+            self.imu = Imu(binary=True)  # Falls back to JSON lines if the ESP firmware does not support framing
+        # Yaw and yaw rate for the control loops, fused from the gyro, the ESP orientation and the sun sensors
+        self.attitude = AttitudeEstimator(self.imu, self.sun_sensors, clock=self.clock, log_queue=self.log_queue)
+
+        if self.simulator is not None:
+            self.main_reaction_wheel = ReactionWheel(self.imu, motor_type="brushless", motor=self.simulator.create_motor("brushless"), clock=self.clock, attitude=self.attitude)
+            self.backup_reaction_wheel = ReactionWheel(self.imu, motor_type="brushed", motor=self.simulator.create_motor("brushed"), clock=self.clock, attitude=self.attitude)
+        else:
+            self.main_reaction_wheel = ReactionWheel(self.imu, motor_type="brushless", attitude=self.attitude)
+            self.backup_reaction_wheel = ReactionWheel(self.imu, motor_type="brushed", attitude=self.attitude)
         #self.current_reaction_wheel = self.backup_reaction_wheel
         self.current_reaction_wheel = self.main_reaction_wheel
 
         #brushless_thread = threading.Thread(target=self.main_reaction_wheel.brushless_compensation)
         #brushless_thread.start()
-        self.calibrate_orientation_system()
+        self.timeline.mark("hardware")
+        if not self.load_orientation_calibration():
+            self.calibrate_orientation_system()
+        self.timeline.mark("calibration")
+
+    def load_orientation_calibration(self):
+        """Warm start: apply the cached calibration offset if it is still valid for the ESP's yaw frame."""
+        if self.calibration_cache is None or self.imu.get_status()["status"] != "ACTIVE":
+            return False
+        self.imu.get_latest_sample()  # Wait for a first sample, it carries the ESP uptime on the binary link
+        esp_boot_time = get_esp_boot_time(self.imu, self.clock)
+        if esp_boot_time is None:
+            self.log("Calibration cache not used: the ESP boot time is unknown on the JSON link")
+            return False
+        entry = self.calibration_cache.load(esp_boot_time)
+        if entry is None:
+            return False
+
+        self.imu.set_calibration_offset(entry["offset"])
+        self.attitude.reset()
+        self.attitude.start()
+        self.log(f"ORIENTATION SYSTEM CALIBRATION LOADED from cache with offset: {entry['offset']}°")
+        return True
 
     def health_check(self, calibrate_orientation_system=False):
         health_check_text = ""
@@ -90,6 +129,10 @@ class AdcsController:
         health_check_text += f"Gyroscope: {gyroscope_text}\n"
         health_check_text += f"Orientation: {orientation_text}\n"
 
+        estimate = self.attitude.get_estimate()
+        if estimate is not None:
+            health_check_text += f"Attitude estimate: Yaw {estimate['yaw']:.2f} ± {estimate['yaw_variance'] ** 0.5:.2f} º, Rate {estimate['yaw_rate']:.2f} º/s, Gyro bias {estimate['gyro_bias']:.3f} º/s\n"
+
         if errors == []:
             is_component_ready = True
 
@@ -137,6 +180,7 @@ class AdcsController:
             calibration_rotation_thread.start()
             result = self.imu.calibrate()
             calibration_rotation_thread.join()
+            self.attitude.reset()  # The ESP zeroed its yaw
 
             if result:
                 sun_sensor_measurement_thread = threading.Thread(target=self.sun_sensor_calibration_measurement, args=(readings_queue,))
@@ -145,21 +189,29 @@ class AdcsController:
                 self.calibrating_orientation_system = False
                 sun_sensor_measurement_thread.join()
             
-                readings = readings_queue.get()
-
-                if readings is not None and len(readings) > 0:
-                    max_index = np.argmax(readings)
-                    max_value = readings[max_index]
-                    self.log(f"ORIENTATION SYSTEM CALIBRATION COMPLETE with offset: {max_index}°")
-                    self.imu.set_calibration_offset(max_index)
+                recorder = readings_queue.get()
+                offset = fit_offset(recorder.bin())
+
+                if offset is not None:
+                    self.log(f"ORIENTATION SYSTEM CALIBRATION COMPLETE with offset: {offset}°")
+                    self.imu.set_calibration_offset(offset)
+                    self.attitude.reset()
+                    if self.calibration_cache is not None:
+                        self.calibration_cache.save(offset, get_esp_boot_time(self.imu, self.clock), recorder.count)
                 else:
                     self.log("No sun sensor readings available to determine offset.")
+                self.attitude.start()
             else:
                 self.log("Orientation system calibration failed: IMU did not respond.")
         else:
             self.log(f"Orientation system calibration failed: Errors: {imu_status['errors']}")
 
     def initialize_sun_sensors(self):
+        if self.simulator is not None:
+            self.sun_sensors = self.simulator.create_sun_sensors()
+            return
+
+        from ADCS.sun_sensor import SunSensor
         # Initialize the four sun sensors
         self.sun_sensors = [
             SunSensor(id=0, i2c_address=0x23, bus=1),
@@ -194,8 +246,8 @@ class AdcsController:
         return health_check_text, is_component_ready, errors
 
     def get_current_yaw(self):
-        # Get the current yaw from the IMU
-        return self.imu.get_current_yaw()
+        # Get the current yaw from the attitude estimator
+        return self.attitude.get_current_yaw()
     
     def get_reaction_wheel_health_check(self):
         # Get the status of the reaction wheel
@@ -204,41 +256,25 @@ class AdcsController:
         return health_check_text
 
     def sun_sensor_calibration_measurement(self, readings_queue):
-        #TODO: handle sensor not available
-        #if not sensor.is_available():
-            #return f"Sun Sensor {sensor.id} not available for calibration."
+        recorder = SunCalibrationRecorder()
 
-        readings = {sensor.id: {} for sensor in self.sun_sensors}
+        # get_status() reads the sensor, so check each sensor once up front
+        sensors = [sensor for sensor in self.sun_sensors if sensor.get_status()["status"] == "ACTIVE"]
+        if not sensors:
+            self.log("No sun sensors available for calibration.")
 
-        while self.calibrating_orientation_system:
-            for sensor in self.sun_sensors:
-                if not sensor.get_status()["status"] == "ACTIVE":
-                    continue
+        while self.calibrating_orientation_system and sensors:
+            # Yaw in the ESP frame, without any previous calibration offset
+            yaw = self.imu.get_current_yaw() - self.imu.calibration_offset
+            for sensor in list(sensors):
                 data = sensor.get_data()
                 if data is None:
-                    return "Calibration failed, sensor not found."
-
-                yaw = (self.imu.get_current_yaw() + 90 * int(sensor.id)) % 360
-                
-                readings[sensor.id][yaw] = data
-
-        # Compute average value for each yaw across all sensors
-        average_readings = {}
-        for sensor_id, yaw_data in readings.items():
-            for yaw, value in yaw_data.items():
-                if yaw not in average_readings:
-                    average_readings[yaw] = []
-                average_readings[yaw].append(value)
-
-        readings = np.zeros(360)
-
-        # Calculate average for each yaw
-        for yaw, values in average_readings.items():
-            float_values = [float(val) for val in average_readings[yaw]]
-            avg_value = sum(float_values) / len(float_values)
-            readings[int(yaw)] = avg_value  # Ensure yaw is an integer index
+                    self.log(f"Sun Sensor {sensor.id} stopped responding during calibration.")
+                    sensors.remove(sensor)
+                    continue
+                recorder.add(yaw + 90 * int(sensor.id), float(data))
 
-        readings_queue.put(readings)
+        readings_queue.put(recorder)
 
     def test_reaction_wheel(self, kp, ki, kd, t=60):
         # if type(self.current_reaction_wheel.motor) == BrushedMotor:
@@ -252,12 +288,25 @@ class AdcsController:
 
         #rotation_thread = threading.Thread(target=self.current_reaction_wheel.activate_wheel_with_speed_desired, args=(30,))
         rotation_thread.start()
-        time.sleep(10)
+        self.clock.sleep(10)
         print("Stopping reaction wheel after test duration")
         self.stop_reaction_wheel()
 
         rotation_thread.join()
         self.current_reaction_wheel.stop_event.clear()
+        self.log(f"Reaction wheel control loop statistics: {self.current_reaction_wheel.get_loop_statistics()}")
+
+    def tune_reaction_wheel(self, samples=2000, seed=None):
+        """
+        Sweep PID gains for activate_wheel offline and return the Pareto set of candidates,
+        so physical test_wheel runs can start from a near-optimal point.
+        """
+        from ADCS.wheel_tuner import tune
+
+        self.log(f"Tuning reaction wheel gains over {samples} simulated gain sets...")
+        result = tune(samples=samples, seed=seed, rate=self.current_reaction_wheel.control_rate)
+        self.log(f"Tuning finished in {result['elapsed']} s with {len(result['candidates'])} candidates. Recommended: {result['recommended']}")
+        return result
 
     def phase2_rotate(self, pipe):
         self.log("ADCS phase 2 rotation started")  
@@ -276,7 +325,7 @@ class AdcsController:
             current_target_yaw = numbers[current_target]
             rotation_thread = threading.Thread(target=self.current_reaction_wheel.activate_wheel_brushless_phase2, args=(pipe, current_target_yaw))
             rotation_thread.start()
-            time.sleep(20) # wait 10 seconds
+            self.clock.sleep(20) # wait 10 seconds
             self.log(f"Rotated to target {current_target} with yaw {current_target_yaw}")
             pipe.send(("take_distance", {}))  # send to Payload to measure distance
             self.stop_reaction_wheel()
@@ -293,14 +342,15 @@ class AdcsController:
         # Start rotating at specific speed
         # if apriltag is detected, stop rotating and record pose of target
         # if not, continue rotating until a timeout is reached
-        rotation_thread = threading.Thread(target=self.current_reaction_wheel.activate_wheel_with_speed_desired, args=(10,))
+        rotation_thread = threading.Thread(target=self.current_reaction_wheel.activate_wheel_with_speed_desired, args=(pipe, 10))
         rotation_thread.start()
+        self.clock.sleep(0.1)  # Let the wheel enter the ROTATING state
 
         target_found = False
         timeout = 30  # seconds
-        start_time = time.time()
-        while (time.time() - start_time < timeout) and self.is_reaction_wheel_rotating():
-            pipe.send(("detect_apriltag", {}))
+        start_time = self.clock.time()
+        while (self.clock.time() - start_time < timeout) and self.is_reaction_wheel_rotating():
+            pipe.send(("detect_apriltag", {"yaw_rate": self.attitude.get_current_angular_velocity()}))
             line, args = pipe.recv()
             if line == "apriltag_detected":
                 last_speed = self.current_reaction_wheel.get_current_speed()
@@ -327,11 +377,11 @@ class AdcsController:
             rotation_thread.start()
         
             target_found = False
-            time.sleep(5)  # wait for the wheel to start rotating
-            initial_time = time.time()
+            self.clock.sleep(5)  # wait for the wheel to start rotating
+            initial_time = self.clock.time()
             timeout = 10  # seconds
-            while not target_found and (time.time() - initial_time < timeout) and self.is_reaction_wheel_rotating():
-                pipe.send(("detect_apriltag", {}))
+            while not target_found and (self.clock.time() - initial_time < timeout) and self.is_reaction_wheel_rotating():
+                pipe.send(("detect_apriltag", {"yaw_rate": self.attitude.get_current_angular_velocity()}))
                 line, args = pipe.recv()
                 if line == "apriltag_detected":
                     last_speed = self.current_reaction_wheel.get_current_speed()
@@ -345,11 +395,11 @@ class AdcsController:
                 self.phase3_align_target(pipe, last_speed)
             if not target_found:
                 self.log("Target not reacquired within timeout period. Initiating search.")
-                self.phase3_search_target()
+                self.phase3_search_target(pipe)
 
         else:
             self.log("No target found yet. Initiating search.")
-            self.phase3_search_target()
+            self.phase3_search_target(pipe)
 
     def phase3_align_target(self, pipe, last_speed=0, break_on_target_aligned=True):
         # Rotate according to april tag rotation until the satellite is aligned with the target
@@ -362,7 +412,7 @@ class AdcsController:
         target_found = True
 
         while target_found is True and self.is_reaction_wheel_rotating():
-            pipe.send(("detect_apriltag", {}))
+            pipe.send(("detect_apriltag", {"yaw_rate": self.attitude.get_current_angular_velocity()}))
             line, args = pipe.recv()
             if line == "apriltag_detected":
                 target_pose = args.get("pose", None)
@@ -393,7 +443,7 @@ class AdcsController:
         rotation_thread.start()
 
         while self.is_reaction_wheel_rotating():
-            pipe.send(("detect_apriltag", {}))
+            pipe.send(("detect_apriltag", {"yaw_rate": self.attitude.get_current_angular_velocity()}))
             line, args = pipe.recv()
             if line == "apriltag_detected":
                 target_pose = args.get("pose", None)
@@ -0,0 +1,217 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+def wrap_angle(angle):
+    """Wrap an angle difference to [-180, 180)."""
+    return (angle + 180.0) % 360.0 - 180.0
+
+class AttitudeEstimator:
+    """
+    Kalman filter for yaw on the state [yaw (deg), gyro bias (deg/s)].
+    The z-gyro of every buffered IMU sample is integrated between samples and the ESP orientation corrects the
+    result. Sun sensor fixes, read in the background, correct the drift of both. Getters extrapolate the estimate
+    to the current time with the last bias-corrected rate, so readers get a continuous (unwrapped), low-latency yaw
+    instead of the last serial sample.
+    Implements get_current_yaw() and get_current_angular_velocity() like Imu, so it can be used as the attitude
+    source of ReactionWheel.
+    Attributes:
+        imu (Imu): IMU whose SampleBuffer is consumed.
+        sun_sensors (list): Sun sensors, faces 90° apart (sensor id * 90° in the body frame).
+        sun_azimuth (float): Sun azimuth in the yaw frame, learned from the first sun fix if not given.
+        clock: Provides monotonic() and sleep(); must be the clock the IMU timestamps its samples with.
+        log_queue: Queue the failed sun fixes are reported to, as ("ADCS", message).
+    """
+    def __init__(self, imu, sun_sensors: Optional[List] = None, clock=time, gyro_noise: float = 0.5, bias_walk: float = 0.01, orientation_noise: float = 1.0, sun_noise: float = 5.0, sun_period: float = 0.5, sun_threshold: float = 50.0, sun_azimuth: Optional[float] = None, log_queue=None):
+        self.imu = imu
+        self.sun_sensors = sun_sensors or []
+        self.clock = clock
+        self.gyro_noise = gyro_noise  # deg/s/sqrt(Hz)
+        self.bias_walk = bias_walk  # deg/s/sqrt(s)
+        self.orientation_noise = orientation_noise  # deg
+        self.sun_noise = sun_noise  # deg
+        self.sun_period = sun_period  # s
+        self.sun_threshold = sun_threshold  # lux above ambient needed for a sun fix
+        self.configured_sun_azimuth = sun_azimuth
+        self.sun_azimuth = sun_azimuth
+
+        self.stop_event = threading.Event()
+        self.sun_thread = None
+        self.sun_updates = 0
+        self.sun_rejections = 0
+        self.sun_failures = 0
+        self.log_queue = log_queue
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Restart from the next IMU sample (e.g. after the IMU was zeroed or the calibration offset changed)."""
+        with self._lock:
+            self.yaw = 0.0
+            self.bias = 0.0
+            # Covariance [[p00, p01], [p01, p11]]
+            self.p00, self.p01, self.p11 = 1e4, 0.0, 1.0
+            self.time = None
+            self.rate = 0.0  # Last measured gyro rate (deg/s)
+            self.last_seq = self.imu.samples.latest()["seq"] if self.imu.samples.latest() else 0
+            self.initialized = False
+            # A learned sun azimuth belongs to the previous yaw frame
+            self.sun_azimuth = self.configured_sun_azimuth
+
+    def _predict(self, dt: float, rate: float) -> None:
+        if dt <= 0:
+            return
+        # F = [[1, -dt], [0, 1]], P = F P F' + Q (scalar form, this runs for every sample)
+        self.yaw += (rate - self.bias) * dt
+        self.p00 += -2 * dt * self.p01 + dt * dt * self.p11 + self.gyro_noise**2 * dt
+        self.p01 -= dt * self.p11
+        self.p11 += self.bias_walk**2 * dt
+
+    def _correct(self, measurement: float, noise: float, gate: Optional[float] = None) -> bool:
+        innovation = wrap_angle(measurement - self.yaw)
+        S = self.p00 + noise**2
+        if gate is not None and innovation**2 > gate**2 * S:
+            return False
+        k0, k1 = self.p00 / S, self.p01 / S
+        self.yaw += k0 * innovation
+        self.bias += k1 * innovation
+        self.p11 -= k1 * self.p01
+        self.p00 -= k0 * self.p00
+        self.p01 -= k0 * self.p01
+        return True
+
+    def update(self) -> None:
+        """Integrate every IMU sample received since the last update."""
+        latest = self.imu.get_latest_sample(max_attempts=1)
+        with self._lock:
+            if latest is None or latest["seq"] <= self.last_seq:
+                return
+            for sample in self.imu.samples.since(self.time if self.time is not None else -math.inf):
+                if sample["seq"] <= self.last_seq:
+                    continue
+                self.last_seq = sample["seq"]
+                gyroscope, orientation, *_ = self.imu._apply_calibration(sample, cap_rotations=False)
+                if not gyroscope or not orientation:
+                    continue
+                rate = gyroscope[-1]  # The ESP only sends the z axis
+
+                if not self.initialized:
+                    self.yaw, self.bias = orientation[0], 0.0
+                    self.p00, self.p01, self.p11 = self.orientation_noise**2, 0.0, 1.0
+                    self.initialized = True
+                else:
+                    # Trapezoidal integration of the gyro between samples
+                    self._predict(sample["timestamp"] - self.time, 0.5 * (self.rate + rate))
+                    self._correct(orientation[0], self.orientation_noise)
+                self.time = sample["timestamp"]
+                self.rate = rate
+
+    def measure_sun_bearing(self) -> Optional[float]:
+        """
+        Bearing of the sun in the body frame from the sun sensor readings, None if the sun is not visible.
+        Each sensor contributes its reading above ambient (the darkest sensor) along the direction it faces.
+        """
+        readings = []
+        for sensor in self.sun_sensors:
+            data = sensor.get_data()
+            if data is not None:
+                readings.append((90.0 * int(sensor.id), float(data)))
+        if len(readings) < 2:
+            return None
+
+        ambient = min(lux for _, lux in readings)
+        x = sum((lux - ambient) * math.cos(math.radians(face)) for face, lux in readings)
+        y = sum((lux - ambient) * math.sin(math.radians(face)) for face, lux in readings)
+        if math.hypot(x, y) < self.sun_threshold:
+            return None
+        return math.degrees(math.atan2(y, x))
+
+    def update_sun(self) -> bool:
+        """Correct the estimate with a sun fix. Returns True if a fix was applied."""
+        bearing = self.measure_sun_bearing()
+        if bearing is None:
+            return False
+        self.update()
+        with self._lock:
+            if not self.initialized:
+                return False
+            # The fix is taken now, the state is at the last IMU sample
+            elapsed = max(0.0, self.clock.monotonic() - self.time)
+            rotation = (self.rate - self.bias) * elapsed
+            if self.sun_azimuth is None:
+                # First fix only anchors the sun in the yaw frame
+                self.sun_azimuth = wrap_angle(self.yaw + rotation + bearing)
+                return False
+            # Sensor i faces the sun when yaw + 90 * i equals the sun azimuth
+            if self._correct(self.sun_azimuth - bearing - rotation, self.sun_noise, gate=3.0):
+                self.sun_updates += 1
+                return True
+            self.sun_rejections += 1
+            return False
+
+    def get_estimate(self) -> Optional[Dict[str, float]]:
+        """
+        Current estimate, extrapolated to now.
+        Returns:
+            dict: yaw (deg, unwrapped), yaw_rate (deg/s), gyro_bias (deg/s), their variances and the
+            age (s) of the last IMU sample. None before the first IMU sample.
+        """
+        self.update()
+        with self._lock:
+            if not self.initialized:
+                return None
+            dt = max(0.0, self.clock.monotonic() - self.time)
+            # Propagate the covariance to now without touching the filter state
+            p00 = self.p00 - 2 * dt * self.p01 + dt * dt * self.p11 + self.gyro_noise**2 * dt
+            p01 = self.p01 - dt * self.p11
+            p11 = self.p11 + self.bias_walk**2 * dt
+            return {
+                "yaw": self.yaw + (self.rate - self.bias) * dt,
+                "yaw_rate": self.rate - self.bias,
+                "gyro_bias": self.bias,
+                "yaw_variance": p00,
+                "yaw_rate_variance": self.gyro_noise**2 + p11,
+                "covariance": [[p00, p01], [p01, p11]],
+                "age": dt
+            }
+
+    def get_current_yaw(self) -> float:
+        estimate = self.get_estimate()
+        if estimate is None:
+            return self.imu.get_current_yaw()
+        return estimate["yaw"]
+
+    def get_current_angular_velocity(self) -> float:
+        estimate = self.get_estimate()
+        if estimate is None:
+            return self.imu.get_current_angular_velocity()
+        return estimate["yaw_rate"]
+
+    def start(self) -> None:
+        """Start reading the sun sensors in the background."""
+        if not self.sun_sensors or (self.sun_thread is not None and self.sun_thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.sun_thread = threading.Thread(target=self._run_sun, name="Sun Fixes", daemon=True)
+        self.sun_thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.sun_thread is not None:
+            self.sun_thread.join()
+            self.sun_thread = None
+
+    def _run_sun(self) -> None:
+        last_error = None
+        while not self.stop_event.is_set():
+            try:
+                self.update_sun()
+                last_error = None
+            except Exception as e:
+                self.sun_failures += 1
+                # Reported once until it changes or a fix succeeds, a failing sensor would otherwise flood the log
+                if self.log_queue is not None and str(e) != last_error:
+                    self.log_queue.put(("ADCS", f"Error: Sun fix failed: {e}"))
+                last_error = str(e)
+            self.clock.sleep(self.sun_period)
@@ -0,0 +1,131 @@
+import math
+import time
+
+class PidController:
+    """
+    Discrete PID controller.
+    The measured dt of every update is used for the integral and derivative terms.
+    """
+    def __init__(self, kp, ki, kd):
+        # Ensure PID gains are floats
+        self.kp = float(kp)
+        self.ki = float(ki)
+        self.kd = float(kd)
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+
+    def update(self, error, dt):
+        self.integral += error * dt
+        if self.previous_error is None or dt <= 0:
+            derivative = 0.0
+        else:
+            derivative = (error - self.previous_error) / dt
+        self.previous_error = error
+        return self.kp * error + self.ki * self.integral + self.kd * derivative
+
+class ControlLoop:
+    """
+    Fixed-rate control loop driven by a monotonic deadline.
+    Every tick reads the setpoint and feedback sources, runs the PID controller with the real elapsed dt
+    and hands the control output to the actuator. Ticks are scheduled against absolute deadlines so the time
+    spent reading sensors and logging does not stretch the period; late ticks are counted as overruns.
+    Attributes:
+        setpoint_source (callable): Returns the current setpoint.
+        feedback_source (callable): Returns the current process variable.
+        actuator (callable): Called with (control, dt), returns the applied output (e.g. duty cycle).
+        controller (PidController): Controller turning the error into a control output.
+        rate (float): Loop rate in Hz.
+        should_continue (callable): Loop runs while this returns True.
+        on_tick (callable): Optional hook called with a dict describing each tick.
+        clock: Provides monotonic() and sleep(); the time module by default.
+    """
+    def __init__(self, setpoint_source, feedback_source, actuator, controller, rate=10.0, should_continue=None, on_tick=None, clock=time):
+        self.setpoint_source = setpoint_source
+        self.feedback_source = feedback_source
+        self.actuator = actuator
+        self.controller = controller
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.should_continue = should_continue if should_continue is not None else (lambda: True)
+        self.on_tick = on_tick
+        self.clock = clock
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.max_overrun = 0.0
+        self._dt_sum = 0.0
+        self._dt_squared_sum = 0.0
+        self._max_jitter = 0.0
+
+    def run(self, duration=None):
+        """Run until should_continue() returns False (or for duration seconds) and return the loop statistics."""
+        start = self.clock.monotonic()
+        deadline = start
+        last_tick = None
+
+        while self.should_continue():
+            now = self.clock.monotonic()
+            if duration is not None and now - start >= duration:
+                break
+            measured = last_tick is not None
+            dt = now - last_tick if measured else self.period
+            last_tick = now
+            self._record(dt, measured)
+
+            setpoint = self.setpoint_source()
+            feedback = self.feedback_source()
+            error = setpoint - feedback
+            control = self.controller.update(error, dt)
+            output = self.actuator(control, dt)
+
+            if self.on_tick is not None:
+                self.on_tick({
+                    "tick": self.ticks,
+                    "time": now - start,
+                    "dt": dt,
+                    "setpoint": setpoint,
+                    "feedback": feedback,
+                    "error": error,
+                    "control": control,
+                    "output": output
+                })
+
+            deadline += self.period
+            remaining = deadline - self.clock.monotonic()
+            if remaining > 0:
+                self.clock.sleep(remaining)
+            else:
+                # Missed the deadline: run the late tick now and skip any wholly lost ticks instead of bursting to catch up
+                self.overruns += 1
+                self.max_overrun = max(self.max_overrun, -remaining)
+                deadline += math.floor(-remaining / self.period) * self.period
+
+        return self.get_statistics()
+
+    def _record(self, dt, measured):
+        self.ticks += 1
+        if not measured:
+            return
+        self._dt_sum += dt
+        self._dt_squared_sum += dt * dt
+        self._max_jitter = max(self._max_jitter, abs(dt - self.period))
+
+    def get_statistics(self):
+        """Mean measured dt, jitter (standard deviation and worst deviation from the period) and overruns."""
+        measured = self.ticks - 1
+        mean_dt = self._dt_sum / measured if measured > 0 else self.period
+        variance = self._dt_squared_sum / measured - mean_dt ** 2 if measured > 0 else 0.0
+        return {
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "mean_dt": mean_dt,
+            "jitter": math.sqrt(max(variance, 0.0)),
+            "max_jitter": self._max_jitter,
+            "overruns": self.overruns,
+            "max_overrun": self.max_overrun
+        }
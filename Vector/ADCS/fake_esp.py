@@ -0,0 +1,171 @@
+import json
+import math
+import os
+import pty
+import select
+import termios
+import threading
+import time
+import tty
+from ADCS.imu_frame import FRAME_TEXT, encode_data_frame, encode_frame
+
+# termios speed constant -> baud rate, to tell which rate the host side of the pty is set to
+TERMIOS_BAUDRATES = {getattr(termios, f"B{rate}"): rate for rate in (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600) if hasattr(termios, f"B{rate}")}
+
+class FakeEsp:
+    """
+    Pseudo-terminal stand-in for the ESP IMU/BMS board (ESP/Vector_IMU_plus_BMS.ino).
+    Streams JSON lines, or binary frames once "BINARY <baud>" is received, paced by the
+    configured baud rate, and answers CALIBRATE/ZERO/BINARY/JSON like the firmware.
+    While the host side of the pty is set to another baud rate, the host reads garbage and commands are lost, like a
+    UART at the wrong rate. binary=True starts already streaming frames, as after a restart of the Pi side only.
+    Open `port` with Imu(port=fake_esp.port) to exercise the serial path without hardware.
+    """
+    def __init__(self, baudrate=9600, loop_period=0.02, yaw_rate=10.0, binary=False):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.baudrate = baudrate
+        self.loop_period = loop_period  # Firmware loop time without serial back-pressure
+        self.yaw_rate = yaw_rate  # deg/s
+        self.binary_mode = binary
+        self.yaw = 0.0
+        self.seq = 0
+        self.samples_sent = 0
+        self.start_time = time.monotonic()
+        self.command_buffer = b""
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="Fake ESP", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _in_sync(self):
+        """Whether the host side of the pty is set to the baud rate the fake ESP sends at."""
+        host_baudrate = TERMIOS_BAUDRATES.get(termios.tcgetattr(self.slave)[5])
+        return host_baudrate is None or host_baudrate == self.baudrate
+
+    def _write(self, data):
+        os.write(self.master, data if self._in_sync() else bytes(len(data)))
+        # Emulate the UART: a byte is 10 bits on the wire (8N1)
+        return len(data) * 10 / self.baudrate
+
+    def _message(self, msg):
+        if self.binary_mode:
+            return self._write(encode_frame(FRAME_TEXT, msg.encode("ascii")))
+        return self._write(f"{msg}\r\n".encode("ascii"))
+
+    def _handle_commands(self):
+        while select.select([self.master], [], [], 0)[0]:
+            self.command_buffer += os.read(self.master, 256)
+        if not self._in_sync():
+            self.command_buffer = b""
+        elapsed = 0.0
+
+        while b"\n" in self.command_buffer:
+            line, self.command_buffer = self.command_buffer.split(b"\n", 1)
+            cmd = line.decode("ascii", errors="ignore").strip()
+            if cmd.upper().startswith("BINARY"):
+                tokens = cmd.split()
+                elapsed += self._message("BINARY OK")
+                self.baudrate = int(tokens[1]) if len(tokens) > 1 else 115200
+                self.binary_mode = True
+            elif cmd.upper() == "JSON":
+                elapsed += self._message("JSON OK")
+                self.baudrate = 9600
+                self.binary_mode = False
+            elif cmd.upper() == "CALIBRATE":
+                elapsed += self._message("Starting calibration... DONT rotate the sensor!")
+                self.yaw = 0.0
+                elapsed += self._message("Calibration complete!")
+            elif cmd.upper() == "ZERO":
+                self.yaw = 0.0
+                elapsed += self._message("Zero-ed!")
+        return elapsed
+
+    def _sample(self):
+        yaw = (self.yaw + 180.0) % 360.0 - 180.0  # The firmware normalises yaw to [-180, 180]
+        gyro_z = math.radians(self.yaw_rate)
+        timestamp_ms = int((time.monotonic() - self.start_time) * 1000)
+        self.seq += 1
+
+        if self.binary_mode:
+            return encode_data_frame(self.seq, timestamp_ms, gyro_z, yaw, 7.4, 1.2, 25.0)
+        doc = {"gyroscope": [gyro_z], "orientation": [yaw], "bms_voltage": 7.4, "bms_current": 1.2, "bms_temp": 25.0}
+        return json.dumps(doc, separators=(",", ":")).encode("ascii") + b",\r\n"
+
+    def _run(self):
+        last = time.monotonic()
+        while self.running:
+            elapsed = self._handle_commands()
+            elapsed += self._write(self._sample())
+            self.samples_sent += 1
+            time.sleep(max(self.loop_period, elapsed))
+
+            now = time.monotonic()
+            self.yaw += self.yaw_rate * (now - last)
+            last = now
+
+def benchmark(duration=5.0, binary_baudrate=115200, iterations=20000):
+    """
+    Compare the JSON and binary serial paths end to end through Imu and measure the per-sample decode cost.
+    Returns a dict of results per mode.
+    """
+    from ADCS.imu import Imu
+    from ADCS.imu_frame import FrameDecoder
+
+    results = {}
+    for mode in ("json", "binary"):
+        esp = FakeEsp()
+        esp.start()
+        imu = Imu(port=esp.port, binary=(mode == "binary"), binary_baudrate=binary_baudrate)
+        try:
+            first = imu.get_latest_sample()
+            time.sleep(duration)
+            last = imu.samples.latest()
+            received = last["seq"] - first["seq"]
+            results[mode] = {
+                "samples_per_second": received / duration,
+                "sent_per_second": esp.samples_sent / (time.monotonic() - esp.start_time),
+                "link": imu.get_link_statistics()
+            }
+        finally:
+            imu.stop_reader()
+            imu.serial_connection.close()
+            esp.stop()
+
+    # Decode cost per sample, without serial I/O
+    line = '{"gyroscope":[0.17453],"orientation":[-55.69],"bms_voltage":7.4,"bms_current":1.2,"bms_temp":25.0},'
+    frame = encode_data_frame(1, 0, 0.17453, -55.69, 7.4, 1.2, 25.0)
+    imu = Imu.__new__(Imu)
+    imu.calibration_offset = 0
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        imu.parse_imu_data(line)
+    results["json"]["decode_us"] = (time.perf_counter() - start) / iterations * 1e6
+
+    decoder = FrameDecoder()
+    stream = frame * 100
+    start = time.perf_counter()
+    for _ in range(iterations // 100):
+        decoder.decode(stream)
+    results["binary"]["decode_us"] = (time.perf_counter() - start) / iterations * 1e6
+
+    return results
+
+if __name__ == "__main__":
+    for mode, result in benchmark().items():
+        print(f"{mode}: {result['samples_per_second']:.1f} samples/s received, {result['decode_us']:.1f} us/sample decode, link: {result['link']}")
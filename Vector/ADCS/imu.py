@@ -1,12 +1,58 @@
 import math
 import time
+import queue
+import threading
 import serial
 import logging
 from typing import Optional, Tuple, Dict, List
 import json
+from ADCS.imu_frame import FrameDecoder
+
+class SampleBuffer:
+    """
+    Fixed-size ring buffer of timestamped IMU samples.
+    Every appended sample is tagged with an increasing "seq" number and a "timestamp" (time.monotonic()),
+    so readers can ask for what is new since their last read without touching the serial port.
+    """
+    def __init__(self, size: int = 256):
+        self.size = size
+        self._samples = [None] * size
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    def append(self, sample: Dict, timestamp: Optional[float] = None) -> Dict:
+        """Store a parsed sample, overwriting the oldest one once the buffer is full."""
+        with self._condition:
+            self._seq += 1
+            sample["seq"] = self._seq
+            sample["timestamp"] = time.monotonic() if timestamp is None else timestamp
+            self._samples[self._seq % self.size] = sample
+            self._condition.notify_all()
+        return sample
+
+    def latest(self) -> Optional[Dict]:
+        """Return the newest sample without blocking (None if nothing has been received yet)."""
+        with self._condition:
+            if self._seq == 0:
+                return None
+            return self._samples[self._seq % self.size]
+
+    def since(self, t: float) -> List[Dict]:
+        """Return the buffered samples with a timestamp newer than t, oldest first."""
+        with self._condition:
+            first = max(1, self._seq - self.size + 1)
+            samples = [self._samples[seq % self.size] for seq in range(first, self._seq + 1)]
+        return [sample for sample in samples if sample["timestamp"] > t]
+
+    def wait_newer(self, seq: int, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until a sample newer than seq arrives and return it (None on timeout)."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > seq, timeout):
+                return None
+            return self._samples[self._seq % self.size]
 
 class Imu:
-    def __init__(self, port: str = '/dev/serial0', baudrate: int = 9600, timeout: float = 1.0):
+    def __init__(self, port: str = '/dev/serial0', baudrate: int = 9600, timeout: float = 1.0, buffer_size: int = 256, binary: bool = False, binary_baudrate: int = 115200):
         self.serial_connection = serial.Serial(
             port=port,
             baudrate=baudrate,
@@ -17,6 +63,132 @@ class Imu:
         time.sleep(2)  # Wait for serial stabilization
         self._clear_buffers()
         self.calibration_offset = 0
+        self.read_timeout = timeout
+        self.max_sample_age = 0.5  # Samples older than this (s) are considered stale by the getters
+
+        # Samples are drained from the serial port by a background thread, getters only read the buffer
+        self.samples = SampleBuffer(buffer_size)
+        self.messages = queue.Queue()  # Non-data lines from the ESP (e.g. calibration replies)
+        self.stop_event = threading.Event()
+        self.reader_thread = None
+        self.decoder = None  # Set once the binary framed link has been negotiated
+
+        # The ESP may still be sending frames from before this side restarted, it cannot read a command sent at 9600 then
+        if binary:
+            self.detect_binary(binary_baudrate)
+        self.start_reader()
+
+        if binary:
+            self.enable_binary(binary_baudrate)
+
+    def detect_binary(self, baudrate: int = 115200, timeout: float = 0.5) -> bool:
+        """
+        Look for valid (CRC-checked) binary frames already streaming at baudrate and use the binary link if there are.
+        Goes back to the current baud rate otherwise. Must be called before the reader thread is started.
+        """
+        previous_baudrate = self.serial_connection.baudrate
+        self.serial_connection.baudrate = baudrate
+        self.serial_connection.reset_input_buffer()
+        decoder = FrameDecoder()
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                data = self.serial_connection.read(max(1, self.serial_connection.in_waiting))
+            except serial.SerialException:
+                break
+            if decoder.feed(data):
+                self.decoder = decoder
+                return True
+
+        self.serial_connection.baudrate = previous_baudrate
+        self.serial_connection.reset_input_buffer()
+        return False
+
+    def enable_binary(self, baudrate: int = 115200, timeout: float = 2.0) -> bool:
+        """
+        Ask the ESP to switch to CRC-checked binary frames at a higher baud rate.
+        Falls back to (stays on) the JSON line protocol if the ESP does not acknowledge.
+        """
+        if self.decoder is not None:
+            return True
+
+        while not self.messages.empty():
+            self.messages.get_nowait()
+        self.send_command(f"BINARY {baudrate}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                line = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                return False
+            if "BINARY OK" in line:
+                break
+
+        self.serial_connection.baudrate = baudrate
+        self.serial_connection.reset_input_buffer()
+        self.decoder = FrameDecoder()
+        return True
+
+    def get_link_statistics(self) -> Dict[str, int | str]:
+        """Statistics of the serial link (frame and CRC error counters in binary mode)."""
+        statistics = {"mode": "binary" if self.decoder is not None else "json", "baudrate": self.serial_connection.baudrate}
+        if self.decoder is not None:
+            statistics.update(self.decoder.get_statistics())
+        return statistics
+
+    def start_reader(self) -> None:
+        """Start the background thread that drains the serial port into the sample buffer."""
+        if self.reader_thread is not None and self.reader_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.reader_thread = threading.Thread(target=self._read_serial, name="IMU Reader", daemon=True)
+        self.reader_thread.start()
+
+    def stop_reader(self) -> None:
+        """Stop the background reader thread."""
+        self.stop_event.set()
+        if self.reader_thread is not None:
+            self.reader_thread.join(timeout=2 * self.read_timeout)
+            self.reader_thread = None
+
+    def _read_serial(self) -> None:
+        """Continuously read from serial, buffering data samples and queueing everything else."""
+        while not self.stop_event.is_set():
+            if self.decoder is not None:
+                self._read_frames()
+            else:
+                self._read_line()
+
+    def _read_line(self) -> None:
+        line = self.get_serial_text(max_attempts=1)
+        if not line:
+            return
+
+        sample = self.decode_line(line)
+        if sample is None:
+            self.messages.put(line)
+        else:
+            self.samples.append(sample)
+
+    def _read_frames(self) -> None:
+        try:
+            data = self.serial_connection.read(max(1, self.serial_connection.in_waiting))
+        except serial.SerialException as e:
+            time.sleep(0.1)
+            return
+        if not data:
+            return
+
+        samples, messages = self.decoder.decode(data)
+        for sample in samples:
+            self.samples.append(sample)
+        for message in messages:
+            self.messages.put(message)
 
     def _clear_buffers(self) -> None:
         """Clear serial buffers to avoid stale data."""
@@ -48,49 +220,73 @@ class Imu:
             #print(error)
             return {"status": "INACTIVE", "errors": [error]}
 
-    def parse_imu_data(self, line: str, cap_rotations=True) -> Tuple[List[float], List[float]]:
+    def decode_line(self, line: str) -> Optional[Dict]:
         """
-        Parse IMU JSON data.
-        Example line: {"gyroscope":[0.04,0.03,0.06],"orientation":[-55.69,-7.44,-12.08],"bms_voltage":10,"bms_current":20.60902,"bms_temp":21.2178} -> Format: [x, y, z] in rad/s, [Yaw, Pitch, Roll] in deg
+        Decode an IMU JSON line into a raw sample (gyroscope converted to deg/s, orientation without calibration offset).
+        Returns None if the line is not a data line.
         """
         try:
-            data = json.loads(line)
+            data = json.loads(line.rstrip(","))  # The ESP terminates Serial1 lines with a trailing comma
         except json.JSONDecodeError as e:
             #print(f"JSON decode error: {e} for line: {line}")
-            return [], [], None, None, None
+            return None
+        if not isinstance(data, dict):
+            return None
 
         gyroscope = data.get("gyroscope", [])
-        for i in range(len(gyroscope)):
-            gyroscope[i] = round(math.degrees(gyroscope[i]), 2)
-        orientation = data.get("orientation", [])
-        bms_voltage = data.get("bms_voltage", None)
-        bms_current = data.get("bms_current", None)
-        bms_temp = data.get("bms_temp", None)
+        return {
+            "gyroscope": [round(math.degrees(val), 2) for val in gyroscope],
+            "orientation": data.get("orientation", []),
+            "bms_voltage": data.get("bms_voltage", None),
+            "bms_current": data.get("bms_current", None),
+            "bms_temp": data.get("bms_temp", None)
+        }
+
+    def _apply_calibration(self, sample: Dict, cap_rotations=True) -> Tuple[List[float], List[float], Optional[float], Optional[float], Optional[float]]:
+        """Apply the calibration offset (and optionally cap rotations) to a buffered sample without modifying it."""
+        gyroscope = list(sample["gyroscope"])
+        orientation = list(sample["orientation"])
 
         if orientation:
             orientation[0] = round((orientation[0] + self.calibration_offset), 2)
             if cap_rotations:
                 orientation = [val % 360 for val in orientation ]
-        return gyroscope, orientation, bms_voltage, bms_current, bms_temp
+        return gyroscope, orientation, sample["bms_voltage"], sample["bms_current"], sample["bms_temp"]
+
+    def parse_imu_data(self, line: str, cap_rotations=True) -> Tuple[List[float], List[float]]:
+        """
+        Parse IMU JSON data.
+        Example line: {"gyroscope":[0.04,0.03,0.06],"orientation":[-55.69,-7.44,-12.08],"bms_voltage":10,"bms_current":20.60902,"bms_temp":21.2178} -> Format: [x, y, z] in rad/s, [Yaw, Pitch, Roll] in deg
+        """
+        sample = self.decode_line(line)
+        if sample is None:
+            return [], [], None, None, None
+        return self._apply_calibration(sample, cap_rotations)
+
+    def get_latest_sample(self, max_attempts: int = 10) -> Optional[Dict]:
+        """
+        Get the newest buffered sample. Only blocks if the buffer is empty or stale,
+        in which case it waits up to max_attempts serial timeouts for the reader thread.
+        """
+        sample = self.samples.latest()
+        if sample is not None and time.monotonic() - sample["timestamp"] <= self.max_sample_age:
+            return sample
+
+        seq = sample["seq"] if sample is not None else 0
+        return self.samples.wait_newer(seq, timeout=max_attempts * self.read_timeout)
 
     def get_imu_data(self, cap_rotations = True, max_attempts: int = 10) -> Dict[str, Optional[List[float]] | List[str]]:
-        """Fetch IMU data with error handling."""
+        """Fetch the latest IMU data from the sample buffer with error handling."""
         errors = []
-        for attempt in range(max_attempts):
-            line = self.get_serial_text()
-            if not line:
-                errors.append(f"Attempt {attempt + 1}: No data received")
-                continue
-            
-            gyro, orient, bms_voltage, bms_current, bms_temp = self.parse_imu_data(line, cap_rotations)
-            if gyro or orient:  # At least one dataset is valid
-                return {"gyroscope": gyro, "orientation": orient, "bms_voltage": bms_voltage, "bms_current": bms_current, "bms_temp": bms_temp , "errors": errors}
-            else:
-                errors.append(f"Attempt {attempt + 1}: Invalid data format. Response: {line}")
-        
-        time.sleep(0.5)
+        sample = self.get_latest_sample(max_attempts)
+        if sample is None:
+            errors.append(f"No data received within {max_attempts * self.read_timeout:.1f}s")
+            return {"gyroscope": None, "orientation": None, "errors": errors}
 
-        return {"gyroscope": None, "orientation": None, "errors": errors}
+        gyro, orient, bms_voltage, bms_current, bms_temp = self._apply_calibration(sample, cap_rotations)
+        if not (gyro or orient):
+            errors.append("Latest sample has no gyroscope or orientation data")
+        return {"gyroscope": gyro, "orientation": orient, "bms_voltage": bms_voltage, "bms_current": bms_current, "bms_temp": bms_temp , "errors": errors}
 
     def get_orientation(self, cap_rotations=True) -> List[float]:
         """Get orientation (convenience method)."""
@@ -109,7 +305,7 @@ class Imu:
         imu_data = self.get_imu_data(cap_rotations)
         if imu_data["gyroscope"] is None:
             raise ValueError(f"No gyroscope data. Errors: {imu_data['errors']}")
-        return imu_data["gyroscope"][2]  # Return only the Z-axis value
+        return imu_data["gyroscope"][-1]  # Return only the Z-axis value (the ESP only sends z)
 
     def get_bms_data(self):
         """Get BMS data (voltage, current, temperature)."""
@@ -123,21 +319,25 @@ class Imu:
         self.serial_connection.write(f"{command}\n".encode('utf-8'))
         self.serial_connection.flush()
 
-    def calibrate(self) -> None:
-        """Trigger calibration."""
+    def calibrate(self, timeout: float = 10.0) -> bool:
+        """Trigger calibration and wait for the ESP to report completion."""
+        # Discard replies left over from earlier commands
+        while not self.messages.empty():
+            self.messages.get_nowait()
+
         self.send_command('CALIBRATE')
-        time.sleep(0.3)
-        attempts = 0
-        calibrating = True
+        deadline = time.monotonic() + timeout
         complete = False
-        while calibrating and attempts < 4:
-            line = self.get_serial_text()
-            if line:
-                if "complete" in line:
-                    calibrating = False
-                    complete = True
-            #else:
-                #attempts += 1
+        while not complete:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                line = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if "complete" in line:
+                complete = True
         return complete
 
     def set_calibration_offset(self, offset: float) -> None:
@@ -157,4 +357,6 @@ if __name__ == "__main__":
             print(f"Gyro: {data['gyroscope']}, Orient: {data['orientation']}")
             time.sleep(0.1)
     except KeyboardInterrupt:
-        print("\nExiting...")
\ No newline at end of file
+        print("\nExiting...")
+    finally:
+        imu.stop_reader()
\ No newline at end of file
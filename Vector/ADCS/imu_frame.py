@@ -0,0 +1,134 @@
+import binascii
+import math
+import struct
+from typing import Dict, List, Tuple
+
+# Frame layout (little-endian), shared with ESP/Vector_IMU_plus_BMS.ino:
+#   sync (2) | type (1) | length (1) | payload (length) | crc16 (2)
+# The CRC is CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) over type, length and payload.
+SYNC = b"\xa5\x5a"
+HEADER = struct.Struct("<2sBB")
+CRC = struct.Struct("<H")
+
+FRAME_DATA = 0x01  # IMU + BMS sample
+FRAME_TEXT = 0x02  # ASCII message (e.g. calibration replies)
+
+# seq, sensor timestamp (ms), gyro z (rad/s), yaw (deg), bms voltage, bms current, bms temp, flags
+DATA_PAYLOAD = struct.Struct("<HIfffffB")
+FLAG_IMU_FOUND = 0x01
+
+MAX_PAYLOAD = 255
+
+def crc16(data) -> int:
+    """CRC-16/CCITT-FALSE, matches crc16_ccitt() in the ESP firmware."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def encode_frame(frame_type: int, payload: bytes) -> bytes:
+    """Build a complete frame around a payload."""
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload too large for a frame ({len(payload)} > {MAX_PAYLOAD} bytes)")
+    body = bytes((frame_type, len(payload))) + payload
+    return SYNC + body + CRC.pack(crc16(body))
+
+def encode_data_frame(seq: int, timestamp_ms: int, gyro_z: float, yaw: float, bms_voltage: float, bms_current: float, bms_temp: float, imu_found: bool = True) -> bytes:
+    """Build a data frame (used by the fake ESP and tests)."""
+    payload = DATA_PAYLOAD.pack(seq & 0xFFFF, timestamp_ms & 0xFFFFFFFF, gyro_z, yaw, bms_voltage, bms_current, bms_temp, FLAG_IMU_FOUND if imu_found else 0)
+    return encode_frame(FRAME_DATA, payload)
+
+def decode_data_payload(payload) -> Dict:
+    """
+    Decode a data payload into a sample with the same keys as Imu.decode_line.
+    Gyroscope is converted to deg/s, orientation is the raw (uncalibrated) yaw.
+    """
+    seq, timestamp_ms, gyro_z, yaw, bms_voltage, bms_current, bms_temp, flags = DATA_PAYLOAD.unpack(payload)
+    imu_found = bool(flags & FLAG_IMU_FOUND)
+    return {
+        "gyroscope": [round(math.degrees(gyro_z), 2)] if imu_found else [],
+        "orientation": [round(yaw, 2)] if imu_found else [],
+        "bms_voltage": bms_voltage,
+        "bms_current": bms_current,
+        "bms_temp": bms_temp,
+        "sensor_seq": seq,
+        "sensor_time": timestamp_ms / 1000.0
+    }
+
+class FrameDecoder:
+    """
+    Incremental decoder for the binary serial link.
+    Bytes are fed in arbitrary chunks; complete frames are returned as (type, payload) tuples.
+    Corrupted frames are counted and skipped by re-synchronising on the next sync word.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+        self.lost_frames = 0
+        self.last_seq = None
+
+    def feed(self, data) -> List[Tuple[int, bytes]]:
+        """Add received bytes and return every complete, valid frame found."""
+        self.buffer += data
+        frames = []
+        view = memoryview(self.buffer)
+        position = 0
+        end = len(self.buffer)
+
+        try:
+            while True:
+                start = self.buffer.find(SYNC, position)
+                if start < 0:
+                    # Keep a possible partial sync byte at the end
+                    keep = 1 if end > position and self.buffer[-1] == SYNC[0] else 0
+                    self.skipped_bytes += end - position - keep
+                    position = end - keep
+                    break
+                self.skipped_bytes += start - position
+                position = start
+
+                if end - start < HEADER.size:
+                    break
+                length = self.buffer[start + 3]
+                frame_end = start + HEADER.size + length + CRC.size
+                if frame_end > end:
+                    break
+
+                (expected,) = CRC.unpack_from(self.buffer, frame_end - CRC.size)
+                with view[start + 2:frame_end - CRC.size] as body:
+                    valid = crc16(body) == expected
+                if not valid:
+                    self.crc_errors += 1
+                    position = start + 1
+                    continue
+
+                # Copy the payload so it stays valid once the buffer is compacted
+                frames.append((self.buffer[start + 2], bytes(view[start + HEADER.size:frame_end - CRC.size])))
+                self.frames += 1
+                position = frame_end
+        finally:
+            view.release()
+
+        del self.buffer[:position]
+        return frames
+
+    def decode(self, data) -> Tuple[List[Dict], List[str]]:
+        """Feed bytes and split the resulting frames into data samples and text messages."""
+        samples, messages = [], []
+        for frame_type, payload in self.feed(data):
+            if frame_type == FRAME_DATA and len(payload) == DATA_PAYLOAD.size:
+                sample = decode_data_payload(payload)
+                if self.last_seq is not None:
+                    self.lost_frames += (sample["sensor_seq"] - self.last_seq - 1) & 0xFFFF
+                self.last_seq = sample["sensor_seq"]
+                samples.append(sample)
+            elif frame_type == FRAME_TEXT:
+                messages.append(bytes(payload).decode("ascii", errors="ignore").strip())
+        return samples, messages
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            "frames": self.frames,
+            "crc_errors": self.crc_errors,
+            "skipped_bytes": self.skipped_bytes,
+            "lost_frames": self.lost_frames
+        }
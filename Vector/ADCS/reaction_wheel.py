@@ -1,8 +1,7 @@
 import math
 import threading
 import time
-from ADCS.brushless_motor import BrushlessMotor
-from ADCS.brushed_motor import BrushedMotor
+from ADCS.control_loop import ControlLoop, PidController
 from ADCS.imu import Imu
 import numpy as np
 
@@ -18,6 +17,27 @@ KT = 0.00955  # Motor torque constant (N·m/A)
 KE = 0.00955  # Back-EMF constant (V·s/rad)
 R = 0.09  # Motor resistance (Ohms)
 
+# Control Loop Variables
+CONTROL_RATE = 10  # Hz
+# Duty cycle (%) per unit of PID output in the modes where the PID output drives the duty cycle directly. The gains of
+# these modes were tuned with the output scaled by the 0.1 s loop period, the scale stays fixed so that the gain does
+# not change with CONTROL_RATE (the PID integral and derivative terms already use the measured dt)
+DUTY_PER_CONTROL = 0.1
+
+def rpm_to_brushless_duty(rpm, max_duty=30):
+    """Map a wheel speed to a brushless ESC duty cycle (7000 RPM is 100%). Works on scalars and numpy arrays."""
+    rpm = np.clip(rpm, 0, 7000)  # Cap RPM to a reasonable range
+    return np.clip(rpm / 70, 0, max_duty)
+
+def rpm_to_brushed_duty(rpm):
+    """Map a wheel speed to a brushed motor duty cycle (250 RPM is 100%). Works on scalars and numpy arrays."""
+    rpm = np.clip(rpm, -250, 250)  # Cap RPM to a reasonable range
+    return np.clip(rpm / 2.5, -100, 100)
+
+def control_to_duty(control, min_duty=-100, max_duty=100):
+    """Map a PID output to a duty cycle in the modes that command the duty cycle directly, whatever the loop rate."""
+    return float(np.clip(control * DUTY_PER_CONTROL, min_duty, max_duty))
+
 class ReactionWheel:
     """
     A class to control a reaction wheel for attitude control in a satellite.
@@ -40,8 +60,12 @@ class ReactionWheel:
         motor (BrushlessMotor or BrushedMotor): Instance of the motor class.
         desired_aligment (float): Desired aligment
         state (str): Current state of the reaction wheel.
+        control_rate (float): Rate of the control loops in Hz.
+        loop_statistics (dict): Timing statistics of the last control loop run.
+        clock: Provides time(), monotonic() and sleep(); the time module, or a simulator's virtual clock.
+        attitude (AttitudeEstimator or Imu): Source of yaw and yaw rate for the control loops.
     """
-    def __init__(self, imu, motor_type="brushless"):
+    def __init__(self, imu, motor_type="brushless", control_rate=CONTROL_RATE, motor=None, clock=time, attitude=None):
         # Satellite Parameters
         self.sat_mass = SAT_MASS
         self.sat_side1 = SAT_SIDE1
@@ -63,17 +87,28 @@ class ReactionWheel:
 
         # IMU and Motor Initialization
         self.imu = imu
+        self.attitude = attitude if attitude is not None else imu
         self.motor_type = motor_type
-        if self.motor_type == "brushless":
+        self.clock = clock
+        if motor is not None:
+            # Injected motor (e.g. ADCS.simulator)
+            self.motor = motor
+        elif self.motor_type == "brushless":
             # Initialize Brushless Motor
+            from ADCS.brushless_motor import BrushlessMotor
             self.motor = BrushlessMotor()
         else:
+            from ADCS.brushed_motor import BrushedMotor
             self.motor = BrushedMotor()
-            self.initial_yaw = self.imu.get_current_yaw()
+        if self.motor_type != "brushless":
+            self.initial_yaw = self.attitude.get_current_yaw()
 
         self.state = "STANDBY" # Initial state of the reaction wheel
 
         self.stop_event = threading.Event()
+
+        self.control_rate = control_rate
+        self.loop_statistics = None
         
     def get_state(self):
         """
@@ -99,19 +134,8 @@ class ReactionWheel:
         """
         return self.motor.get_current_speed()
 
-    def pid_controller(self, setpoint, kp, ki, kd, previous_error=0, integral=0, dt=0.1):
-        # Ensure PID gains are floats
-        kp = float(kp)
-        ki = float(ki)
-        kd = float(kd)
-        error = setpoint - self.imu.get_current_yaw() # This is PV
-        integral += error * dt
-        derivative = (error - previous_error) / dt
-        control = kp * error + ki * integral + kd * derivative
-        return control, error, integral
-
-
-    def calculate_moment_of_inertia(self, mass, side1=0.1, side2=0.1, I_type="sat"):
+    @staticmethod
+    def calculate_moment_of_inertia(mass, side1=0.1, side2=0.1, I_type="sat"):
         if I_type == "sat":
             """
             The moment of inertia (I) of a rectangular prism about 
@@ -129,65 +153,86 @@ class ReactionWheel:
     def normalize_angle(self, angle):
         return (angle % 360) - 180  # Ensures angle is within [-180, 180)
         
-    def activate_wheel_brushed(self, setpoint, kp=2, ki=0, kd=0.1, t=60, tolerance=30):
+    def control_to_wheel_rpm(self, control):
         """
-        Activate the reaction wheel to adjust the satellite's orientation.
-        Parameters: 
-            - setpoint: Target yaw angle (degrees/radians).
+        Wheel speed that absorbs the momentum of the commanded satellite rate.
+        Parameters:
+            control (float): Satellite rate commanded by the PID controller (deg/s).
+        Returns:
+            float: Wheel speed in RPM.
         """
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-        omega_wheel = 0  # Initialize angular velocity
+        omega_wheel = -self.I_sat / self.I_wheel * control
+        return omega_wheel * 60 / (2 * math.pi)
 
-        print(f"Initial Yaw: {self.initial_yaw}")
+    def is_active(self, state):
+        """Check whether a control loop started in the given state should keep running."""
+        return self.get_state() == state and not self.stop_event.is_set()
 
-        setpoint = self.normalize_angle(setpoint) + self.initial_yaw
+    def run_control_loop(self, setpoint_source, feedback_source, actuator, kp, ki, kd, should_continue, on_tick=None):
+        """
+        Run a PID loop at the control rate on the shared control loop engine.
+        Parameters:
+            setpoint_source (callable): Returns the current setpoint.
+            feedback_source (callable): Returns the current process variable.
+            actuator (callable): Called with (control, dt), applies and returns the duty cycle.
+            should_continue (callable): Loop runs while this returns True.
+            on_tick (callable): Called with a dict describing each tick.
+        Returns:
+            dict: Loop statistics (ticks, mean dt, jitter, overruns).
+        """
+        loop = ControlLoop(setpoint_source, feedback_source, actuator, PidController(kp, ki, kd), rate=self.control_rate, should_continue=should_continue, on_tick=on_tick, clock=self.clock)
+        self.loop_statistics = loop.run()
+        return self.loop_statistics
 
-        self.set_state("ROTATING")  # Set state to rotating
+    def rotation_incomplete(self, state, turns=1):
+        """
+        Build a stop condition for loops that rotate the satellite a number of turns.
+        The rotation is accumulated from yaw deltas because the IMU wraps yaw to [-180, 180].
+        Returns:
+            callable: Returns True while the loop should keep running.
+        """
+        previous_yaw = self.attitude.get_current_yaw()
+        rotation = 0.0
 
-        while self.get_state() == "ROTATING" or not self.stop_event.is_set():
-            pv = self.imu.get_current_yaw()
+        def incomplete():
+            nonlocal previous_yaw, rotation
+            yaw = self.attitude.get_current_yaw()
+            rotation += (yaw - previous_yaw + 180) % 360 - 180
+            previous_yaw = yaw
+            return self.is_active(state) and abs(rotation) < turns * 360
 
-            # if pv // 360 > max_turns or pv // 360 < min_turns:
-            #     setpoint = (turns * 360) + setpoint
-            #     print(f"Setpoint adjusted to {setpoint} due to turn limit.")
+        return incomplete
 
-            # Get current yaw and compute PID control
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
+    def get_loop_statistics(self):
+        """
+        Get the timing statistics of the last control loop run.
+        Returns:
+            dict: Loop statistics, None if no loop has run yet.
+        """
+        return self.loop_statistics
 
-            # Calculate new satellite and wheel angles
-            new_pv = pv + control * dt
-            angle_delta_sat = new_pv - pv
-            angle_delta_wheel = -self.I_sat / self.I_wheel * angle_delta_sat
+    def activate_wheel_brushed(self, setpoint, kp=2, ki=0, kd=0.1, t=60, tolerance=30):
+        """
+        Activate the reaction wheel to adjust the satellite's orientation.
+        Parameters: 
+            - setpoint: Target yaw angle (degrees/radians).
+        """
+        print(f"Initial Yaw: {self.initial_yaw}")
 
-            # Update angular velocities
-            new_omega_wheel = angle_delta_wheel / dt
-            alpha_wheel = (new_omega_wheel - omega_wheel) / dt
-            omega_wheel = -new_omega_wheel
+        setpoint = self.normalize_angle(setpoint) + self.initial_yaw
 
-            rpm = omega_wheel * 60 / (2 * math.pi)
+        def actuate(control, dt):
+            # The brushed wheel spins the opposite way for the same command
+            duty_cycle = rpm_to_brushed_duty(-self.control_to_wheel_rpm(control))
+            self.motor.set_speed(duty_cycle)
+            return duty_cycle
 
-            rpm = np.clip(rpm, -250, 250)  # Cap RPM to a reasonable range
+        def log(tick):
+            print(f"Target: {tick['setpoint']:.1f}, Current: {tick['feedback']:.1f}, Duty: {tick['output']:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
 
-            duty_cycle = rpm / 2.5  # Assuming 250 RPM is 100% duty cycle
-            
-            # Ensure duty cycle stays within 0-100%
-            duty_cycle = np.clip(duty_cycle, -100, 100)
-            
-            # Update motor speed
-            self.motor.set_speed(duty_cycle)
-            last_wheel_percentage = duty_cycle
+        self.set_state("ROTATING")  # Set state to rotating
 
-            previous_error = error
-            
-            # Logging (optional)
-            print(f"Target: {setpoint:.1f}, Current: {pv:.1f}, Duty: {duty_cycle:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
-            
-            time.sleep(dt)
+        self.run_control_loop(lambda: setpoint, self.attitude.get_current_yaw, actuate, kp, ki, kd, lambda: self.is_active("ROTATING"), log)
         self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
 
     def activate_wheel_brushless_phase2(self, pipe, setpoint, kp=2, ki=0, kd=0.1, tolerance=0):
@@ -196,54 +241,25 @@ class ReactionWheel:
         Parameters: 
             - setpoint: Target yaw angle (degrees/radians).
         """
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-        omega_wheel = 0  # Initialize angular velocity
         last_wheel_percentage = 0  # Track last duty cycle
 
-        initial_yaw = self.imu.get_current_yaw()
+        initial_yaw = self.attitude.get_current_yaw()
+        last_yaw = abs(initial_yaw)
         turns = initial_yaw // 360
-        setpoint = setpoint + (turns * 360)  # Adjust setpoint to the same turn as initial_yaw
-        if abs(setpoint) < abs(initial_yaw):
-            setpoint + 360
+        target = {"setpoint": setpoint + (turns * 360)}  # Adjust setpoint to the same turn as initial_yaw
 
-        self.set_state("ROTATING")  # Set state to rotating
-
-        while abs(self.imu.get_current_yaw()) < initial_yaw + 360:
-            yaw = self.imu.get_current_yaw()
-            if abs(yaw) > last_yaw + 10 or abs(yaw) < last_yaw - 10:
-                pipe.send(("take_picture", {"current_yaw": (abs(yaw % 360))}))
-                last_yaw = abs(yaw)
+        def get_setpoint():
+            pv = self.attitude.get_current_yaw()
+            gyro = self.attitude.get_current_angular_velocity()
+            if self.motor.get_current_speed == 0 and target["setpoint"] + tolerance < pv and (gyro > 0 and gyro < 5):
+                print("REVERSE not possible. going to next turn")
+                target["setpoint"] = initial_yaw + target["setpoint"]
+            return target["setpoint"]
 
-            pv = self.imu.get_current_yaw()
-            gyro = self.imu.get_current_angular_velocity()
+        def actuate(control, dt):
+            nonlocal last_wheel_percentage
+            duty_cycle = rpm_to_brushless_duty(self.control_to_wheel_rpm(control), max_duty=100)
 
-            if self.motor.get_current_speed == 0 and setpoint + tolerance < pv and (gyro > 0 and gyro < 5):
-                print("REVERSE not possible. going to next turn")
-                setpoint = initial_yaw + setpoint
-
-            # Get current yaw and compute PID control
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
-
-            # Calculate new satellite and wheel angles
-            new_pv = pv + control * dt
-            angle_delta_sat = new_pv - pv
-            angle_delta_wheel = -self.I_sat / self.I_wheel * angle_delta_sat
-
-            # Update angular velocities
-            new_omega_wheel = angle_delta_wheel / dt
-            alpha_wheel = (new_omega_wheel - omega_wheel) / dt
-            omega_wheel = new_omega_wheel
-
-            rpm = omega_wheel * 60 / (2 * math.pi)
-            rpm = np.clip(rpm, 0, 7000)  # Cap RPM to a reasonable range
-            
-            duty_cycle = rpm / 70  # Assuming 7000 RPM is 100% duty cycle
-            
             # Apply duty cycle limits
             if duty_cycle < 5 and last_wheel_percentage < 5:
                 # Initial boost when below 5% and was previously below 5%
@@ -251,17 +267,22 @@ class ReactionWheel:
             else:
                 # Normal operation with 15% limit
                 duty_cycle = np.clip(duty_cycle, 0, 15)
-            
-            # Update motor speed
+
             self.motor.set_speed(duty_cycle)
             last_wheel_percentage = duty_cycle
+            return duty_cycle
 
-            previous_error = error
-            
-            # Logging (optional)
-            print(f"Target: {setpoint:.1f}, Current: {pv:.1f}, Duty: {duty_cycle:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
-            
-            time.sleep(dt)
+        def take_pictures(tick):
+            nonlocal last_yaw
+            yaw = tick["feedback"]
+            if abs(yaw) > last_yaw + 10 or abs(yaw) < last_yaw - 10:
+                pipe.send(("take_picture", {"current_yaw": (abs(yaw % 360))}))
+                last_yaw = abs(yaw)
+            print(f"Target: {tick['setpoint']:.1f}, Current: {yaw:.1f}, Duty: {tick['output']:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
+
+        self.set_state("ROTATING")  # Set state to rotating
+
+        self.run_control_loop(get_setpoint, self.attitude.get_current_yaw, actuate, kp, ki, kd, self.rotation_incomplete("ROTATING"), take_pictures)
         self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
 
     def activate_wheel_with_speed_desired(self, pipe, setpoint = 20,):
@@ -270,51 +291,32 @@ class ReactionWheel:
         Parameters:
             - speed: Speed in deg/s
         """
-        
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-
         # PID Parameters
         kp = 2  # Proportional gain
         ki = 0.1  # Integral gain
         kd = 0.05  # Derivative gain
 
-        initial_yaw = abs(self.imu.get_current_yaw())
+        initial_yaw = abs(self.attitude.get_current_yaw())
         last_yaw = initial_yaw
 
-        self.set_state("ROTATING")  # Set state to rotating
+        def actuate(control, dt):
+            # Cap output to motor's operational range (-100 to 100% duty cycle)
+            duty_cycle = control_to_duty(control)
+            self.motor.set_speed(duty_cycle)
+            return duty_cycle
 
-        while abs(self.imu.get_current_yaw()) < initial_yaw + 360:
-            yaw = self.imu.get_current_yaw()
+        def take_pictures(tick):
+            nonlocal last_yaw
+            yaw = self.attitude.get_current_yaw()
             if abs(yaw) > last_yaw + 10 or abs(yaw) < last_yaw - 10:
                 pipe.send(("take_picture", {"current_yaw": (abs(yaw % 360))}))
                 last_yaw = abs(yaw)
+            print(f"initial_yaw: {initial_yaw:.2f}, Current: {yaw:.2f}, Speed: {tick['feedback']:.2f}, Duty: {tick['output']:.1f}%")
 
-            # Get current yaw and compute PID control
-            pv = self.imu.get_current_yaw()
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
-
-            output = control * dt
-
-            output = min(output, 100)
-            output = max(output, -100)
-            
-            # Cap output to motor's operational range and convert to duty cycle (0-100%)
-            duty_cycle = (output / 100) * 100
-            
-            # Update motor speed
-            self.motor.set_speed(duty_cycle)
-            
-            # Logging (optional)
-            #print(f"Target: {setpoint:.2f}, Current: {pv:.2f}, Duty: {duty_cycle:.1f}%")
-            print(f"initial_yaw: {initial_yaw:.2f}, Current: {pv:.2f}, Duty: {duty_cycle:.1f}%")
-            previous_error = error
+        self.set_state("ROTATING")  # Set state to rotating
 
-            time.sleep(dt)
+        # Feedback is the angular velocity so the wheel holds the requested rotation speed
+        self.run_control_loop(lambda: setpoint, self.attitude.get_current_angular_velocity, actuate, kp, ki, kd, self.rotation_incomplete("ROTATING"), take_pictures)
         self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
         
     def activate_wheel(self, setpoint, kp=1.6, ki=0.02, kd=0.1, t=60, tolerance=30):
@@ -323,113 +325,29 @@ class ReactionWheel:
         Parameters: 
             - setpoint: Target yaw angle (degrees/radians).
         """
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-        omega_wheel = 0  # Initialize angular velocity
-
-        initial_yaw = self.imu.get_current_yaw()
+        initial_yaw = self.attitude.get_current_yaw()
         turns = initial_yaw // 360
-        setpoint = setpoint + (turns * 360)  # Adjust setpoint to the same turn as initial_yaw
-        if abs(setpoint) < abs(initial_yaw):
-            setpoint + 360
+        target = {"setpoint": setpoint + (turns * 360)}  # Adjust setpoint to the same turn as initial_yaw
 
-        self.set_state("ROTATING")  # Set state to rotating
-
-        while self.get_state() == "ROTATING" or not self.stop_reaction_wheel.is_set():
-            pv = self.imu.get_current_yaw()
-            gyro = self.imu.get_current_angular_velocity()
-
-            if self.motor.get_current_speed == 0 and setpoint + tolerance < pv and (gyro > 0 and gyro < 1):
+        def get_setpoint():
+            pv = self.attitude.get_current_yaw()
+            gyro = self.attitude.get_current_angular_velocity()
+            if self.motor.get_current_speed == 0 and target["setpoint"] + tolerance < pv and (gyro > 0 and gyro < 1):
                 print("REVERSE not possible. going to next turn")
-                setpoint = initial_yaw + setpoint
-
-            # Get current yaw and compute PID control
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
-
-            # Calculate new satellite and wheel angles
-            new_pv = pv + control * dt
-            angle_delta_sat = new_pv - pv
-            angle_delta_wheel = -self.I_sat / self.I_wheel * angle_delta_sat
-
-            # Update angular velocities
-            new_omega_wheel = angle_delta_wheel / dt
-            alpha_wheel = (new_omega_wheel - omega_wheel) / dt
-            omega_wheel = new_omega_wheel
-
-            rpm = omega_wheel * 60 / (2 * math.pi)
-
-            rpm = np.clip(rpm, 0, 7000)  # Cap RPM to a reasonable range
-
-            # # Convert to motor voltage (simplified for unidirectional ESC)
-            # voltage = (R * self.I_wheel * alpha_wheel) / self.kt + self.ke * omega_wheel
-            
-            # # Cap voltage to motor's operational range and convert to duty cycle (0-100%)
-            # voltage = np.clip(voltage, 0, self.motor.v)  # Force positive voltage
-
-            # duty_cycle = (voltage / self.motor.v) * 100  # 0-100% range
-            duty_cycle = rpm / 70  # Assuming 7000 RPM is 100% duty cycle
-            
-            # Ensure duty cycle stays within 0-100%
-            duty_cycle = np.clip(duty_cycle, 0, 30)
-            
-            # Update motor speed
-            self.motor.set_speed(duty_cycle)
-            last_wheel_percentage = duty_cycle
+                target["setpoint"] = initial_yaw + target["setpoint"]
+            return target["setpoint"]
 
-            previous_error = error
-            
-            # Logging (optional)
-            print(f"Target: {setpoint:.1f}, Current: {pv:.1f}, Duty: {duty_cycle:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
-            
-            time.sleep(dt)
-        self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
+        def actuate(control, dt):
+            duty_cycle = rpm_to_brushless_duty(self.control_to_wheel_rpm(control), max_duty=30)
+            self.motor.set_speed(duty_cycle)
+            return duty_cycle
 
-    def old_activate_wheel_with_speed_desired(self, setpoint = 20):
-        """
-        Activate the reaction wheel to rotate the satellite at a specified speed.
-        Parameters:
-            - speed: Speed in deg/s
-        """
-        
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-
-        # PID Parameters
-        kp = 2  # Proportional gain
-        ki = 0.1  # Integral gain
-        kd = 0.05  # Derivative gain
+        def log(tick):
+            print(f"Target: {tick['setpoint']:.1f}, Current: {tick['feedback']:.1f}, Duty: {tick['output']:.1f}%, kp: {kp}, ki: {ki}, kd: {kd}, State: {self.get_state()}")
 
         self.set_state("ROTATING")  # Set state to rotating
 
-        while self.get_state() == "ROTATING" or not self.stop_event.is_set():
-            # Get current yaw and compute PID control
-            pv = self.imu.get_current_angular_velocity()
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
-
-            output = control * dt
-
-            output = min(output, 100)
-            output = max(output, 0)
-            
-            # Cap output to motor's operational range and convert to duty cycle (0-100%)
-            duty_cycle = (output / 100) * 100
-            
-            # Update motor speed
-            self.motor.set_speed(duty_cycle)
-            
-            # Logging (optional)
-            print(f"Target: {setpoint:.2f}, Current: {pv:.2f}, Duty: {duty_cycle:.1f}%")
-            previous_error = error
-
-            time.sleep(dt)
+        self.run_control_loop(get_setpoint, self.attitude.get_current_yaw, actuate, kp, ki, kd, lambda: self.is_active("ROTATING"), log)
         self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
 
     def activate_wheel_to_align(self, last_speed):
@@ -438,44 +356,24 @@ class ReactionWheel:
         Parameters:
             - last_speed: Last known speed of the reaction wheel.
         """
-
-        # Initialize PID variables
-        previous_error = 0
-        integral = 0
-        dt = 0.1  # Time step in seconds
-
         # PID Parameters
         kp = 2  # Proportional gain
         ki = 0.05  # Integral gain
         kd = 0.01  # Derivative gain
-        setpoint = last_speed + self.desired_aligment
-
-        self.set_state("ALIGNING")  # Set state to aligning
 
-        while self.get_state() == "ALIGNING":
-            # Get current yaw and compute PID control
-            pv = self.get_current_speed()  # Get current speed from the motor
-            control, error, integral = self.pid_controller(
-                setpoint, kp, ki, kd, previous_error, integral, dt
-            )
-
-            output = control * dt
-
-            output = min(output, 100)
-            output = max(output, 0)
-            
-            # Cap output to motor's operational range and convert to duty cycle (0-100%)
-            duty_cycle = (output / 100) * 100
-            
-            # Update motor speed
+        def actuate(control, dt):
+            # Cap output to motor's operational range (0-100% duty cycle)
+            duty_cycle = control_to_duty(control, min_duty=0)
             self.motor.set_speed(duty_cycle)
-            
-            # Logging (optional)
-            print(f"Target: {setpoint:.2f}, Current: {pv:.2f}, Duty: {duty_cycle:.1f}%")
-            previous_error = error
+            return duty_cycle
 
-            time.sleep(dt)
+        def log(tick):
+            print(f"Target: {tick['setpoint']:.2f}, Current: {tick['feedback']:.2f}, Duty: {tick['output']:.1f}%")
+
+        self.set_state("ALIGNING")  # Set state to aligning
 
+        # desired_aligment is updated from the AprilTag pose while the loop runs
+        self.run_control_loop(lambda: last_speed + self.desired_aligment, self.get_current_speed, actuate, kp, ki, kd, lambda: self.is_active("ALIGNING"), log)
         self.stop_reaction_wheel()  # Stop the reaction wheel after rotation
         
     def get_status(self):
@@ -502,11 +400,11 @@ class ReactionWheel:
         # Test motor from 50% to 100% throttle
         for percent in range(0, 10, 1):
             self.motor.set_speed(percent)
-            time.sleep(1)
+            self.clock.sleep(1)
         
         for percent in range(10, 0, -1):
             self.motor.set_speed(percent)
-            time.sleep(1)
+            self.clock.sleep(1)
 
         self.motor.stop()  # Stop the motor
 
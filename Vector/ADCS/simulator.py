@@ -0,0 +1,340 @@
+import math
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from ADCS.imu import Imu, SampleBuffer
+from ADCS.reaction_wheel import SAT_MASS, SAT_SIDE1, SAT_SIDE2, WHEEL_MASS, WHEEL_RADIUS, KT, KE, R
+
+# Motor constants, mirrored from brushless_motor.py and brushed_motor.py (which need RPi.GPIO)
+BRUSHLESS_KV = 1000
+BRUSHLESS_V = 7.4
+BRUSHED_MAX_RPM = 250
+
+class VirtualClock:
+    """
+    Scaled clock for running the ADCS faster than real time.
+    Provides the time(), monotonic() and sleep() functions of the time module, with virtual time running
+    speedup times faster than wall-clock time. Scaling (rather than jumping) keeps the threads of the
+    controller, the reaction wheel loops and the test harness consistent with each other.
+    """
+    def __init__(self, speedup: float = 100.0):
+        self.speedup = speedup
+        self._real_start = time.monotonic()
+        self._epoch = time.time()
+
+    def monotonic(self) -> float:
+        return (time.monotonic() - self._real_start) * self.speedup
+
+    def time(self) -> float:
+        return self._epoch + self.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds / self.speedup)
+
+class Wheel:
+    """State of one reaction wheel in the plant. The motor drives it towards a target speed with a first order response."""
+    def __init__(self, inertia: float, time_constant: float, direction: int = 1):
+        self.inertia = inertia
+        self.time_constant = time_constant
+        self.direction = direction  # Mounting direction on the rotation axis
+        self.speed = 0.0  # RPM
+        self.target_speed = 0.0  # RPM
+
+class SatellitePlant:
+    """
+    Single-axis rigid body with reaction wheels.
+    The state is integrated lazily up to the clock's current time whenever it is read or a wheel command changes,
+    so the plant costs nothing between sensor reads. Angular momentum is exchanged between the wheels and the body;
+    the body has an optional viscous damping (e.g. air bearing drag).
+    Attributes:
+        yaw (float): True yaw in degrees (unwrapped).
+        angular_velocity (float): Body rate in deg/s.
+    """
+    def __init__(self, clock, sat_mass: float = SAT_MASS, sat_side1: float = SAT_SIDE1, sat_side2: float = SAT_SIDE2, initial_yaw: float = 0.0, damping: float = 0.02, max_step: float = 0.01):
+        self.clock = clock
+        self.inertia = 1/12 * sat_mass * (sat_side1**2 + sat_side2**2)
+        self.damping = damping  # 1/s
+        self.max_step = max_step  # s
+        self.yaw = initial_yaw
+        self.angular_velocity = 0.0
+        self.wheels = []
+        self.time = clock.monotonic()
+        self._lock = threading.RLock()
+
+    def add_wheel(self, wheel_mass: float = WHEEL_MASS, wheel_radius: float = WHEEL_RADIUS, kt: float = KT, ke: float = KE, r: float = R, direction: int = 1) -> Wheel:
+        """Add a disk reaction wheel; its response time is the motor's electromechanical time constant."""
+        inertia = 0.5 * wheel_mass * wheel_radius**2
+        wheel = Wheel(inertia, r * inertia / (kt * ke), direction)
+        with self._lock:
+            self.wheels.append(wheel)
+        return wheel
+
+    def set_wheel_target(self, wheel: Wheel, target_speed: float) -> None:
+        with self._lock:
+            self.advance()
+            wheel.target_speed = target_speed
+
+    def advance(self) -> None:
+        """Integrate the state up to the current clock time."""
+        with self._lock:
+            now = self.clock.monotonic()
+            remaining = now - self.time
+            while remaining > 0:
+                dt = min(remaining, self.max_step)
+                self._step(dt)
+                remaining -= dt
+            self.time = now
+
+    def _step(self, dt: float) -> None:
+        previous_velocity = self.angular_velocity
+        for wheel in self.wheels:
+            new_speed = wheel.target_speed + (wheel.speed - wheel.target_speed) * math.exp(-dt / wheel.time_constant)
+            # Momentum exchange, RPM to deg/s is a factor of 6
+            self.angular_velocity -= wheel.direction * wheel.inertia / self.inertia * (new_speed - wheel.speed) * 6
+            wheel.speed = new_speed
+        self.angular_velocity *= math.exp(-self.damping * dt)
+        self.yaw += 0.5 * (previous_velocity + self.angular_velocity) * dt
+
+    def get_state(self) -> Dict[str, float]:
+        with self._lock:
+            self.advance()
+            return {
+                "time": self.time,
+                "yaw": self.yaw,
+                "angular_velocity": self.angular_velocity,
+                "wheel_speeds": [wheel.speed for wheel in self.wheels]
+            }
+
+class SimulatedImu(Imu):
+    """
+    Stand-in for Imu backed by the plant.
+    Samples are generated on demand at the firmware's sample rate and go through the same SampleBuffer and
+    calibration code as the serial samples. Like the ESP firmware, yaw is zeroed by CALIBRATE/ZERO and wrapped to [-180, 180].
+    Samples carry the ESP uptime like binary frames, the ESP booted at esp_boot_time (wall-clock time, when the
+    simulation starts by default) or there is no uptime, like on the JSON link, with binary=False.
+    """
+    def __init__(self, plant: SatellitePlant, sample_period: float = 0.02, gyro_noise: float = 0.05, yaw_noise: float = 0.1, gyro_bias: float = 0.0, wrap_yaw: bool = True, seed: Optional[int] = None, buffer_size: int = 256, esp_boot_time: Optional[float] = None, binary: bool = True):
+        self.plant = plant
+        self.clock = plant.clock
+        self.sample_period = sample_period
+        self.gyro_noise = gyro_noise  # deg/s
+        self.yaw_noise = yaw_noise  # deg
+        self.gyro_bias = gyro_bias  # deg/s
+        self.wrap_yaw = wrap_yaw
+        self.rng = np.random.default_rng(seed)
+        self.yaw_zero = plant.get_state()["yaw"]
+        # Monotonic time the ESP booted, for its uptime
+        self.esp_boot = self.clock.monotonic() if esp_boot_time is None else self.clock.monotonic() - (self.clock.time() - esp_boot_time)
+        self.binary = binary
+
+        self.calibration_offset = 0
+        self.read_timeout = sample_period
+        self.max_sample_age = sample_period
+        self.samples = SampleBuffer(buffer_size)
+        self.messages = queue.Queue()
+        self.stop_event = threading.Event()
+        self.reader_thread = None
+        self.decoder = None
+        self._lock = threading.Lock()
+
+    def start_reader(self) -> None:
+        pass
+
+    def stop_reader(self) -> None:
+        pass
+
+    def enable_binary(self, baudrate: int = 115200, timeout: float = 2.0) -> bool:
+        return self.binary
+
+    def get_link_statistics(self) -> Dict[str, int | str]:
+        return {"mode": "simulated", "samples": self.samples.latest()["seq"] if self.samples.latest() else 0}
+
+    def get_status(self) -> Dict[str, str | List[str]]:
+        return {"status": "ACTIVE", "errors": []}
+
+    def _sample(self) -> Dict:
+        state = self.plant.get_state()
+        yaw = state["yaw"] - self.yaw_zero + self.rng.normal(0, self.yaw_noise)
+        if self.wrap_yaw:
+            yaw = (yaw + 180.0) % 360.0 - 180.0
+        gyro_z = state["angular_velocity"] + self.gyro_bias + self.rng.normal(0, self.gyro_noise)
+        sample = {
+            "gyroscope": [0.0, 0.0, round(gyro_z, 2)],
+            "orientation": [round(yaw, 2), 0.0, 0.0],
+            "bms_voltage": 7.4,
+            "bms_current": 1.2,
+            "bms_temp": 25.0
+        }
+        if self.binary:
+            sample["sensor_time"] = self.clock.monotonic() - self.esp_boot
+        return sample
+
+    def get_latest_sample(self, max_attempts: int = 10) -> Optional[Dict]:
+        """Return the newest sample, generating a new one once the sample period has elapsed."""
+        with self._lock:
+            now = self.clock.monotonic()
+            sample = self.samples.latest()
+            if sample is None or now - sample["timestamp"] >= self.sample_period:
+                sample = self.samples.append(self._sample(), timestamp=now)
+            return sample
+
+    def send_command(self, command: str) -> None:
+        command = command.strip().upper()
+        if command in ("CALIBRATE", "ZERO"):
+            self.yaw_zero = self.plant.get_state()["yaw"]
+            self.messages.put("Calibration complete!" if command == "CALIBRATE" else "Zero-ed!")
+
+    def calibrate(self, timeout: float = 10.0) -> bool:
+        self.send_command("CALIBRATE")
+        return True
+
+class SimulatedBrushlessMotor:
+    """Stand-in for BrushlessMotor. The ESC is unidirectional, so negative commands stop the wheel."""
+    def __init__(self, plant: SatellitePlant, kv: float = BRUSHLESS_KV, v: float = BRUSHLESS_V, direction: int = 1):
+        self.plant = plant
+        self.wheel = plant.add_wheel(direction=direction)
+        self.current_speed = 0
+        self.kv = kv
+        self.v = v
+
+    def get_current_speed(self):
+        return self.current_speed
+
+    def arm_esc(self):
+        pass
+
+    def calibrate(self):
+        pass
+
+    def set_speed(self, speed_percentage):
+        # The ESC pulse is clamped to [1000, 2000] us
+        throttle = min(max(speed_percentage, 0), 100)
+        self.plant.set_wheel_target(self.wheel, self.kv * self.v * throttle / 100.0)
+        self.current_speed = self.kv * self.v * (speed_percentage / 100.0)
+        if speed_percentage == 0:
+            self.stop()
+
+    def stop(self):
+        self.plant.set_wheel_target(self.wheel, 0.0)
+        self.plant.clock.sleep(0.5)
+
+class SimulatedBrushedMotor:
+    """Stand-in for BrushedMotor (H-bridge, both directions). It is mounted opposite to the brushless wheel."""
+    def __init__(self, plant: SatellitePlant, max_rpm: float = BRUSHED_MAX_RPM, direction: int = -1):
+        self.plant = plant
+        self.wheel = plant.add_wheel(direction=direction)
+        self.current_speed = 0
+        self.max_rpm = max_rpm
+
+    def get_current_speed(self):
+        return self.current_speed
+
+    def set_speed(self, speed_percentage):
+        # Stop the motor briefly before changing direction
+        if (speed_percentage >= 0 and self.current_speed < 0) or (speed_percentage < 0 and self.current_speed >= 0):
+            self.plant.set_wheel_target(self.wheel, 0.0)
+            self.plant.clock.sleep(0.1)
+        duty = min(max(speed_percentage, -100), 100)
+        self.plant.set_wheel_target(self.wheel, duty / 100.0 * self.max_rpm)
+        self.current_speed = (speed_percentage / 100.0) * self.max_rpm
+
+    def stop(self):
+        self.set_speed(0)
+
+class SimulatedSunSensor:
+    """
+    Stand-in for SunSensor. The lux reading follows the cosine of the angle between the sensor face and the sun.
+    Sensor faces are 90° apart, as assumed by AdcsController.sun_sensor_calibration_measurement.
+    """
+    def __init__(self, id, plant: SatellitePlant, sun_azimuth: float = 90.0, peak_lux: float = 1000.0, ambient_lux: float = 20.0, read_time: float = 0.005):
+        self.id = id
+        self.plant = plant
+        self.sun_azimuth = sun_azimuth
+        self.peak_lux = peak_lux
+        self.ambient_lux = ambient_lux
+        self.read_time = read_time  # I2C transaction time
+
+    def get_data(self):
+        self.plant.clock.sleep(self.read_time)
+        facing = self.plant.get_state()["yaw"] + 90 * int(self.id)
+        result = self.ambient_lux + self.peak_lux * max(0.0, math.cos(math.radians(facing - self.sun_azimuth)))
+        return format(result, '.0f')
+
+    def get_status(self):
+        return {"id": self.id, "status": "ACTIVE", "errors": []}
+
+class Simulator:
+    """
+    Simulated ADCS hardware: a virtual clock, the plant and the devices AdcsController would otherwise open.
+    Usage:
+        simulator = Simulator(speedup=200)
+        adcs_controller = AdcsController(log_queue, simulator=simulator)
+    """
+    def __init__(self, speedup: float = 100.0, initial_yaw: float = 0.0, sun_azimuth: float = 90.0, damping: float = 0.02, seed: Optional[int] = 0, **imu_options):
+        self.clock = VirtualClock(speedup)
+        self.plant = SatellitePlant(self.clock, initial_yaw=initial_yaw, damping=damping)
+        self.sun_azimuth = sun_azimuth
+        self.imu = SimulatedImu(self.plant, seed=seed, **imu_options)
+
+    def create_motor(self, motor_type: str = "brushless"):
+        if motor_type == "brushless":
+            return SimulatedBrushlessMotor(self.plant)
+        return SimulatedBrushedMotor(self.plant)
+
+    def create_sun_sensors(self) -> List[SimulatedSunSensor]:
+        return [SimulatedSunSensor(id=i, plant=self.plant, sun_azimuth=self.sun_azimuth) for i in range(3)]
+
+class RecordingPipe:
+    """Pipe end that records what the controller sends and answers recv() from a callback after a (virtual) latency."""
+    def __init__(self, responder=None, clock=time, latency: float = 0.0):
+        self.sent = []
+        self.responder = responder
+        self.clock = clock
+        self.latency = latency
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        self.clock.sleep(self.latency)
+        return self.responder(self.sent[-1]) if self.responder is not None else ("", {})
+
+def benchmark(speedup: float = 200.0):
+    """Run phase 2 rotation and the phase 3 target search headless and report virtual vs real time."""
+    from ADCS.adcs_controller import AdcsController
+
+    results = {}
+    simulator = Simulator(speedup=speedup)
+    start = time.monotonic()
+    adcs_controller = AdcsController(queue.Queue(), simulator=simulator)
+    results["startup"] = {"real_s": time.monotonic() - start, "virtual_s": simulator.clock.monotonic()}
+
+    pipe = RecordingPipe()
+    start, virtual_start = time.monotonic(), simulator.clock.monotonic()
+    adcs_controller.phase2_rotate(pipe)
+    results["phase2_rotate"] = {
+        "real_s": time.monotonic() - start,
+        "virtual_s": simulator.clock.monotonic() - virtual_start,
+        "pictures": sum(1 for msg, args in pipe.sent if msg == "take_picture"),
+        "loop": adcs_controller.current_reaction_wheel.get_loop_statistics()
+    }
+
+    # The "camera" sees the tag once the satellite has turned 90° from where the search starts
+    search_start = simulator.plant.get_state()["yaw"]
+    detect = lambda sent: ("apriltag_detected", {}) if abs(simulator.plant.get_state()["yaw"] - search_start) > 90 else ("apriltag_not_detected", {})
+    pipe = RecordingPipe(detect, clock=simulator.clock, latency=0.1)
+    start, virtual_start = time.monotonic(), simulator.clock.monotonic()
+    adcs_controller.phase3_search_target(pipe)
+    results["phase3_search_target"] = {
+        "real_s": time.monotonic() - start,
+        "virtual_s": simulator.clock.monotonic() - virtual_start,
+        "result": pipe.sent[-1][0]
+    }
+    return results
+
+if __name__ == "__main__":
+    for name, result in benchmark().items():
+        print(f"{name}: {result}")
@@ -0,0 +1,103 @@
+import json
+import math
+import os
+import time
+from typing import Dict, Optional
+import numpy as np
+
+CALIBRATION_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+
+class SunCalibrationRecorder:
+    """
+    Collects (yaw, lux) readings of the calibration rotation into preallocated arrays.
+    The arrays double in size when full, so appending stays cheap for any rotation length.
+    """
+    def __init__(self, capacity: int = 4096):
+        self.yaws = np.empty(capacity)
+        self.values = np.empty(capacity)
+        self.count = 0
+
+    def add(self, yaw: float, value: float) -> None:
+        if self.count == len(self.yaws):
+            self.yaws = np.concatenate((self.yaws, np.empty(len(self.yaws))))
+            self.values = np.concatenate((self.values, np.empty(len(self.values))))
+        self.yaws[self.count] = yaw
+        self.values[self.count] = value
+        self.count += 1
+
+    def bin(self, bins: int = 360) -> np.ndarray:
+        """Average reading per 1° yaw bin (0 for bins without readings)."""
+        return bin_readings(self.yaws[:self.count], self.values[:self.count], bins)
+
+def bin_readings(yaws, values, bins: int = 360) -> np.ndarray:
+    """Average readings into yaw bins with np.bincount."""
+    indexes = (np.asarray(yaws) % 360 * bins / 360).astype(int) % bins
+    sums = np.bincount(indexes, weights=values, minlength=bins)
+    counts = np.bincount(indexes, minlength=bins)
+    return np.divide(sums, counts, out=np.zeros(bins), where=counts > 0)
+
+def fit_offset(binned, peak_fraction: float = 0.5) -> Optional[float]:
+    """
+    Yaw (deg) at which the sun sensors peak, as the weighted circular mean of the bins around the peak.
+    Unlike argmax this has sub-bin resolution, is not thrown off by a single noisy bin and handles a peak
+    that wraps through 0°. Returns None if there are no readings.
+    """
+    binned = np.asarray(binned, dtype=float)
+    populated = binned > 0
+    if not populated.any():
+        return None
+
+    weights = np.where(populated, binned - binned[populated].min(), 0.0)
+    if weights.max() <= 0:
+        return None
+    weights[weights < peak_fraction * weights.max()] = 0.0
+
+    centers = np.radians((np.arange(len(binned)) + 0.5) * 360 / len(binned))
+    angle = math.degrees(math.atan2(np.dot(weights, np.sin(centers)), np.dot(weights, np.cos(centers))))
+    return round(angle % 360, 2) % 360
+
+def get_esp_boot_time(imu, clock=time) -> Optional[float]:
+    """Wall-clock time the ESP booted, from the sensor timestamp of binary frames (None on the JSON link)."""
+    sample = imu.samples.latest()
+    if sample is None or "sensor_time" not in sample:
+        return None
+    return clock.time() - (clock.monotonic() - sample["timestamp"]) - sample["sensor_time"]
+
+class CalibrationCache:
+    """
+    Orientation calibration persisted to disk, so the ADCS can warm-start without the calibration rotation.
+    The offset is only valid while the ESP keeps the yaw frame (and gyro bias) of the calibration, so an entry is
+    rejected if it is older than max_age or the ESP may have rebooted since: both the cached and the current boot
+    times must be known (binary link) and match.
+    """
+    def __init__(self, path: str = CALIBRATION_CACHE_PATH, max_age: float = 24 * 3600, boot_tolerance: float = 5.0):
+        self.path = path
+        self.max_age = max_age  # s
+        self.boot_tolerance = boot_tolerance  # s
+
+    def save(self, offset: float, esp_boot_time: Optional[float] = None, samples: int = 0) -> None:
+        entry = {"offset": offset, "timestamp": time.time(), "esp_boot_time": esp_boot_time, "samples": samples}
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(temporary_path, self.path)  # Never leave a half-written cache behind
+
+    def load(self, esp_boot_time: Optional[float] = None) -> Optional[Dict]:
+        """Return the cached entry if it is still valid, None otherwise."""
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            offset = float(entry["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        if not 0 <= offset < 360 or time.time() - entry.get("timestamp", 0) > self.max_age:
+            return None
+        cached_boot_time = entry.get("esp_boot_time")
+        if esp_boot_time is None or cached_boot_time is None or abs(esp_boot_time - cached_boot_time) > self.boot_tolerance:
+            return None
+        return entry
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
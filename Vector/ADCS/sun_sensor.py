@@ -31,8 +31,6 @@ class SunSensor:
     
     def get_status(self):
         try:
-            self.get_data()
-
             if self.get_data() is None:
                 return {"id": self.id, "status": "INACTIVE", "errors": [f"SunSensor {self.id} not found."]}
             return {"id": self.id, "status": "ACTIVE", "errors": []}
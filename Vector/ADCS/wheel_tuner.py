@@ -0,0 +1,140 @@
+import math
+import time
+from typing import Dict, List
+import numpy as np
+from ADCS.reaction_wheel import ReactionWheel, rpm_to_brushless_duty, CONTROL_RATE, SAT_MASS, SAT_SIDE1, SAT_SIDE2, WHEEL_MASS, WHEEL_RADIUS
+from ADCS.simulator import SatellitePlant, BRUSHLESS_KV, BRUSHLESS_V
+
+BASELINE_GAINS = (1.6, 0.02, 0.1)  # activate_wheel defaults
+
+def simulate_gains(kp, ki, kd, setpoint: float = 0.0, initial_yaw: float = 90.0, duration: float = 30.0, rate: float = CONTROL_RATE, substeps: int = 10, max_duty: float = 30, tolerance: float = 2.0, damping: float = 0.02) -> Dict[str, np.ndarray]:
+    """
+    Simulate activate_wheel for many gain sets at once.
+    The gains are arrays (broadcast together), the controller and duty clipping match activate_wheel and the
+    plant matches ADCS.simulator.SatellitePlant with the brushless wheel.
+    Returns:
+        dict: Per gain set arrays of settling time (s, inf if it never settles within tolerance),
+        overshoot (% of the step), effort (mean duty cycle %) and final error (deg).
+    """
+    kp, ki, kd = np.broadcast_arrays(*(np.asarray(gain, dtype=float).ravel() for gain in (kp, ki, kd)))
+
+    # Controller model, as in ReactionWheel.control_to_wheel_rpm
+    model_ratio = ReactionWheel.calculate_moment_of_inertia(SAT_MASS, SAT_SIDE1, SAT_SIDE2) / ReactionWheel.calculate_moment_of_inertia(WHEEL_MASS, WHEEL_RADIUS, I_type="wheel")
+    # Plant
+    plant = SatellitePlant(time, damping=damping)
+    wheel = plant.add_wheel()
+    coupling = wheel.inertia / plant.inertia * 6  # deg/s of body rate per RPM of wheel speed change
+
+    dt = 1.0 / rate
+    h = dt / substeps
+    wheel_decay = math.exp(-h / wheel.time_constant)
+    body_decay = math.exp(-damping * h)
+    step = setpoint - initial_yaw
+    direction = 1.0 if step >= 0 else -1.0
+
+    yaw = np.full(kp.shape, initial_yaw)
+    body_rate = np.zeros(kp.shape)
+    wheel_speed = np.zeros(kp.shape)
+    integral = np.zeros(kp.shape)
+    previous_error = None
+    effort = np.zeros(kp.shape)
+    overshoot = np.zeros(kp.shape)
+    last_outside = np.zeros(kp.shape)
+
+    steps = int(round(duration * rate))
+    for k in range(steps):
+        error = setpoint - yaw
+        integral += error * dt
+        derivative = 0.0 if previous_error is None else (error - previous_error) / dt
+        previous_error = error
+        control = kp * error + ki * integral + kd * derivative
+
+        rpm = -model_ratio * control * 60 / (2 * math.pi)
+        duty = rpm_to_brushless_duty(rpm, max_duty=max_duty)
+        effort += duty * dt
+        target = BRUSHLESS_KV * BRUSHLESS_V * duty / 100.0
+
+        for _ in range(substeps):
+            previous_rate = body_rate
+            new_speed = target + (wheel_speed - target) * wheel_decay
+            body_rate = (body_rate - coupling * (new_speed - wheel_speed)) * body_decay
+            wheel_speed = new_speed
+            yaw = yaw + 0.5 * (previous_rate + body_rate) * h
+
+        t = (k + 1) * dt
+        overshoot = np.maximum(overshoot, (yaw - setpoint) * direction)
+        last_outside = np.where(np.abs(setpoint - yaw) > tolerance, t, last_outside)
+
+    settling_time = np.where(last_outside >= steps * dt, np.inf, last_outside)
+    return {
+        "kp": kp,
+        "ki": ki,
+        "kd": kd,
+        "settling_time": settling_time,
+        "overshoot": overshoot / max(abs(step), 1e-9) * 100,
+        "effort": effort / (steps * dt),
+        "final_error": setpoint - yaw
+    }
+
+def pareto_front(objectives, chunk: int = 256) -> np.ndarray:
+    """Indices of the non-dominated rows of an (n, m) array of objectives, all minimised."""
+    objectives = np.asarray(objectives, dtype=float)
+    dominated = np.zeros(len(objectives), dtype=bool)
+    for start in range(0, len(objectives), chunk):
+        block = objectives[start:start + chunk, None, :]
+        no_worse = (objectives[None, :, :] <= block).all(axis=2)
+        better = (objectives[None, :, :] < block).any(axis=2)
+        dominated[start:start + chunk] = (no_worse & better).any(axis=1)
+    return np.flatnonzero(~dominated)
+
+def _candidate(results, i) -> Dict[str, float]:
+    return {key: round(float(results[key][i]), 4) for key in ("kp", "ki", "kd", "settling_time", "overshoot", "effort")}
+
+def tune(samples: int = 2000, seed=None, kp_range=(0.1, 10.0), ki_range=(0.0, 0.5), kd_range=(0.0, 2.0), **scenario) -> Dict:
+    """
+    Sweep random gain sets (kp log-uniform, ki and kd uniform) plus the activate_wheel defaults and
+    return the Pareto set over settling time, overshoot and effort.
+    Parameters:
+        samples (int): Number of gain sets to simulate.
+        scenario: Keyword arguments for simulate_gains (setpoint, initial_yaw, duration, ...).
+    Returns:
+        dict: "candidates" (Pareto set sorted by settling time), "recommended" (balanced candidate),
+        "baseline" (activate_wheel defaults), "samples" and "elapsed" (s).
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    kp = np.concatenate(([BASELINE_GAINS[0]], 10 ** rng.uniform(math.log10(kp_range[0]), math.log10(kp_range[1]), samples)))
+    ki = np.concatenate(([BASELINE_GAINS[1]], rng.uniform(*ki_range, samples)))
+    kd = np.concatenate(([BASELINE_GAINS[2]], rng.uniform(*kd_range, samples)))
+
+    results = simulate_gains(kp, ki, kd, **scenario)
+    objectives = np.column_stack((results["settling_time"], results["overshoot"], results["effort"]))
+
+    # Only gain sets that settle are worth a physical test
+    settled = np.flatnonzero(np.isfinite(results["settling_time"]))
+    pool = settled if len(settled) > 0 else np.arange(len(kp))
+    front = pool[pareto_front(objectives[pool])]
+    front = front[np.argsort(objectives[front, 0], kind="stable")]
+
+    # Balanced pick: smallest sum of objectives normalised over the front
+    normalised = objectives[front]
+    finite = np.where(np.isfinite(normalised), normalised, np.nan)
+    low, high = np.nanmin(finite, axis=0), np.nanmax(finite, axis=0)
+    scores = np.nan_to_num((finite - low) / np.where(high > low, high - low, 1), nan=1.0).sum(axis=1)
+    recommended = front[np.argmin(scores)]
+
+    return {
+        "candidates": [_candidate(results, i) for i in front],
+        "recommended": _candidate(results, recommended),
+        "baseline": _candidate(results, 0),
+        "samples": int(len(kp)),
+        "elapsed": round(time.perf_counter() - start, 3)
+    }
+
+if __name__ == "__main__":
+    result = tune(seed=0)
+    print(f"Simulated {result['samples']} gain sets in {result['elapsed']} s, {len(result['candidates'])} Pareto candidates")
+    print(f"Baseline: {result['baseline']}")
+    print(f"Recommended: {result['recommended']}")
+    for candidate in result["candidates"][:10]:
+        print(candidate)
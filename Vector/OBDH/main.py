@@ -7,8 +7,16 @@ from OBDH.logger import Logger
 from OBDH.health_check import construct_file
 from OBDH.phases import run_phase2, run_phase3a, run_phase3b, run_phase3c
 
+SUBSYSTEMS = ["TTC", "ADCS", "Payload"]
+REQUIRED_SUBSYSTEMS = ["TTC"]  # Commands cannot be received without TT&C
+STARTUP_TIMEOUT = 30  # s to wait for the other subsystems before a degraded start
+HEALTH_CHECK_TIMEOUT = 30  # s
+TUNE_WHEEL_TIMEOUT = 120  # s, the tuner simulates every gain set
+QUERY_TIMEOUT = 5  # s, for get_state and is_ready
+PAYLOAD_COMMAND_TIMEOUT = 60  # s, for the manual Payload commands that take and process pictures
+
 class OBDH:
-    def __init__(self):
+    def __init__(self, required_subsystems=REQUIRED_SUBSYSTEMS, startup_timeout=STARTUP_TIMEOUT):
         self.state = OBDHState.INITIALISING
         self._logger = Logger()
         self.logger = self._logger.get_logger()
@@ -16,21 +24,20 @@ class OBDH:
         self.start_time = None
         self.phase = Phase.INITIALISATION
         self.subphase = None
-        self.subsystems = ["TTC", "ADCS", "Payload"]
+        self.subsystems = SUBSYSTEMS
 
+        # All subsystems start concurrently, each sends a "ready" event with its startup timeline
+        startup_start = time.monotonic()
         for name in self.subsystems:
-            is_ready = False
             self.manager.start(name)
-
-            while not is_ready:
-                if name != "TTC":
-                    self.manager.send(name, "is_ready")
-
-                is_ready = self.manager.receive(name)["response"]
+        not_ready = self.manager.wait_ready(self.subsystems, required=required_subsystems, timeout=startup_timeout)
 
         self._logger.set_ttc_handler(self.manager.pipes["TTC"])
         self.state = OBDHState.READY
-        self.logger.info("All subsystems are ready")
+        if not_ready:
+            self.logger.warning(f"Ready after {time.monotonic() - startup_start:.2f} s, still starting: {', '.join(not_ready)}")
+        else:
+            self.logger.info(f"All subsystems are ready after {time.monotonic() - startup_start:.2f} s")
 
     def start_mission(self):
         print("Automatic mode")
@@ -38,69 +45,79 @@ class OBDH:
     def handle_input(self):
         while True:
             if self.state == OBDHState.READY:
-                input = self.manager.receive("TTC")
+                input = self.manager.receive_event("TTC")
                 self.logger.info(f"OBDH received: {input}")
                 cmd = input["command"]
                 args = input["arguments"]
                 self.logger.info(f"Matching command: {cmd}")
 
-                match cmd:
-                    # general commands
-                    case "start_phase":
-                        phase = args["phase"]
-                        self.start_phase(phase, args)
-                    case "test_wheel":
-                        self.manager.send("ADCS", "test_wheel", args={
-                            "kp": args[0],
-                            "ki": args[1],
-                            "kd": args[2],
-                        })
-                    case "shutdown":
-                        self.manager.shutdown()
-                        self.logger.info(len(self.manager.processes))
-
-                    # payload manual commands
-                    case "payload_health_check":
-                        self.manager.send("Payload", "health_check")
-                        result = self.manager.receive("Payload")
-                        self.logger.info(f"Payload health check result: {result}")
-                    case "payload_take_picture":
-                        path = "images/manual/"
-                        self.manager.send("Payload", "take_picture_raw", args={"dir": path, "name": "manual"})
-                        if os.path.exists(path+"manual_left.jpg") and os.path.exists(path+"manual_right.jpg"):
-                            self.logger.info("(payload_take_photo) files were generated -> sending over TTC")
-                            self.manager.send("TTC", "send_file", args={"path": path+"manual_left.jpg.jpg"})
-                            self.manager.send("TTC", "send_file", args={"path": path+"manual_right.jpg"})
-                        else:
-                            self.logger.error("(payload_take_picture) jpg files do not exist, did stereo camera fail or images fail to save? Maybe try running a health check on the payload.")
-                    case "payload_get_state":
-                        self.manager.send("Payload", "get_state")
-                        result = self.manager.receive("Payload")
-                        self.logger.info(f"(payload_get_state) state: {result}")
-                    case "payload_is_ready":
-                        self.manager.send("Payload", "is_ready")
-                        result = self.manager.receive("Payload")
-                        self.logger.info(f"(payload_is_ready) {'READY' if result else 'NOT READY'}")
-                    case "payload_get_numbers":
-                        self.manager.send("Payload", "get_numbers")
-                        result = self.manager.receive("Payload")
-                        self.logger.info("(payload_get_numbers) result: {}".format(result))
-                    case "payload_take_distance":
-                        self.manager.send("Payload", "take_distance")
-                        result = self.manager.receive("Payload")
-                        self.logger.info("(payload_take_distance) result: {}".format(result))
-                    case "payload_detect_apriltag":
-                        self.manager.send("Payload", "detect_apriltag")
-                        result = self.manager.receive("Payload")
-                        if result is None:
-                            self.logger.error("(payload_detect_apriltag) could not detect apriltag")
-                        else:
-                            self.logger.info("(payload_detect_apriltag) detected apriltag: {}".format(result))
-                    case "payload_restart":
-                        self.manager.stop("Payload")
-                        self.manager.start("Payload")
-                    case _:
-                        self.logger.error(f"{cmd} couldn't be matched! It is likely invalid.")
+                # A subsystem that is busy, stuck or gone must not end the command loop
+                try:
+                    match cmd:
+                        # general commands
+                        case "start_phase":
+                            phase = args["phase"]
+                            self.start_phase(phase, args)
+                        case "test_wheel":
+                            self.manager.send("ADCS", "test_wheel", args={
+                                "kp": args[0],
+                                "ki": args[1],
+                                "kd": args[2],
+                            })
+                        case "tune_wheel":
+                            result = self.manager.request("ADCS", "tune_wheel", args=args, timeout=TUNE_WHEEL_TIMEOUT)
+                            if not isinstance(result, dict) or "error" in result:
+                                self.logger.error(f"(tune_wheel) tuning failed: {result.get('error') if isinstance(result, dict) else result}")
+                            else:
+                                self.logger.info(f"(tune_wheel) {result['samples']} gain sets simulated in {result['elapsed']} s, baseline: {result['baseline']}")
+                                for candidate in result["candidates"]:
+                                    self.logger.info(f"(tune_wheel) candidate: {candidate}")
+                                self.logger.info(f"(tune_wheel) recommended: {result['recommended']}")
+                        case "shutdown":
+                            self.manager.shutdown()
+                            self.logger.info(len(self.manager.processes))
+
+                        # payload manual commands
+                        case "payload_health_check":
+                            result = self.manager.request("Payload", "health_check", timeout=HEALTH_CHECK_TIMEOUT)
+                            self.logger.info(f"Payload health check result: {result}")
+                        case "payload_take_picture":
+                            path = "images/manual/"
+                            self.manager.send("Payload", "take_picture_raw", args={"dir": path, "name": "manual"})
+                            if os.path.exists(path+"manual_left.jpg") and os.path.exists(path+"manual_right.jpg"):
+                                self.logger.info("(payload_take_photo) files were generated -> sending over TTC")
+                                self.manager.send("TTC", "send_file", args={"path": path+"manual_left.jpg.jpg"})
+                                self.manager.send("TTC", "send_file", args={"path": path+"manual_right.jpg"})
+                            else:
+                                self.logger.error("(payload_take_picture) jpg files do not exist, did stereo camera fail or images fail to save? Maybe try running a health check on the payload.")
+                        case "payload_get_state":
+                            result = self.manager.request("Payload", "get_state", timeout=QUERY_TIMEOUT)
+                            self.logger.info(f"(payload_get_state) state: {result}")
+                        case "payload_is_ready" if not self.manager.is_ready("Payload"):
+                            self.logger.info("(payload_is_ready) NOT READY (still starting)")
+                        case "payload_is_ready":
+                            result = self.manager.request("Payload", "is_ready", timeout=QUERY_TIMEOUT)
+                            self.logger.info(f"(payload_is_ready) {'READY' if result else 'NOT READY'}")
+                        case "payload_get_numbers":
+                            result = self.manager.request("Payload", "get_numbers", timeout=PAYLOAD_COMMAND_TIMEOUT)
+                            self.logger.info("(payload_get_numbers) result: {}".format(result))
+                        case "payload_take_distance":
+                            result = self.manager.request("Payload", "take_distance", timeout=PAYLOAD_COMMAND_TIMEOUT)
+                            self.logger.info("(payload_take_distance) result: {}".format(result))
+                        case "payload_detect_apriltag":
+                            result = self.manager.request("Payload", "detect_apriltag", timeout=PAYLOAD_COMMAND_TIMEOUT)
+                            if result is None:
+                                self.logger.error("(payload_detect_apriltag) could not detect apriltag")
+                            else:
+                                self.logger.info("(payload_detect_apriltag) detected apriltag: {}".format(result))
+                        case "payload_restart":
+                            self.manager.stop("Payload")
+                            self.manager.start("Payload")
+                        case _:
+                            self.logger.error(f"{cmd} couldn't be matched! It is likely invalid.")
+                except (TimeoutError, ConnectionError) as e:
+                    self.logger.error(f"({cmd}) failed: {e}")
+                    self.reset_state()
 
     def start_phase(self, phase, args):
         match phase:
@@ -109,16 +126,19 @@ class OBDH:
                 self.phase = Phase.FIRST
                 self.start_time = time.time()
 
-                self.manager.send("TTC", "health_check")
-                ttc_health_check = self.manager.receive("TTC")["response"]
-                self.manager.send("ADCS", "health_check")
-                adcs_health_check = self.manager.receive("ADCS")["response"]
-                self.manager.send("Payload", "health_check")
-                payload_health_check = self.manager.receive("Payload")["response"]
-                self.manager.send("ADCS", "eps_health_check")
-                power_health_check = self.manager.receive("ADCS")["response"]
-
-                hc = construct_file(ttc_health_check, adcs_health_check, payload_health_check, power_health_check)
+                # The subsystems run their health checks concurrently
+                health_checks = [
+                    self.manager.call("TTC", "health_check", timeout=HEALTH_CHECK_TIMEOUT),
+                    self.manager.call("ADCS", "health_check", timeout=HEALTH_CHECK_TIMEOUT),
+                    self.manager.call("Payload", "health_check", timeout=HEALTH_CHECK_TIMEOUT),
+                    self.manager.call("ADCS", "eps_health_check", timeout=HEALTH_CHECK_TIMEOUT)
+                ]
+                try:
+                    ttc_health_check, adcs_health_check, payload_health_check, power_health_check = (future.result() for future in health_checks)
+                    hc = construct_file(ttc_health_check, adcs_health_check, payload_health_check, power_health_check)
+                except (TimeoutError, ConnectionError) as e:
+                    self.logger.error(f"Health check incomplete: {e}")
+                    hc = None
 
                 if not hc:
                     self.logger.error("Health check failed, health.txt not generated.")
@@ -152,10 +172,7 @@ class OBDH:
                         self.subphase = SubPhase.a
                         distance_data, distance_data_backup = run_phase3a(self, self.manager, logger=self.logger)
 
-                        self.manager.send("ADCS", "phase3a_complete")
-                        adcs_rcv = self.manager.receive("ADCS")
-                        if adcs_rcv["command"] != "readings_phase3a":
-                            args = adcs_rcv["arguments"]
+                        _, args = self.manager.request("ADCS", "phase3a_complete")
 
                         # Send data to TTC
                         self.manager.send("TTC", "send_data", {
@@ -1,65 +1,46 @@
 from time import time
 from scipy import stats
 
+EVENT_WAIT_TIMEOUT = 0.5  # s
+
 def run_phase2(obdh, manager, logger, sequence):
     logger.info("Starting Phase 2")
 
-    # 1- Start ADCS rotation
-    manager.send("ADCS", "phase2_rotate")
-    logger.info("ADCS rotation started")
-
-    # 2- Wait for instruction from ADCS to take picture
-    rotating = True
-
-    while rotating:
-        if manager.pipes["ADCS"].poll():
-            adcs_response = manager.receive("ADCS")
-            print(adcs_response)
-            cmd = adcs_response["command"]
-            args = adcs_response["arguments"]
-
-            if cmd == "take_picture":
-                logger.info("ADCS instructed to take picture")
-                manager.send("Payload", "take_picture", args={"current_yaw": args["current_yaw"]})
-            elif cmd == "rotation_complete":
-                logger.info("ADCS rotation complete, proceeding to image processing")
-                rotating = False
-
-    # 3- Process images
-    processing_images = True
-    manager.send("Payload", "get_numbers")
-    
-    while processing_images:
-        if manager.pipes["ADCS"].poll():
-            numbers = manager.receive(name="Payload")["response"]
-            logger.info(f"Payload numbers: {numbers}")
-            processing_images = False
+    # 1- Rotate, ADCS asks for a picture at each target yaw on the way
+    def take_picture(args):
+        logger.info("ADCS instructed to take picture")
+        manager.send("Payload", "take_picture", args={"current_yaw": args["current_yaw"]})
+
+    manager.subscribe("ADCS", "take_picture", take_picture)
+    try:
+        logger.info("ADCS rotation started")
+        manager.request("ADCS", "phase2_rotate")
+    finally:
+        manager.unsubscribe("ADCS", "take_picture", take_picture)
+    logger.info("ADCS rotation complete, proceeding to image processing")
 
-    # 4- send the sequence number to ADCS
+    # 2- Process images
+    numbers = manager.request("Payload", "get_numbers")
+    logger.info(f"Payload numbers: {numbers}")
 
+    # 3- send the sequence number to ADCS, it asks for a distance at each number
     data = []
     number_distances = []
-    degree_distances = []
-
-    waiting_for_completion = True
-    manager.send("ADCS", "phase2_sequence", {"sequence" : sequence, "numbers" : numbers})
-    while waiting_for_completion and obdh.phase == OBDH.Phase.SECOND:
-        adcs_response = manager.receive("ADCS")
-        cmd = adcs_response["command"]
-
-        if cmd == "take_distance":
-            logger.info("ADCS instructed to take distance")
-            manager.send("Payload", "take_distance")
-            number_distance = manager.receive(name="Payload")["response"]
-            number_distances.append(number_distance)
-        elif cmd == "sequence_rotation_complete":
-            logger.info("ADCS sequence rotation complete")
-            waiting_for_completion = False
-
-    adcs_response = manager.receive(name="ADCS")
-    if adcs_response["command"] != "phase2_sequence_response":
-        logger.error("Unexpected command from ADCS during phase 2 sequence")
-    degree_distances = adcs_response["response"]
+
+    def take_distance(args):
+        logger.info("ADCS instructed to take distance")
+        number_distances.append(manager.request("Payload", "take_distance"))
+
+    def sequence_rotation_complete(args):
+        logger.info("ADCS sequence rotation complete")
+
+    manager.subscribe("ADCS", "take_distance", take_distance)
+    manager.subscribe("ADCS", "sequence_rotation_complete", sequence_rotation_complete)
+    try:
+        _, degree_distances = manager.request("ADCS", "phase2_sequence", {"sequence" : sequence, "numbers" : numbers})
+    finally:
+        manager.unsubscribe("ADCS", "take_distance", take_distance)
+        manager.unsubscribe("ADCS", "sequence_rotation_complete", sequence_rotation_complete)
 
     for i, distance in enumerate(number_distances):
         data[sequence[i]] = {
@@ -67,7 +48,7 @@ def run_phase2(obdh, manager, logger, sequence):
             "distance to number in cm": distance,
             "angle_variation": degree_distances[i] if i < len(degree_distances) else None
         }
-    manager.send(name="TTC", msg="send_message", message={"data": data})
+    manager.send("TTC", "send_data", {"data": data})
 
 def run_phase3a(obdh, manager, logger):
     # Search for target, if timeout occurs, return to OBDH
@@ -80,13 +61,16 @@ def run_phase3a(obdh, manager, logger):
     read_target = False 
 
     while obdh.phase == OBDH.Phase.THIRD and obdh.subphase == OBDH.SubPhase.A:
-        adcs_response = manager.receive("ADCS")
-        cmd = adcs_response["command"]
-        args = adcs_response["arguments"]
+        # Wakes up on ADCS messages, or after EVENT_WAIT_TIMEOUT to re-check the loop condition
+        cmd, args = None, {}
+        if manager.wait(["ADCS"], timeout=EVENT_WAIT_TIMEOUT):
+            adcs_response = manager.receive_event("ADCS", timeout=0)
+            if adcs_response is not None:
+                cmd = adcs_response["command"]
+                args = adcs_response["arguments"]
 
         if cmd == "detect_apriltag":
-            manager.send("Payload", "detect_apriltag")
-            pose = manager.receive("Payload")["response"]
+            pose = manager.request("Payload", "detect_apriltag", {"yaw_rate": args.get("yaw_rate")})
             if pose is not None:
                 manager.send("ADCS", "apriltag_detected", {"pose": pose})
                 if read_target:
@@ -113,8 +97,7 @@ def run_phase3a(obdh, manager, logger):
             current_time = time.time()
             elapsed_time = int(current_time - initial_time)
             if elapsed_time not in distance_data.keys():
-                manager.send("Payload", "take_distance")
-                distance = manager.receive("Payload")["response"]
+                distance = manager.request("Payload", "take_distance")
                 distance_data[elapsed_time] = distance
 
     manager.send("ADCS", "stop_reaction_wheel")
@@ -164,13 +147,16 @@ def run_phase3b(obdh, manager, logger):
     spin_data = {}
 
     while obdh.phase == OBDH.Phase.THIRD and obdh.subphase == OBDH.SubPhase.B:
-        adcs_response = manager.receive("ADCS")
-        cmd = adcs_response["command"]
-        args = adcs_response["arguments"]
+        # Wakes up on ADCS messages, or after EVENT_WAIT_TIMEOUT to re-check the loop condition
+        cmd, args = None, {}
+        if manager.wait(["ADCS"], timeout=EVENT_WAIT_TIMEOUT):
+            adcs_response = manager.receive_event("ADCS", timeout=0)
+            if adcs_response is not None:
+                cmd = adcs_response["command"]
+                args = adcs_response["arguments"]
 
         if cmd == "detect_apriltag":
-            manager.send("Payload", "detect_apriltag")
-            pose = manager.receive("Payload")["response"]
+            pose = manager.request("Payload", "detect_apriltag", {"yaw_rate": args.get("yaw_rate")})
             if pose is not None:
                 manager.send("ADCS", "apriltag_detected", {"pose": pose})
         elif cmd == "target_found":
@@ -178,7 +164,7 @@ def run_phase3b(obdh, manager, logger):
         elif cmd == "target_aligned":
             manager.send("ADCS", "phase3b_read_target")
         elif cmd == "reading_phase3b":
-            adcs_rcv = manager.receive("ADCS")
+            adcs_rcv = manager.receive_event("ADCS")
             if adcs_rcv["command"] == "readings_phase3b":
                 if initial_time is None:
                     logger.info("Starting measurement of spin rate")
@@ -224,20 +210,22 @@ def run_phase3c(obdh, manager, logger):
     distance = 200
 
     while obdh.phase == OBDH.Phase.THIRD and obdh.subphase == OBDH.SubPhase.C and distance > 4:
-        adcs_response = manager.receive("ADCS")
-        cmd = adcs_response["command"]
-        args = adcs_response["arguments"]
+        # Wakes up on ADCS messages, or after EVENT_WAIT_TIMEOUT to re-check the loop condition
+        cmd, args = None, {}
+        if manager.wait(["ADCS"], timeout=EVENT_WAIT_TIMEOUT):
+            adcs_response = manager.receive_event("ADCS", timeout=0)
+            if adcs_response is not None:
+                cmd = adcs_response["command"]
+                args = adcs_response["arguments"]
 
         if cmd == "detect_apriltag":
-            manager.send("Payload", "detect_apriltag")
-            pose = manager.receive("Payload")["response"]
+            pose = manager.request("Payload", "detect_apriltag", {"yaw_rate": args.get("yaw_rate")})
             if pose is not None:
                 manager.send("ADCS", "apriltag_detected", {"pose": pose})
         elif cmd == "target_found":
             manager.send("ADCS", "phase3_align_target", {"last_speed": args["last_speed"], "break_on_target_aligned": False})
         elif cmd == "target_aligned":
-            manager.send("Payload", "take_distance")
-            distance = manager.receive("Payload")["response"]
+            distance = manager.request("Payload", "take_distance")
     manager.send("ADCS", "stop_reaction_wheel")
     logger.info("Phase 3c completed, docking completed")
 
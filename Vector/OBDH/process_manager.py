@@ -1,12 +1,23 @@
 import multiprocessing as mp
 from OBDH.logger import Logger
+from rpc import RpcChannel, RpcEndpoint
+from timeline import StartupTimeline, format_timeline
 import importlib
+import threading
+import time
+
+_NOTHING = object()  # receive() default, subsystem replies can be None
 
 class ProcessManager:
     def __init__(self, logger):
         self.logger = logger
         self.processes = {}
-        self.pipes = {}
+        self.pipes = {}  # name -> RpcChannel
+        self.ready = {}  # name -> None while starting, then the readiness the subsystem reported in its "ready" event
+        self.spawn_times = {}
+        self.timelines = {}
+        self._ready_changed = threading.Condition()
+        self._inbox_changed = threading.Condition()
         self.log_queue = mp.Queue()
         self.log_listener = mp.Process(target=self.log_listener_process, args=(self.log_queue,))
         self.log_listener.start()
@@ -21,8 +32,10 @@ class ProcessManager:
 
     def _run_subsystem(self, module_name, pipe, log_queue):
         try:
+            timeline = StartupTimeline(module_name)
             subsystem = importlib.import_module(module_name)
-            subsystem.start(pipe, log_queue)
+            timeline.mark("import")
+            subsystem.start(RpcEndpoint(pipe), log_queue, timeline)
         except Exception as e:
             log_queue.put((module_name.upper(), f"Error starting subsystem: {e}"))
 
@@ -36,12 +49,22 @@ class ProcessManager:
         parent_conn, child_conn = mp.Pipe()
         proc = mp.Process(target=self._run_subsystem, args=(module_name, child_conn, self.log_queue), name=name)
 
+        # Subscribed before the subsystem runs, so a "ready" event sent right away is not queued for receive()
+        self.ready[name] = None
+        channel = RpcChannel(name, parent_conn, self.logger, on_close=self._notify_ready_changed, on_message=self._notify_inbox_changed)
+        channel.subscribe("ready", lambda args, name=name: self._handle_ready(name, args))
+
         try:
+            self.spawn_times[name] = time.monotonic()
             proc.start()
+            child_conn.close()  # Only the child keeps its end, so the pipe reports EOF if the subsystem dies
             self.processes[name] = proc
-            self.pipes[name] = parent_conn
+            self.pipes[name] = channel
             self.logger.info(f"Started {name} subsystem.")
         except Exception as e:
+            child_conn.close()
+            channel.close()
+            self.ready.pop(name, None)
             self.logger.error((module_name.upper(), f"Error starting subsystem: {e}"))
 
     def stop(self, name):
@@ -54,16 +77,21 @@ class ProcessManager:
         except (BrokenPipeError, EOFError, OSError) as e:
             self.logger.warning(f"Could not send stop to {name}: {e}")
         self.processes[name].join()
+        self.pipes[name].close()
         self.logger.info(f"Stopped {name} subsystem.")
         del self.processes[name]
         del self.pipes[name]
+        self.ready.pop(name, None)
 
     def send(self, name, msg, args={}, log=True):
+        """Send a message without waiting for its reply, a reply (if any) is returned by receive."""
         if name not in self.pipes:
             self.logger.warning(f"{name} is not running.")
             return
+        if not self.is_ready(name):
+            self.logger.warning(f"{name} is still starting, {msg} will be handled once it is ready.")
         
-        self.pipes[name].send((msg, args))
+        self.pipes[name].notify(msg, args)
 
         if log:
             if args:
@@ -71,42 +99,177 @@ class ProcessManager:
             else:
                 self.logger.info(f"Sent message to {name}: {msg}")
 
+    def call(self, name, msg, args=None, timeout=None):
+        """
+        Send a request to a subsystem and return a concurrent.futures.Future for its reply.
+        Several calls can be outstanding, each reply is matched to its call by request ID.
+        Parameters:
+            timeout (float): Time (s) after which the Future fails with TimeoutError, None to wait forever.
+        """
+        if name not in self.pipes:
+            raise ConnectionError(f"{name} is not running.")
+        self.logger.info(f"Called {name}: {msg}" + (f" with args {args}" if args else ""))
+        return self.pipes[name].call(msg, args, timeout=timeout)
+
+    def request(self, name, msg, args=None, timeout=None):
+        """Call a subsystem and wait for the reply. Raises TimeoutError or ConnectionError."""
+        return self.call(name, msg, args, timeout=timeout).result()
+
+    def subscribe(self, name, msg, callback):
+        """
+        Call callback(args) for every (msg, args) event the subsystem sends on its own, instead of queueing it
+        for receive. Callbacks run on the subsystem's dispatcher thread and must not wait for that subsystem.
+        """
+        self.pipes[name].subscribe(msg, callback)
+
+    def unsubscribe(self, name, msg, callback):
+        if name in self.pipes:
+            self.pipes[name].unsubscribe(msg, callback)
+
+    def get_rpc_statistics(self):
+        """Call count, timeouts, errors and latency (s) per subsystem and message."""
+        return {name: channel.get_statistics() for name, channel in self.pipes.items()}
+
+    def _format(self, result):
+        if isinstance(result, tuple) and len(result) == 2:
+            msg, args = result
+            return {"response": result, "command": msg, "arguments": args}
+        return {"response": result}
+
     def receive(self, name, timeout=None):
-        conn = self.pipes[name]
+        """Next queued message of a subsystem (an event without subscriber or a reply to send)."""
+        channel = self.pipes[name]
+        result = channel.receive(timeout, default=_NOTHING)
 
-        try:
-            if timeout:
-                if conn.poll(timeout):
-                    result = conn.recv()
-
-                    if isinstance(result, tuple) and len(result) == 2:
-                        msg, args = result
-                        return {"response": result, "command": msg, "arguments": args}
-                    else:
-                        return {"response": result}
-                else:
-                    self.logger.warning(f"Timeout waiting for response from {name}.")
-                    return None
+        if result is _NOTHING:
+            if channel.closed.is_set():
+                self.logger.error(f"Error receiving from {name}: pipe closed")
             else:
-                result = conn.recv()
-                
-                if isinstance(result, tuple) and len(result) == 2:
-                    msg, args = result
-                    return {"response": result, "command": msg, "arguments": args}
-                else:
-                    return {"response": result}
-        except (EOFError, OSError) as e:
-            self.logger.error(f"Error receiving from {name}: {e}")
+                self.logger.warning(f"Timeout waiting for response from {name}.")
             return None
+        return self._format(result)
+
+    def receive_event(self, name, timeout=None):
+        """
+        Next queued (msg, args) message of a subsystem, formatted like receive. Anything else queued before it (e.g.
+        the reply to a send, which may be None) is skipped.
+        Returns None on timeout.
+        Raises:
+            ConnectionError: If the subsystem's pipe is closed and nothing is left to receive.
+        """
+        channel = self.pipes[name]
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            result = channel.receive(remaining, default=_NOTHING)
+            if result is _NOTHING:
+                if channel.closed.is_set():
+                    raise ConnectionError(f"{name} pipe closed")
+                return None
+            if isinstance(result, tuple) and len(result) == 2:
+                return self._format(result)
+            self.logger.debug(f"Skipped reply from {name}: {result}")
+
+    def _handle_ready(self, name, args):
+        with self._ready_changed:
+            self.ready[name] = bool(args.get("ready", True))
+            self._ready_changed.notify_all()
+        timeline = args.get("timeline")
+        if timeline is not None:
+            self.timelines[name] = timeline
+            self.logger.info(format_timeline(timeline, self.spawn_times.get(name)))
+        if not self.ready[name]:
+            self.logger.error(f"{name} started but is not ready.")
+
+    def _notify_ready_changed(self):
+        with self._ready_changed:
+            self._ready_changed.notify_all()
+
+    def is_ready(self, name):
+        return self.ready.get(name) is True
+
+    def wait_ready(self, names, required=None, timeout=None):
+        """
+        Wait for the "ready" events of the given subsystems, whichever order they arrive in.
+        Returns once all of them are ready, or after timeout (s) once the required ones are, so the others
+        can finish starting in the background.
+        Parameters:
+            names (list): Subsystems to wait for (already started).
+            required (list): Subsystems that must be ready, all of names if None.
+            timeout (float): Time (s) to wait for the non-required subsystems, None to wait for all of them.
+        Returns:
+            list: Subsystems that are not ready.
+        Raises:
+            RuntimeError: If a required subsystem exits or reports that it is not ready.
+        """
+        required = set(names if required is None else required)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = set(names)
+
+        with self._ready_changed:
+            while True:
+                for name in list(waiting):
+                    channel = self.pipes.get(name)
+                    if self.is_ready(name):
+                        waiting.discard(name)
+                    elif channel is None or channel.closed.is_set() or self.ready.get(name) is False:
+                        if name in required:
+                            raise RuntimeError(f"Required subsystem {name} failed to start")
+                        self.logger.error(f"{name} failed to start, continuing without it.")
+                        waiting.discard(name)
+                if not waiting:
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    if not waiting & required:
+                        break
+                    # Past the timeout only the required subsystems are waited for
+                    deadline = None
+                    waiting &= required
+                    continue
+                self._ready_changed.wait(remaining)
+
+        not_ready = [name for name in names if not self.is_ready(name)]
+        if not_ready:
+            self.logger.warning(f"Degraded start, not ready yet: {', '.join(not_ready)}")
+        return not_ready
         
-    def poll(self, name):
-        conn = self.pipes[name]
+    def _notify_inbox_changed(self):
+        with self._inbox_changed:
+            self._inbox_changed.notify_all()
 
-        if conn.poll():
-            response = conn.recv()
-            cmd, args = response
+    def wait(self, names=None, timeout=None):
+        """
+        Block until at least one of the subsystems has a message for receive (or its pipe closed), without polling.
+        Parameters:
+            names (list): Subsystems to wait for, all running ones if None.
+            timeout (float): Maximum time (s) to wait, None to wait forever.
+        Returns:
+            list: Subsystems with a message, empty on timeout.
+        """
+        names = list(self.pipes) if names is None else names
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._inbox_changed:
+            while True:
+                channels = [(name, self.pipes.get(name)) for name in names]
+                ready = [name for name, channel in channels if channel is not None and (channel.poll() or channel.closed.is_set())]
+                if ready:
+                    return ready
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self._inbox_changed.wait(remaining)
+
+    def poll(self, name):
+        channel = self.pipes[name]
 
-            return {"response": response, "command": cmd, "arguments": args}
+        if channel.poll():
+            result = channel.receive(0, default=_NOTHING)
+            if result is not _NOTHING:
+                return self._format(result)
 
     def shutdown(self):
         self.logger.info("Shutting down ProcessManager...")
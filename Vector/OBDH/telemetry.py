@@ -8,8 +8,13 @@ class Telemetry:
         self.running = False
 
     def collect_telemetry(self):
-        self.manager.send("ADCS", "health_check")
-        health_check_text = self.manager.receive("ADCS")["response"]
+        """Telemetry lines of the ADCS health check, None if ADCS did not answer"""
+        # Correlated call, so the reply cannot be taken by (or steal from) a phase receiving from ADCS
+        try:
+            health_check_text = self.manager.request("ADCS", "health_check", timeout=self.interval * 2)
+        except (TimeoutError, ConnectionError) as e:
+            self.manager.logger.warning(f"Telemetry sample skipped: {e}")
+            return None
 
         telemetry = ""
         for line in health_check_text.splitlines():
@@ -21,7 +26,8 @@ class Telemetry:
     def broadcast(self):
         while self.running:
             telemetry = self.collect_telemetry()
-            self.manager.send("TTC", "send_message", {"message": f"[TELEMETRY]\n{telemetry}\n"})
+            if telemetry is not None:
+                self.manager.send("TTC", "send_message", {"message": f"[TELEMETRY]\n{telemetry}\n", "priority": "telemetry"})
             time.sleep(self.interval)
 
     def start(self):
@@ -1,14 +1,122 @@
 import logging
-from multiprocessing import *
+import threading
+import time
 
 class TTCHandler(logging.Handler):
-    def __init__(self, pipe_conn):
+    """
+    Forwards log records to TT&C (which sends them to Ground) in batches, one ("log", {"messages": [...],
+    "dropped": n}) message per batch instead of one per record. A batch is sent once it holds max_records records or
+    max_bytes of text, or flush_interval s after its first record.
+    Warnings and errors always go through. Records below WARNING are sampled (sample_every[level] keeps one record
+    of that level in so many) and then rate limited by a token bucket (rate records/s on average, bursts of up to
+    burst records), so a busy phase does not flood the link. The records left out are counted, the count goes with
+    the next batch.
+    """
+    def __init__(self, pipe_conn, flush_interval=0.5, max_records=50, max_bytes=8192, rate=20.0, burst=100, sample_every=None):
         super().__init__()
         self.pipe_conn = pipe_conn
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every if sample_every is not None else {logging.DEBUG: 10}
+        self.statistics = {"forwarded": 0, "dropped": 0, "batches": 0}
+
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()  # Batches are sent in order
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_started = None  # Monotonic time of the first record (or drop) not sent yet
+        self._dropped = 0  # Records left out since the last batch
+        self._seen = {}  # Level -> records seen, for sampling
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="TT&C log forwarding", daemon=True)
+        self._thread.start()
+
+    def _admit(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        seen = self._seen.get(record.levelno, 0)
+        self._seen[record.levelno] = seen + 1
+
+        if seen % self.sample_every.get(record.levelno, 1) != 0:
+            return False
+
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
 
     def emit(self, record):
         try:
-            s = self.format(record)
-            self.pipe_conn.send(("log", {"message": s}))
+            with self._condition:
+                admitted = self._admit(record)
+
+            line = self.format(record) if admitted else None
+
+            with self._condition:
+                if admitted:
+                    self._batch.append(line)
+                    self._batch_bytes += len(line)
+                else:
+                    self._dropped += 1
+
+                if self._batch_started is None:
+                    self._batch_started = time.monotonic()
+                    self._condition.notify()
+
+                full = len(self._batch) >= self.max_records or self._batch_bytes >= self.max_bytes
+
+            if full:
+                self.flush()
         except Exception:
-            self.handleError(record)
\ No newline at end of file
+            self.handleError(record)
+
+    def flush(self):
+        """Send the records waiting, if any."""
+        with self._send_lock:
+            with self._condition:
+                batch, dropped = self._batch, self._dropped
+                self._batch, self._batch_bytes, self._dropped, self._batch_started = [], 0, 0, None
+
+            if not batch and not dropped:
+                return
+
+            try:
+                self.pipe_conn.send(("log", {"messages": batch, "dropped": dropped}))
+            except (OSError, EOFError, ValueError):
+                dropped += len(batch)  # TT&C is gone
+                batch = []
+
+            self.statistics["forwarded"] += len(batch)
+            self.statistics["dropped"] += dropped
+            self.statistics["batches"] += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (self._batch_started is None or time.monotonic() < self._batch_started + self.flush_interval):
+                    self._condition.wait(None if self._batch_started is None else self._batch_started + self.flush_interval - time.monotonic())
+
+                if self._closed:
+                    return
+
+            self.flush()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self.flush()
+        super().close()
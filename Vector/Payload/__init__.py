@@ -1,37 +1,46 @@
 from Payload.payload_controller import PayloadController
 
 
-def start(pipe, log_queue):
+def start(pipe, log_queue, timeline=None):
     log_queue.put(("Payload", "Starting Subsystem"))
-    payload_controller = PayloadController(log_queue)
+    payload_controller = PayloadController(log_queue, timeline=timeline)
+    pipe.send(("ready", {"ready": payload_controller.get_state() == "READY", "timeline": payload_controller.timeline.to_dict()}))
 
     running = True
     while running:
         line, args = pipe.recv()
         if line == "health_check":
             variable = payload_controller.health_check()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "is_ready":
             variable = payload_controller.get_state() == "READY"
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "get_state":
             variable = payload_controller.get_state()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "take_picture_raw":  # Used in payload_take_picture (OBDH, manual command)
             payload_controller.take_picture(args["dir"], args["name"])
         elif line == "take_picture":
-            payload_controller.take_picture_phase_2(args["current_yaw"])
+            payload_controller.take_picture_phase_2(args["current_yaw"], args.get("stream"))
         elif line == "get_numbers":
-            variable = payload_controller.identify_numbers_from_files()
-            pipe.send(variable)
+            variable = payload_controller.get_numbers()
+            pipe.reply(variable)
         elif line == "take_distance":
             variable = payload_controller.take_distance()
-            pipe.send(variable)
+            pipe.reply(variable)
         elif line == "detect_apriltag":
-            variable = payload_controller.detect_apriltag()
-            pipe.send(variable)
+            variable = payload_controller.detect_apriltag(args.get("yaw_rate"), args.get("stream"))
+            pipe.reply(variable)
+        elif line == "get_apriltag_timings":
+            variable = payload_controller.get_apriltag_timings()
+            pipe.reply(variable)
+        elif line == "get_apriltag_statistics":
+            variable = payload_controller.get_apriltag_statistics()
+            pipe.reply(variable)
         elif line == "phase3_take_picture":
             path = payload_controller.stereo_camera.save_image()
-            pipe.send(path)
+            pipe.reply(path)
         elif line == "stop":
             running = False
+
+    payload_controller.stop()
@@ -1,13 +1,121 @@
-from picamera2 import Picamera2
+from picamera2 import Picamera2, MappedArray
 from libcamera import controls
 import cv2
 import os
+import threading
+import time
 import numpy as np
 
+class FrameGrabber:
+    """
+    Captures frames continuously on a background thread into a double buffer, so consumers get the latest frame
+    without waiting on the sensor.
+    Each frame is copied straight out of the camera's DMA buffer into the back buffer, which is then swapped with
+    the front buffer under the lock. Readers copy (a view of) the front buffer under the same lock, so the thread
+    never writes a buffer that is being read, and a frame returned to a caller is never overwritten.
+    Timestamps are the sensor timestamps (start of exposure, s on the monotonic clock), so frames of two cameras
+    can be matched.
+    """
+    def __init__(self, picam2, streams=("main", "lores"), name="camera"):
+        self.picam2 = picam2
+        self.streams = tuple(streams)
+        self.name = name
+        self.sequence = 0  # Number of frames captured, 0 until the first one
+        self.timestamp = None
+        self.errors = 0
+        self._front = {}  # stream -> array
+        self._back = {}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name} grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                request = self.picam2.capture_request()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error capturing frame from {self.name}: {e}")
+                self._stop.wait(0.1)
+                continue
+
+            try:
+                metadata = request.get_metadata()
+                for stream in self.streams:
+                    with MappedArray(request, stream) as mapped:
+                        buffer = self._back.get(stream)
+                        if buffer is None or buffer.shape != mapped.array.shape or buffer.dtype != mapped.array.dtype:
+                            buffer = self._back[stream] = np.empty_like(mapped.array)
+                        np.copyto(buffer, mapped.array)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error reading frame from {self.name}: {e}")
+                continue
+            finally:
+                request.release()
+
+            timestamp = metadata["SensorTimestamp"] / 1e9 if "SensorTimestamp" in metadata else time.monotonic()
+            with self._condition:
+                self._front, self._back = self._back, self._front
+                self.sequence += 1
+                self.timestamp = timestamp
+                self._condition.notify_all()
+
+    def get_latest(self, stream="main", newer_than=0, timeout=1.0, view=None):
+        """
+        Copy of the latest frame of a stream as (frame, timestamp, sequence), waiting up to timeout (s) for a frame
+        with a sequence number above newer_than. view(frame) selects the part of the buffer to copy.
+        Returns None on timeout or if the grabber is stopped.
+        """
+        if stream not in self.streams:
+            raise ValueError(f"{self.name} does not grab the {stream} stream")
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.sequence <= newer_than:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    return None
+                self._condition.wait(remaining)
+            frame = self._front[stream]
+            return (view(frame) if view is not None else frame).copy(), self.timestamp, self.sequence
+
+    def get_statistics(self):
+        """Frames captured, capture rate (fps) since start and capture errors."""
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        return {
+            "frames": self.sequence,
+            "fps": self.sequence / elapsed if elapsed > 0 else 0.0,
+            "errors": self.errors
+        }
+
 class Camera:
-    def __init__(self, camera_index=0, width=1920, height=1080, framerate=30):
+    def __init__(self, camera_index=0, width=1920, height=1080, framerate=30, lores_width=640, lores_height=480):
         self.camera_index = camera_index
         self.is_initialized = False
+        self.framerate = framerate
+        self.grabber = None
+        self.sizes = {"main": (width, height), "lores": (lores_width, lores_height)}
+        self.camera_params = None
         
         try:
             self.picam2 = Picamera2(camera_index)
@@ -15,7 +123,8 @@ class Camera:
             # Create configuration
             config = self.picam2.create_preview_configuration(
                 main={"size": (width, height)},
-                lores={"size": (640, 480)},
+                # YUV420, so get_gray_frame can use the Y plane as is
+                lores={"size": (lores_width, lores_height), "format": "YUV420"},
                 controls={
                     "FrameDurationLimits": (1_000_000 // framerate, 1_000_000 // framerate),
                     "ExposureTime": 0,
@@ -73,15 +182,84 @@ class Camera:
                 self.camera_params = None
                 self.matrix = None
 
-    def get_frame(self):
+    def start_grabbing(self, streams=("main", "lores")):
+        """Capture continuously in the background, get_frame() and get_gray_frame() then return the latest frame."""
+        if not self.is_initialized or self.picam2 is None:
+            return False
+        if self.grabber is None:
+            self.grabber = FrameGrabber(self.picam2, streams, name=f"camera {self.camera_index}")
+        self.grabber.start()
+        return True
+
+    def stop_grabbing(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+
+    def is_grabbing(self, stream=None):
+        """Whether the background grabber is running (and grabs the given stream)."""
+        return self.grabber is not None and self.grabber.is_running() and (stream is None or stream in self.grabber.streams)
+
+    def get_latest(self, stream="main", gray=False, newer_than=0, timeout=1.0):
+        """
+        Latest grabbed frame of a stream as (frame, timestamp, sequence), see FrameGrabber.get_latest.
+        With gray, only the Y plane of a lores frame is copied, a main frame is converted from BGR.
+        """
+        if not self.is_grabbing(stream):
+            return None
+        view = self._y_plane if gray and stream == "lores" else None
+        latest = self.grabber.get_latest(stream, newer_than=newer_than, timeout=timeout, view=view)
+        if latest is not None and gray and stream != "lores":
+            frame, timestamp, sequence = latest
+            latest = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), timestamp, sequence
+        return latest
+
+    def _y_plane(self, frame):
+        width, height = self.sizes["lores"]
+        return frame[:height, :width]  # Rows below are the U and V planes, columns past width are stride padding
+
+    def get_frame(self, stream="main"):
         if not self.is_initialized or self.picam2 is None:
             return None
+        if self.is_grabbing(stream):
+            latest = self.get_latest(stream)
+            return latest[0] if latest is not None else None
         try:
-            return self.picam2.capture_array()
+            return self.picam2.capture_array(stream)
         except Exception as e:
             print(f"Error capturing frame from camera {self.camera_index}: {e}")
             return None
 
+    def get_gray_frame(self, stream="lores"):
+        """
+        Grayscale frame of a stream. For lores this is the Y plane of the YUV420 frame, a view of the captured
+        array (no conversion), or a copy of just the Y plane while grabbing. The main stream is converted from BGR.
+        """
+        if self.is_grabbing(stream):
+            latest = self.get_latest(stream, gray=True)
+            return latest[0] if latest is not None else None
+        frame = self.get_frame(stream)
+        if frame is None:
+            return None
+        if stream == "lores":
+            return self._y_plane(frame)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def get_stream_scale(self, stream="main"):
+        """Scale (x, y) of a stream relative to the main stream, which the calibration was made at."""
+        width, height = self.sizes[stream]
+        main_width, main_height = self.sizes["main"]
+        return width / main_width, height / main_height
+
+    def get_camera_params(self, stream="main"):
+        """Camera intrinsics (fx, fy, cx, cy) scaled to the resolution of a stream, None without calibration."""
+        if self.camera_params is None:
+            return None
+        scale_x, scale_y = self.get_stream_scale(stream)
+        fx, fy, cx, cy = self.camera_params
+        # Pixel centers are at +0.5, so the principal point scales around -0.5
+        return (fx * scale_x, fy * scale_y, (cx + 0.5) * scale_x - 0.5, (cy + 0.5) * scale_y - 0.5)
+
     def show_frame(self):
         frame = self.get_frame()
         if frame is not None:
@@ -92,6 +270,7 @@ class Camera:
     
     def stop(self):
         """Stop the camera and clean up resources"""
+        self.stop_grabbing()
         if self.is_initialized and self.picam2 is not None:
             try:
                 self.picam2.stop()
@@ -3,9 +3,32 @@ import cv2
 import pytesseract
 import numpy as np
 import glob
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+try:
+    from Payload.ocr_cache import OcrCache, content_hash
+except ImportError:  # Run as a script (see __main__)
+    from ocr_cache import OcrCache, content_hash
+
+FOV = 75  # deg, horizontal field of view of the cameras
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Leaves a core for the capture
+TESSERACT_CONFIG = '--oem 3 --psm 8 outputbase digits'
+SELECTION_MARGIN = 1.0  # deg, added to the half width of a candidate when matching it to a number already read
+DUPLICATE_YAW = 0.5  # deg, pictures closer than this with near identical hashes are the same view
+DUPLICATE_HASH_DISTANCE = 3  # bits out of 64
+
+def to_gray(img):
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
 
 def preprocess_image(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(img)
     w, h = gray.shape[1], gray.shape[0]
     _, thresh_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
 
@@ -82,24 +105,253 @@ def extract_digits(img):
 
     return numbers, output
 
-def recognize_number(image):
+def prepare_roi(image, number):
+    """Crop of a candidate number, padded, enlarged and binarised for tesseract"""
+    x, y, w, h, cX, cY, labels = number
+    roi = image[y:y + h, x:x + w]
+
+    roi = cv2.copyMakeBorder(roi, 5, 5, 5, 5, cv2.BORDER_CONSTANT, value=(0, 0, 0))  # Padding
+    roi = cv2.resize(roi, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    roi = cv2.GaussianBlur(roi, (3, 3), 0)
+    _, roi = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    return roi
+
+def read_digits(roi):
+    # Perform OCR
+    text = pytesseract.image_to_string(roi, config=TESSERACT_CONFIG)
+    return ''.join(filter(str.isdigit, text)).strip()  # Keep only digits
+
+def is_valid_reading(text):
+    return len(text) > 0 and len(text) < 4  # Filter out empty or too long results
+
+class DigitRecogniser:
+    """Reads the digits of a ROI prepared by prepare_roi (white digits on black), "" if it cannot"""
+    name = None
+
+    def read(self, roi):
+        raise NotImplementedError
+
+    def signature(self):
+        """Identifies the configuration in OCR cache keys, readings cached under another signature are not reused"""
+        return self.name
+
+class TesseractRecogniser(DigitRecogniser):
+    """tesseract in single word mode restricted to digits, one subprocess per ROI"""
+    name = "tesseract"
+
+    def __init__(self):
+        self._signature = None
+
+    def read(self, roi):
+        return read_digits(roi)
+
+    def signature(self):
+        if self._signature is None:
+            try:
+                version = pytesseract.get_tesseract_version()
+            except Exception:
+                version = "unknown"
+            self._signature = f"{self.name} {version} {TESSERACT_CONFIG}"
+        return self._signature
+
+class TemplateRecogniser(DigitRecogniser):
+    """
+    In-process reader for the two-digit targets. The ROI is split into digits by connected components and each
+    digit is classified by k-nearest neighbours on HOG features (computed with NumPy, 8 px cells, 2x2 cell blocks,
+    9 orientation bins), against templates rendered from the OpenCV fonts
+    (and labelled samples added with fit()). A digit far from every template makes the whole reading empty, as a
+    failed tesseract reading would be.
+    """
+    name = "template"
+    DIGIT_SIZE = (24, 32)  # Width, height of a normalised digit
+    CELL_SIZE = 8
+    ORIENTATIONS = 9
+    FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX, cv2.FONT_HERSHEY_TRIPLEX, cv2.FONT_HERSHEY_PLAIN)
+
+    def __init__(self, k=3, samples_path=None, rejection_factor=1.35):
+        self.k = k
+        self._signature = None
+        self.features, self.labels, fonts = self._render_templates()
+
+        # A digit is accepted if it is no further from the templates than the fonts are from each other (95th
+        # percentile of the distance from a template to the same digit in the other fonts), with a margin.
+        # On the saved phase 2 pictures this rejects the background blobs, which are mostly 1.7 or more away.
+        font_distances = []
+        for i in range(len(self.labels)):
+            others = (self.labels == self.labels[i]) & (fonts != fonts[i])
+            font_distances.append(np.linalg.norm(self.features[others] - self.features[i], axis=1).min())
+        self.max_distance = rejection_factor * np.percentile(font_distances, 95)
+
+        if samples_path is not None and os.path.exists(samples_path):
+            with np.load(samples_path) as samples:
+                self.features = np.vstack((self.features, samples["features"]))
+                self.labels = np.concatenate((self.labels, samples["labels"]))
+
+    def _render_templates(self):
+        features, labels, fonts = [], [], []
+        for font in self.FONTS:
+            for thickness in (8, 14, 20):
+                for angle in (-6, 0, 6):
+                    for digit in range(10):
+                        canvas = np.zeros((160, 160), np.uint8)
+                        cv2.putText(canvas, str(digit), (30, 130), font, 4, 255, thickness)
+                        rotation = cv2.getRotationMatrix2D((80, 80), angle, 1.0)
+                        canvas = cv2.warpAffine(canvas, rotation, (160, 160))
+                        _, canvas = cv2.threshold(cv2.GaussianBlur(canvas, (5, 5), 0), 127, 255, cv2.THRESH_BINARY)
+                        digits = self.segment(canvas)
+                        if len(digits) == 1:
+                            features.append(self.describe(digits[0]))
+                            labels.append(digit)
+                            fonts.append(font)
+        return np.array(features, np.float32), np.array(labels), np.array(fonts)
+
+    def segment(self, roi):
+        """Normalised digit images of a ROI, left to right"""
+        count, _, stats, _ = cv2.connectedComponentsWithStats(roi, 8, cv2.CV_32S)
+        components = [stats[i] for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] > 20]
+        if not components:
+            return []
+        tallest = max(component[cv2.CC_STAT_HEIGHT] for component in components)
+        # Digits are about as tall as the tallest component, smaller ones are noise
+        components = sorted((component for component in components if component[cv2.CC_STAT_HEIGHT] >= 0.5 * tallest), key=lambda component: component[cv2.CC_STAT_LEFT])
+
+        digits = []
+        width, height = self.DIGIT_SIZE
+        for x, y, w, h, _ in components:
+            scale = min((height - 4) / h, (width - 4) / w)
+            digit = cv2.resize(roi[y:y + h, x:x + w], (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+            canvas = np.zeros((height, width), np.uint8)
+            top, left = (height - digit.shape[0]) // 2, (width - digit.shape[1]) // 2
+            canvas[top:top + digit.shape[0], left:left + digit.shape[1]] = digit
+            digits.append(canvas)
+        return digits
+
+    def describe(self, digit):
+        """HOG features of a normalised digit"""
+        image = digit.astype(np.float32) / 255
+        gx = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=1)
+        gy = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=1)
+        magnitude, angle = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+        bins = (angle % 180 * self.ORIENTATIONS / 180).astype(int) % self.ORIENTATIONS
+
+        rows, columns = np.indices(image.shape)
+        histograms = np.zeros((image.shape[0] // self.CELL_SIZE, image.shape[1] // self.CELL_SIZE, self.ORIENTATIONS), np.float32)
+        np.add.at(histograms, (rows // self.CELL_SIZE, columns // self.CELL_SIZE, bins), magnitude)
+
+        blocks = [histograms[y:y + 2, x:x + 2].ravel() for y in range(histograms.shape[0] - 1) for x in range(histograms.shape[1] - 1)]
+        return np.concatenate([block / (np.linalg.norm(block) + 1e-6) for block in blocks])
+
+    def classify(self, features):
+        """(digit, distance to the nearest template)"""
+        distances = np.linalg.norm(self.features - features, axis=1)
+        nearest = np.argsort(distances)[:self.k]
+        votes = np.bincount(self.labels[nearest], minlength=10)
+        return int(np.argmax(votes)), float(distances[nearest[0]])
+
+    def read(self, roi):
+        digits = self.segment(roi)
+        if not digits or len(digits) > 3:
+            return ""
+        text = ""
+        for digit in digits:
+            label, distance = self.classify(self.describe(digit))
+            if distance > self.max_distance:
+                return ""
+            text += str(label)
+        return text
+
+    def signature(self):
+        if self._signature is None:
+            self._signature = f"{self.name} k={self.k} max_distance={self.max_distance:.6f} {content_hash(self.features)}{content_hash(self.labels)}"
+        return self._signature
+
+    def fit(self, rois, texts, samples_path=None):
+        """Add labelled ROIs (e.g. from the competition targets) to the templates, optionally saving them for the next runs"""
+        features, labels = [], []
+        for roi, text in zip(rois, texts):
+            digits = self.segment(roi)
+            if len(digits) != len(text):
+                continue
+            features.extend(self.describe(digit) for digit in digits)
+            labels.extend(int(character) for character in text)
+        if not features:
+            return 0
+        features, labels = np.array(features, np.float32), np.array(labels)
+        self.features = np.vstack((self.features, features))
+        self.labels = np.concatenate((self.labels, labels))
+        self._signature = None
+        if samples_path is not None:
+            if os.path.exists(samples_path):
+                with np.load(samples_path) as samples:
+                    features = np.vstack((samples["features"], features))
+                    labels = np.concatenate((samples["labels"], labels))
+            np.savez(samples_path, features=features, labels=labels)
+        return len(labels)
+
+RECOGNISERS = {recogniser.name: recogniser for recogniser in (TesseractRecogniser, TemplateRecogniser)}
+DEFAULT_RECOGNISER = "tesseract"
+_recognisers = {}
+
+def get_recogniser(name=None):
+    """Shared instance of a recogniser by name (templates are only built once per process)"""
+    name = name or DEFAULT_RECOGNISER
+    if name not in _recognisers:
+        if name not in RECOGNISERS:
+            raise ValueError(f"Unknown recogniser {name}, expected one of {', '.join(RECOGNISERS)}")
+        _recognisers[name] = RECOGNISERS[name]()
+    return _recognisers[name]
+
+_ocr_caches = {}
+
+def get_ocr_cache(path):
+    """Shared OcrCache of a path, one per process"""
+    if path not in _ocr_caches:
+        _ocr_caches[path] = OcrCache(path)
+    return _ocr_caches[path]
+
+def read_roi(roi, recogniser=None, cache_path=None):
+    """Digits of a prepared ROI, looked up by content in the OCR cache at cache_path (if any) before reading them"""
+    recogniser = get_recogniser(recogniser)
+    if cache_path is None:
+        return recogniser.read(roi)
+    cache = get_ocr_cache(cache_path)
+    key = OcrCache.key("roi", content_hash(roi), recogniser.signature())
+    text = cache.get(key)
+    if text is None:
+        text = recogniser.read(roi)
+        cache.put(key, text)
+    return text
+
+def image_cache_key(data, recogniser=None):
+    """OCR cache key of an image file's bytes"""
+    return OcrCache.key("image", content_hash(data), get_recogniser(recogniser).signature())
+
+def _native(value):
+    return value.item() if hasattr(value, "item") else value
+
+def to_cache_entry(numbers, width_in_pixels):
+    """JSON form of get_numbers() results: the digits read and the geometry of their components"""
+    return {
+        "width": int(width_in_pixels),
+        "numbers": [[text, [_native(value) for value in number[:6]] + [[int(label) for label in number[6]]]] for text, number in numbers]
+    }
+
+def from_cache_entry(entry):
+    return [(text, tuple(number)) for text, number in entry["numbers"]], entry["width"]
+
+def recognize_number(image, recogniser=None, cache_path=None, select=None):
+    """select(numbers, width_in_pixels), if given, tells which candidate numbers are worth reading"""
     numbers, output_img = extract_digits(image)
     recognized_numbers = []
+    if select is not None:
+        numbers = [number for number, selected in zip(numbers, select(numbers, image.shape[1])) if selected]
 
     for number in numbers:
         x, y, w, h, cX, cY, labels = number
-        roi = image[y:y + h, x:x + w]
+        text = read_roi(prepare_roi(image, number), recogniser, cache_path)
 
-        roi = cv2.copyMakeBorder(roi, 5, 5, 5, 5, cv2.BORDER_CONSTANT, value=(0, 0, 0))  # Padding
-        roi = cv2.resize(roi, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-        roi = cv2.GaussianBlur(roi, (3, 3), 0)
-        _, roi = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        # Perform OCR
-        text = pytesseract.image_to_string(roi, config='--oem 3 --psm 8 outputbase digits')
-        text = ''.join(filter(str.isdigit, text)).strip()  # Keep only digits
-
-        if len(text) > 0 and len(text) < 4:  # Filter out empty or too long results
+        if is_valid_reading(text):
             recognized_numbers.append((text, (x, y, w, h, cX, cY, labels)))
 
             # Draw the bounding box and label on the output image
@@ -113,14 +365,30 @@ def recognize_number(image):
 
     return recognized_numbers, output_img
 
-def get_numbers(image_path, show_output=False):
-    img = cv2.imread(image_path)
+def get_numbers(image_path, show_output=False, recogniser=None, cache_path=None, select=None):
+    # With a cache, an image already identified costs a read and a hash of the file
+    cache = get_ocr_cache(cache_path) if cache_path is not None and not show_output else None
+    if cache is not None:
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        key = image_cache_key(data, recogniser)
+        entry = cache.get(key)
+        if entry is not None:
+            return from_cache_entry(entry)
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+    else:
+        img = cv2.imread(image_path)
     width_in_pixels = img.shape[1] if img is not None else 0
 
     if img is None:
         raise FileNotFoundError(f"The image file '{image_path}' was not found or could not be loaded.")
     processed = preprocess_image(img)
-    numbers, output = recognize_number(processed)
+    numbers, output = recognize_number(processed, recogniser, cache_path, select)
+    if cache is not None and select is None:  # Only complete results are cached
+        cache.put(key, to_cache_entry(numbers, width_in_pixels))
 
     if show_output:
         #print(f"Recognized Number: {[number[1] for number in numbers]}")
@@ -146,26 +414,123 @@ def clean_numbers_orientations(numbers_orientations):
     # Return sorted by degree
     return dict(sorted(final_orientations.items()))
 
-def identify_numbers_from_files(image_paths):
-    try:
-        FOV = 75
+def locate_numbers(numbers, width_in_pixels, yaw):
+    """(degree, digits, offset) of each number recognised in a picture taken at yaw (deg)"""
+    located = []
+    for number in numbers:
+        x, y, w, h, cX, cY, labels = number[1]
+        digits = int(number[0])
+        offset = cX - (width_in_pixels / 2)
+        degrees_per_pixel = FOV / width_in_pixels
+        angular_offset = offset * degrees_per_pixel
+        degree = (yaw + angular_offset) % 360  # Normalize to [0, 360)
+        located.append((degree, digits, offset))
+    return located
+
+def _angle_between(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+def difference_hash(gray):
+    """64 bit perceptual hash of a grayscale picture (signs of the horizontal gradients of a 9x8 thumbnail)"""
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (thumbnail[:, 1:] - thumbnail[:, :-1] > 2).ravel()  # Flat areas hash as 0 rather than as noise
+    return int(np.packbits(bits).view(">u8")[0])
+
+class FrameSelector:
+    """
+    Decides which phase 2 pictures, and which candidate numbers in them, still need OCR.
+    Pictures are taken every 10 deg of yaw with a FOV of 75 deg, so each number is in about seven of them, and
+    clean_numbers_orientations only keeps its most centred reading. Once a number has been read, a candidate at the
+    same orientation (from yaw, FOV and its position) that is no more centred than that reading cannot change the
+    result and is not read again. A picture whose candidates are all resolved needs no OCR at all, and a picture
+    with the same perceptual hash at the same yaw as one already seen (e.g. the rotation stalled) is not even
+    preprocessed.
+    The selection only ever skips readings that would lose to one already made, so it depends on the order the
+    readings complete in but not the final numbers.
+    """
+    def __init__(self, fov=FOV, margin=SELECTION_MARGIN, duplicate_yaw=DUPLICATE_YAW, duplicate_hash_distance=DUPLICATE_HASH_DISTANCE):
+        self.fov = fov
+        self.margin = margin
+        self.duplicate_yaw = duplicate_yaw
+        self.duplicate_hash_distance = duplicate_hash_distance
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._resolved = []  # (degree, abs angular offset) of the two digit numbers read
+            self._hashes = []  # (yaw, hash) of the pictures seen
+            self.statistics = {"pictures": 0, "duplicates": 0, "resolved_pictures": 0, "candidates": 0, "skipped_candidates": 0}
 
+    def is_duplicate(self, gray, yaw):
+        """Whether a picture shows the same view as one already seen (the first such picture is recorded)"""
+        picture_hash = difference_hash(gray)
+        with self._lock:
+            self.statistics["pictures"] += 1
+            for seen_yaw, seen_hash in self._hashes:
+                if _angle_between(yaw, seen_yaw) <= self.duplicate_yaw and bin(picture_hash ^ seen_hash).count("1") <= self.duplicate_hash_distance:
+                    self.statistics["duplicates"] += 1
+                    return True
+            self._hashes.append((yaw, picture_hash))
+        return False
+
+    def select(self, numbers, width_in_pixels, yaw):
+        """Which candidate numbers (extract_digits) of a picture taken at yaw (deg) still need reading"""
+        degrees_per_pixel = self.fov / width_in_pixels
+        selected = []
+        with self._lock:
+            for x, y, w, h, cX, cY, labels in numbers:
+                angular_offset = abs(cX - width_in_pixels / 2) * degrees_per_pixel
+                degree = (yaw + (cX - width_in_pixels / 2) * degrees_per_pixel) % 360
+                tolerance = w / 2 * degrees_per_pixel + self.margin
+                resolved = any(_angle_between(degree, resolved_degree) <= tolerance and resolved_offset <= angular_offset
+                               for resolved_degree, resolved_offset in self._resolved)
+                selected.append(not resolved)
+            self.statistics["candidates"] += len(selected)
+            self.statistics["skipped_candidates"] += selected.count(False)
+            if numbers and not any(selected):
+                self.statistics["resolved_pictures"] += 1
+        return selected
+
+    def record(self, located, width_in_pixels):
+        """Add the locate_numbers() results of a picture"""
+        degrees_per_pixel = self.fov / width_in_pixels
+        with self._lock:
+            for degree, digits, offset in located:
+                if len(str(digits)) == 2:  # The only readings clean_numbers_orientations keeps
+                    self._resolved.append((degree, abs(offset) * degrees_per_pixel))
+
+    def get_statistics(self):
+        with self._lock:
+            return dict(self.statistics)
+
+def identify_numbers_in_image(img, yaw, recogniser=None, cache_path=None, selector=None):
+    """locate_numbers() of a picture in memory, reading only the numbers the FrameSelector (if any) selects"""
+    if selector is not None and selector.is_duplicate(to_gray(img), yaw):
+        return []
+    select = (lambda numbers, width_in_pixels: selector.select(numbers, width_in_pixels, yaw)) if selector is not None else None
+    numbers, _ = recognize_number(preprocess_image(img), recogniser, cache_path, select)
+    located = locate_numbers(numbers, img.shape[1], yaw)
+    if selector is not None:
+        selector.record(located, img.shape[1])
+    return located
+
+def identify_numbers_from_files(image_paths, recogniser=None, cache_path=None, selector=None):
+    try:
         numbers_orientations = {}  # Store orientations
 
         for image_path in image_paths:
-            numbers, width_in_pixels = (get_numbers(image_path))
-
-            for number in numbers:
-                x, y, w, h, cX, cY, labels = number[1]
-                ground_truth = int(image_path.split('images/phase2/')[1].split('.')[0].split('_')[0])  # Extract ground truth from filename
-                if ground_truth < 0 or ground_truth > 360:
-                    print(f"Invalid ground truth value {ground_truth} in file {image_path}. Skipping this image.")
-                    continue
-                digits = int(number[0])
-                offset = cX - (width_in_pixels / 2)
-                degrees_per_pixel = FOV / width_in_pixels
-                angular_offset = offset * degrees_per_pixel
-                degree = (ground_truth + angular_offset) % 360  # Normalize to [0, 360)
+            ground_truth = int(image_path.split('images/phase2/')[1].split('.')[0].split('_')[0])  # Extract ground truth from filename
+            if ground_truth < 0 or ground_truth > 360:
+                print(f"Invalid ground truth value {ground_truth} in file {image_path}. Skipping this image.")
+                continue
+            select = (lambda numbers, width, yaw=ground_truth: selector.select(numbers, width, yaw)) if selector is not None else None
+            numbers, width_in_pixels = (get_numbers(image_path, recogniser=recogniser, cache_path=cache_path, select=select))
+            located = locate_numbers(numbers, width_in_pixels, ground_truth)
+            if selector is not None:
+                selector.record(located, width_in_pixels)
+
+            for degree, digits, offset in located:
                 numbers_orientations[(round(degree))] = (digits, offset)
 
         cleaned_numbers_orientations = clean_numbers_orientations(numbers_orientations)
@@ -173,4 +538,377 @@ def identify_numbers_from_files(image_paths):
         print(f"Error processing images: {e}")
         cleaned_numbers_orientations = {}
 
-    return cleaned_numbers_orientations
\ No newline at end of file
+    return cleaned_numbers_orientations
+
+def find_number_rois(image):
+    """
+    First half of recognize_number for the parallel engine: the candidate numbers of an image (or image file) and
+    their prepared ROIs, as (numbers, rois, width_in_pixels, seconds taken).
+    """
+    start = time.monotonic()
+    img = cv2.imread(image) if isinstance(image, str) else image
+    if img is None:
+        raise FileNotFoundError(f"The image file '{image}' was not found or could not be loaded.")
+    processed = preprocess_image(img)
+    numbers, _ = extract_digits(processed)
+    rois = [prepare_roi(processed, number) for number in numbers]
+    return numbers, rois, img.shape[1], time.monotonic() - start
+
+def read_digits_timed(roi, recogniser=None, cache_path=None):
+    start = time.monotonic()
+    text = read_roi(roi, recogniser, cache_path)
+    return text, time.monotonic() - start
+
+def _warm_up(recogniser=None):
+    get_recogniser(recogniser)
+    return os.getpid()
+
+class NumberIdentificationEngine:
+    """
+    Number identification on a bounded process pool. Each image is preprocessed in a worker, then each of its
+    candidate ROIs is read by tesseract in a worker, so the images and the numbers within an image spread over
+    the cores. Results are merged in submission order, so the output is identical to the serial path
+    (identify_numbers_from_files, identify_numbers_in_image), which stays the fallback if the pool breaks.
+    With a cache_path, image files already identified are answered from the OCR cache without going to the pool,
+    and the workers look up each ROI there before reading it.
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, recogniser=DEFAULT_RECOGNISER, cache_path=None):
+        self.workers = workers
+        self.recogniser = recogniser
+        self.cache_path = cache_path
+        # Workers fork from a server process that imported this module once, not from the multithreaded Payload
+        context = mp.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self._lock = threading.Lock()
+        self.timings = []  # Per image: name, preprocess, ocr (s of tesseract, summed over the ROIs), rois, total (s)
+
+    def warm_up(self):
+        """Start the workers now rather than on the first image"""
+        for future in [self._pool.submit(_warm_up, self.recogniser) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, image, yaw, name=None, cache_key=None, selector=None):
+        """
+        Identify the numbers in an image (array or file path) taken at yaw (deg).
+        Returns a Future of the locate_numbers() list. The recognised numbers are stored in the OCR cache under
+        cache_key, if given. With a FrameSelector, only the candidate numbers it selects are read.
+        """
+        result = Future()
+        submitted = time.monotonic()
+        name = name if name is not None else (image if isinstance(image, str) else f"picture at {yaw}")
+        if selector is not None and not isinstance(image, str) and selector.is_duplicate(to_gray(image), yaw):
+            result.set_result([])
+            return result
+
+        def read_rois(stage):
+            try:
+                numbers, rois, width_in_pixels, preprocess_time = stage.result()
+                if selector is not None:
+                    # Selected once the ROIs are ready, by then more of the earlier pictures have been read
+                    selected = selector.select(numbers, width_in_pixels, yaw)
+                    numbers = [number for number, keep in zip(numbers, selected) if keep]
+                    rois = [roi for roi, keep in zip(rois, selected) if keep]
+                readings = [self._pool.submit(read_digits_timed, roi, self.recogniser, self.cache_path) for roi in rois]
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            remaining = [len(readings)]
+
+            def assemble(_=None):
+                with self._lock:
+                    remaining[0] -= 1
+                    if remaining[0] > 0:
+                        return
+                try:
+                    texts = [reading.result() for reading in readings]
+                except BaseException as e:
+                    result.set_exception(e)
+                    return
+                recognized = [(text, number) for number, (text, _) in zip(numbers, texts) if is_valid_reading(text)]
+                with self._lock:
+                    self.timings.append({"image": name, "preprocess": preprocess_time, "ocr": sum(elapsed for _, elapsed in texts),
+                                         "rois": len(rois), "total": time.monotonic() - submitted})
+                if cache_key is not None and self.cache_path is not None and selector is None:
+                    get_ocr_cache(self.cache_path).put(cache_key, to_cache_entry(recognized, width_in_pixels))
+                located = locate_numbers(recognized, width_in_pixels, yaw)
+                if selector is not None:
+                    selector.record(located, width_in_pixels)
+                result.set_result(located)
+
+            if not readings:
+                remaining[0] = 1
+                assemble()
+            for reading in readings:
+                reading.add_done_callback(assemble)
+
+        self._pool.submit(find_number_rois, image).add_done_callback(read_rois)
+        return result
+
+    def identify_files(self, image_paths):
+        """
+        Parallel identify_numbers_from_files. Raises BrokenProcessPool if the pool is unusable, so the caller can
+        fall back to the serial path.
+        """
+        futures = []
+        for image_path in image_paths:
+            ground_truth = int(image_path.split('images/phase2/')[1].split('.')[0].split('_')[0])  # Extract ground truth from filename
+            if ground_truth < 0 or ground_truth > 360:
+                print(f"Invalid ground truth value {ground_truth} in file {image_path}. Skipping this image.")
+                continue
+            futures.append(self._submit_file(image_path, ground_truth))
+
+        numbers_orientations = {}
+        try:
+            # Merged in order, later images overwrite earlier ones at the same degree as in the serial path
+            for future in futures:
+                for degree, digits, offset in future.result():
+                    numbers_orientations[(round(degree))] = (digits, offset)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            print(f"Error processing images: {e}")
+            return {}
+
+        return clean_numbers_orientations(numbers_orientations)
+
+    def _submit_file(self, image_path, yaw):
+        if self.cache_path is None:
+            return self.submit(image_path, yaw)
+        try:
+            with open(image_path, "rb") as f:
+                key = image_cache_key(f.read(), self.recogniser)
+        except OSError:
+            return self.submit(image_path, yaw)  # Fails in the worker as in the serial path
+        entry = get_ocr_cache(self.cache_path).get(key)
+        if entry is None:
+            return self.submit(image_path, yaw, cache_key=key)
+        result = Future()
+        result.set_result(locate_numbers(*from_cache_entry(entry), yaw))
+        return result
+
+    def get_timings(self):
+        with self._lock:
+            return list(self.timings)
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+class NumberPipeline:
+    """
+    Identifies the numbers in the phase 2 pictures while the satellite is still rotating, instead of saving them as
+    JPEGs and decoding them again once the rotation is over.
+    submit() hands a picture and its yaw to the NumberIdentificationEngine (or, without one, to worker threads
+    running the serial path) and, given a path, queues it for saving as JPEG on a separate writer thread. Neither
+    holds up the capture. result() waits for the pictures still being identified and merges them in capture order.
+    With select_frames, a FrameSelector skips the numbers already read from a more centred view.
+    """
+    def __init__(self, engine=None, workers=2, recogniser=None, cache_path=None, select_frames=True):
+        self.engine = engine
+        self.recogniser = engine.recogniser if engine is not None else recogniser
+        self.cache_path = engine.cache_path if engine is not None else cache_path
+        self.selector = FrameSelector() if select_frames else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Number identification") if engine is None else None
+        self._write_queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pictures = []  # [gray, yaw, future] in capture order
+        self._durations = []  # s from submission to numbers, per picture
+        self.write_errors = 0
+
+        threading.Thread(target=self._write, name="Picture writer", daemon=True).start()
+
+    @property
+    def submitted(self):
+        return len(self._pictures)
+
+    def submit(self, image, yaw, path=None):
+        """Queue a picture taken at yaw (deg). Only its grayscale version is kept for OCR."""
+        gray, yaw = to_gray(image), float(yaw)
+        submitted = time.monotonic()
+        try:
+            future = (self.engine.submit(gray, yaw, selector=self.selector) if self.engine is not None else
+                      self._executor.submit(identify_numbers_in_image, gray, yaw, self.recogniser, self.cache_path, self.selector))
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f"Number identification engine unavailable, identifying serially later: {e}")
+            future = Future()
+            future.set_exception(e)
+        with self._lock:
+            self._pictures.append([gray, yaw, future])
+            durations = self._durations
+        future.add_done_callback(lambda _: durations.append(time.monotonic() - submitted))
+        if path is not None:
+            self._write_queue.put((path, image))
+
+    def _write(self):
+        while True:
+            path, image = self._write_queue.get()
+            try:
+                if not cv2.imwrite(path, image):
+                    raise OSError("imwrite failed")
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Failed to save {path}: {e}")
+            finally:
+                self._write_queue.task_done()
+
+    def result(self, timeout=None, partial=False):
+        """
+        Numbers by orientation (see clean_numbers_orientations). None if pictures are still being identified after
+        timeout (s), unless partial, then the numbers identified so far.
+        Pictures the engine failed on are identified serially here.
+        """
+        with self._lock:
+            pictures = list(self._pictures)
+        _, not_done = wait([future for _, _, future in pictures], timeout)
+        if not_done and not partial:
+            return None
+
+        numbers_orientations = {}
+        for picture in pictures:
+            gray, yaw, future = picture
+            if not future.done():
+                continue
+            try:
+                located = future.result()
+            except Exception as e:
+                print(f"Error identifying numbers in picture at {yaw}, retrying serially: {e}")
+                try:
+                    located = identify_numbers_in_image(gray, yaw, self.recogniser, self.cache_path)
+                except Exception as e:
+                    print(f"Error identifying numbers in picture at {yaw}: {e}")
+                    located = []
+                picture[2] = Future()
+                picture[2].set_result(located)
+            for degree, digits, offset in located:
+                numbers_orientations[round(degree)] = (digits, offset)
+
+        return clean_numbers_orientations(numbers_orientations)
+
+    def wait_written(self):
+        """Block until the queued JPEGs are on disk"""
+        self._write_queue.join()
+
+    def reset(self):
+        """Start over for a new rotation, pictures still being identified are ignored"""
+        with self._lock:
+            self._pictures = []
+            self._durations = []
+            if self.selector is not None:
+                # A new one, so the pictures of the previous rotation still being read do not record into it
+                self.selector = FrameSelector()
+
+    def get_statistics(self):
+        with self._lock:
+            futures = [future for _, _, future in self._pictures]
+            durations = list(self._durations)
+        done = sum(future.done() for future in futures)
+        return {
+            "submitted": len(futures),
+            "processed": done,
+            "pending": len(futures) - done,
+            "mean_time": sum(durations) / len(durations) if durations else 0.0,  # s from capture to numbers
+            "unsaved": self._write_queue.qsize(),
+            "write_errors": self.write_errors,
+            "selection": self.selector.get_statistics() if self.selector is not None else None
+        }
+
+def render_target_image(numbers, rng):
+    """Synthetic phase 2 picture: a dark scene with a white card per number, slightly rotated, blurred and noisy"""
+    image = np.full((1080, 1920, 3), 60, np.uint8)
+    for i, number in enumerate(numbers):
+        card = np.full((420, 560, 3), 235, np.uint8)
+        font = TemplateRecogniser.FONTS[rng.integers(0, 4)]  # The plain font is too thin for a printed target
+        scale = rng.uniform(5, 7)
+        thickness = int(rng.integers(18, 30))
+        (width, height), _ = cv2.getTextSize(str(number), font, scale, thickness)
+        cv2.putText(card, str(number), ((560 - width) // 2, (420 + height) // 2), font, scale, (20, 20, 20), thickness)
+        rotation = cv2.getRotationMatrix2D((280, 210), rng.uniform(-5, 5), 1.0)
+        card = cv2.warpAffine(card, rotation, (560, 420), borderValue=(60, 60, 60))
+        x, y = 60 + i * 620, int(rng.integers(100, 600))
+        image[y:y + 420, x:x + 560] = card
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    noise = rng.normal(0, 6, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+def benchmark_recognisers(samples, recognisers=tuple(RECOGNISERS)):
+    """
+    Accuracy and per ROI latency of each recogniser on samples, a list of (name, image or path, numbers or None).
+    For labelled samples, accuracy is the share of the numbers read and wrong counts readings that are not on the
+    picture. Agreement is the share of ROIs read the same as by the first recogniser.
+    """
+    results = {}
+    readings = {}
+    prepared = [(name, numbers, find_number_rois(image)[1]) for name, image, numbers in samples]
+    for recogniser_name in recognisers:
+        try:
+            recogniser = get_recogniser(recogniser_name)
+        except Exception as e:
+            results[recogniser_name] = {"error": str(e)}
+            continue
+        latencies, texts = [], []
+        correct = wrong = expected = 0
+        try:
+            for name, numbers, rois in prepared:
+                found = set()
+                for roi in rois:
+                    start = time.perf_counter()
+                    text = recogniser.read(roi)
+                    latencies.append(time.perf_counter() - start)
+                    texts.append(text)
+                    if is_valid_reading(text):
+                        found.add(int(text))
+                if numbers is not None:
+                    expected += len(numbers)
+                    correct += len(found & set(numbers))
+                    wrong += len(found - set(numbers))
+        except Exception as e:
+            results[recogniser_name] = {"error": str(e)}
+            continue
+        readings[recogniser_name] = texts
+        results[recogniser_name] = {
+            "rois": len(latencies),
+            "valid_readings": sum(is_valid_reading(text) for text in texts),
+            "accuracy": correct / expected if expected else None,
+            "wrong": wrong if expected else None,
+            "mean_latency": float(np.mean(latencies)) if latencies else 0.0,
+            "max_latency": float(np.max(latencies)) if latencies else 0.0
+        }
+
+    if readings:
+        reference = next(iter(readings.values()))
+        for recogniser_name, texts in readings.items():
+            results[recogniser_name]["agreement"] = sum(a == b for a, b in zip(texts, reference)) / len(texts) if texts else None
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the digit recognisers on phase 2 pictures")
+    parser.add_argument("images", nargs="*", default=sorted(glob.glob("images/phase2/*.jpg")), help="Pictures (default: images/phase2/*.jpg)")
+    parser.add_argument("--labels", help="JSON file mapping picture file names to the numbers on them")
+    parser.add_argument("--synthetic", type=int, default=0, help="Also run on this many rendered pictures of known numbers")
+    parser.add_argument("--recognisers", nargs="+", default=list(RECOGNISERS), choices=list(RECOGNISERS))
+    arguments = parser.parse_args()
+
+    labels = {}
+    if arguments.labels:
+        import json
+        with open(arguments.labels) as f:
+            labels = json.load(f)
+    samples = [(os.path.basename(path), path, labels.get(os.path.basename(path))) for path in arguments.images]
+
+    rng = np.random.default_rng(0)
+    for i in range(arguments.synthetic):
+        numbers = [int(number) for number in rng.choice(np.arange(10, 100), size=rng.integers(1, 4), replace=False)]
+        samples.append((f"synthetic_{i}", render_target_image(numbers, rng), numbers))
+
+    for title, subset in (("saved pictures", [sample for sample in samples if not sample[0].startswith("synthetic_")]),
+                          ("synthetic pictures", [sample for sample in samples if sample[0].startswith("synthetic_")])):
+        if not subset:
+            continue
+        print(f"{title} ({len(subset)}):")
+        for recogniser_name, result in benchmark_recognisers(subset, arguments.recognisers).items():
+            if "error" in result:
+                print(f"  {recogniser_name}: unavailable ({result['error']})")
+                continue
+            accuracy = f"accuracy {result['accuracy'] * 100:.1f}% ({result['wrong']} wrong), " if result["accuracy"] is not None else ""
+            print(f"  {recogniser_name}: {result['rois']} ROIs, {result['valid_readings']} read, {accuracy}agreement {result['agreement'] * 100:.1f}%, "
+                  f"{result['mean_latency'] * 1000:.2f} ms per ROI (max {result['max_latency'] * 1000:.2f} ms)")
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+OCR_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_cache.sqlite3")
+# Part of every key, bump it when the preprocessing or segmentation changes so older results are not reused
+OCR_CACHE_VERSION = 1
+
+def content_hash(data) -> str:
+    """Hash of bytes or of an array's contents (with its shape, so a reshaped ROI is a different key)"""
+    digest = hashlib.blake2b(digest_size=16)
+    if hasattr(data, "shape"):
+        digest.update(repr((data.shape, str(data.dtype))).encode())
+        data = data.tobytes() if not data.flags["C_CONTIGUOUS"] else memoryview(data).cast("B")
+    digest.update(data)
+    return digest.hexdigest()
+
+class OcrCache:
+    """
+    Persistent cache of number identification results, so phase 2 re-runs and repeated get_numbers requests do not
+    OCR the same pictures again. Entries are keyed by a content hash (of an image file or of a prepared ROI) and the
+    recogniser signature, and hold JSON values (the digits read and the component geometry).
+    Stored in SQLite, which the process pool workers can share, and bounded to max_entries by evicting the least
+    recently used entries.
+    """
+    def __init__(self, path: str = OCR_CACHE_PATH, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, each worker process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def key(kind: str, content: str, signature: str) -> str:
+        return f"{OCR_CACHE_VERSION}:{kind}:{signature}:{content}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"OCR cache lookup failed: {e}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute("INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+                # Least recently used entries beyond the bound
+                connection.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"OCR cache update failed: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM results")
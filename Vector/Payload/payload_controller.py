@@ -1,22 +1,75 @@
 import glob
+from concurrent.futures.process import BrokenProcessPool
 from Payload.distance_sensor import DistanceSensor
 from Payload.stereo_camera import StereoCamera
-from Payload.number_identifier import identify_numbers_from_files
+from Payload.number_identifier import identify_numbers_from_files, NumberIdentificationEngine, NumberPipeline
+from Payload.ocr_cache import OCR_CACHE_PATH
 from Payload import tag_finder
+from timeline import StartupTimeline
+from frame_ring import FrameRing, FRAME_RING_NAME
 import os
 
+APRILTAG_SIZE = 0.049  # m
+# Camera stream per use: "main" (1920x1080 BGR) or "lores" (640x480 grayscale Y plane).
+# "auto" detects AprilTags on lores once a tracked tag is large enough there.
+APRILTAG_STREAM = "auto"
+NUMBERS_STREAM = "main"  # The digit size filters of number_identifier are tuned for main
+# "tesseract" or "template" (in-process, see number_identifier.py --benchmark before switching)
+NUMBERS_RECOGNISER = "tesseract"
+NUMBERS_WORKERS = 3  # Processes for number identification, leaves a core of the Pi for the capture
+NUMBERS_TIMEOUT = 60  # s to wait for the OCR of the last phase 2 pictures
+FRAME_RING_SLOTS = 8  # Four stereo pairs
+FRAME_RING_SLOT_BYTES = 1920 * 1080 * 4  # A main stream frame (XRGB8888)
+
 class PayloadController:
-    def __init__(self, log_queue):
+    def __init__(self, log_queue, timeline=None):
         self.state = "INITIALIZING"
         self.log_queue = log_queue
+        self.timeline = timeline if timeline is not None else StartupTimeline("Payload")
         self.stereo_camera = StereoCamera()
         self.distance_sensor = DistanceSensor()
+        self.timeline.mark("hardware")
+        # Built once and kept warm for the detect_apriltag round-trips of phase 3
+        self.apriltag_detector = tag_finder.DetectorService(APRILTAG_SIZE, self.stereo_camera, stream=APRILTAG_STREAM)
+        self.timeline.mark("detector")
+        # Pictures are published here, so other processes can read them without going through the JPEGs on disk
+        try:
+            self.frame_ring = FrameRing.create(FRAME_RING_NAME, FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES)
+        except OSError as e:
+            self.log_queue.put(("Payload", f"Could not create the frame ring, pictures are only saved to disk: {e}"))
+            self.frame_ring = None
+        self.timeline.mark("frame ring")
+        try:
+            self.number_engine = NumberIdentificationEngine(NUMBERS_WORKERS, recogniser=NUMBERS_RECOGNISER, cache_path=OCR_CACHE_PATH)
+            self.number_engine.warm_up()
+        except Exception as e:
+            self.log_queue.put(("Payload", f"Could not start number identification workers, identifying serially: {e}"))
+            self.number_engine = None
+        self.timeline.mark("number engine")
+        self.number_pipeline = NumberPipeline(engine=self.number_engine, recogniser=NUMBERS_RECOGNISER, cache_path=OCR_CACHE_PATH)
         self.state = "READY"
         self.numbers_indentified = []
 
     def get_state(self):
         return self.state
 
+    def stop(self):
+        if self.number_engine is not None:
+            self.number_engine.close()
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+            self.frame_ring = None
+
+    def publish_frame(self, camera, image, timestamp, yaw=None):
+        """Write a picture to the frame ring, returns its sequence number (None without a ring)."""
+        if self.frame_ring is None:
+            return None
+        try:
+            return self.frame_ring.write(image, timestamp, yaw=yaw, camera=camera)
+        except ValueError as e:
+            self.log_queue.put(("Payload", f"Could not publish frame: {e}"))
+            return None
+
     def health_check(self):
         health_check_text = ""
         errors = []
@@ -26,6 +79,13 @@ class PayloadController:
         health_check_text += sc_health_check_text
         errors.extend(sc_errors)
 
+        # mean per stage timings of the AprilTag detections so far
+        if self.apriltag_detector.detections:
+            timings = self.get_apriltag_timings()
+            health_check_text += "AprilTag detection: " + ", ".join(f"{stage} {timing['mean'] * 1000:.1f} ms" for stage, timing in timings.items()) + f" (mean of {self.apriltag_detector.detections})\n"
+            statistics = self.get_apriltag_statistics()
+            health_check_text += f"AprilTag rate: {statistics['fps']:.1f} fps ({statistics['processing_fps']:.1f} fps processing), {statistics['roi_detections']} ROI / {statistics['full_frame_searches']} full frame searches\n"
+
         # get the status of the distance sensor
         ds_health_check_text, ds_health_check, ds_errors = self.get_distance_sensor_health_check()
         health_check_text += ds_health_check_text
@@ -58,6 +118,9 @@ class PayloadController:
             errors.append("Right camera not available")
         else:
             health_check_text += "Right camera: ACTIVE\n"
+        grabbers = self.stereo_camera.get_grabber_statistics()
+        if grabbers:
+            health_check_text += "Frame grabbers: " + ", ".join(f"{side} {statistics['fps']:.1f} fps ({statistics['errors']} errors)" for side, statistics in grabbers.items()) + "\n"
         
         if errors:
             health_check_text += "Stereo Camera: DOWN\n"
@@ -81,30 +144,63 @@ class PayloadController:
 
         return health_check_text, is_component_ready, errors
 
+    def get_numbers(self):
+        """
+        Numbers identified in the phase 2 pictures taken since the last call, most of them already while rotating.
+        Without such pictures (e.g. manual mode), the numbers are identified from the JPEGs in images/phase2/.
+        """
+        if self.number_pipeline.submitted == 0:
+            return self.identify_numbers_from_files()
+
+        numbers = self.number_pipeline.result(timeout=NUMBERS_TIMEOUT)
+        statistics = self.number_pipeline.get_statistics()
+        if numbers is None:
+            self.log_queue.put(("Payload", f"Number identification still has {statistics['pending']} pictures queued after {NUMBERS_TIMEOUT} s, answering with the numbers so far"))
+            numbers = self.number_pipeline.result(timeout=0, partial=True)
+        self.log_queue.put(("Payload", f"Numbers identified in {statistics['processed']} pictures, {statistics['mean_time']:.2f} s from capture to numbers per picture"))
+        selection = statistics["selection"]
+        if selection is not None:
+            self.log_queue.put(("Payload", f"{selection['skipped_candidates']} of {selection['candidates']} candidate numbers were already read from a more centred view, "
+                                           f"{selection['duplicates']} duplicate pictures"))
+        self.numbers_identified = numbers
+        self.number_pipeline.reset()
+        return numbers
+
     def identify_numbers_from_files(self):
         image_paths = glob.glob("images/phase2/*.jpg")
-        self.numbers_identified = identify_numbers_from_files(image_paths)
+        if self.number_engine is not None:
+            try:
+                self.numbers_identified = self.number_engine.identify_files(image_paths)
+                return self.numbers_identified
+            except (BrokenProcessPool, RuntimeError) as e:
+                self.log_queue.put(("Payload", f"Number identification workers failed, identifying serially: {e}"))
+        # Without a FrameSelector, so that the complete result of each picture is cached and a repeat only costs a hash
+        self.numbers_identified = identify_numbers_from_files(image_paths, recogniser=NUMBERS_RECOGNISER, cache_path=OCR_CACHE_PATH)
         return self.numbers_identified
 
     def take_picture(self, directory, filename):
         os.makedirs(directory, exist_ok=True)
         self.stereo_camera.take_picture(directory, filename)
     
-    def take_picture_phase_2(self, yaw):
+    def take_picture_phase_2(self, yaw, stream=None):
         # Get the current working directory
         current_path = os.getcwd()
         directory = "images/phase2/"
         os.makedirs(directory, exist_ok=True)
         # NOTE(remy): added support for passing "yaw" as a string for manual mode
-        self.stereo_camera.save_images("images/phase2/", round(yaw))
-        self.log_queue.put(("Payload", f"Image taken and saved in {current_path}/{directory}"))
+        yaw = float(yaw)
+        # The pictures go straight to number identification, the JPEGs are saved in the background
+        for side, camera_index, image, timestamp in self.stereo_camera.capture_images(stream or NUMBERS_STREAM):
+            self.publish_frame(camera_index, image, timestamp, yaw=yaw)
+            self.number_pipeline.submit(image, yaw, path=f"{directory}{round(yaw)}_{side}.jpg")
+        self.log_queue.put(("Payload", f"Image taken, saving in {current_path}/{directory}"))
 
     def take_picture_phase_3(self):
         # Get the current working directory
         current_path = os.getcwd()
         directory = "images/phase3/"
         os.makedirs(directory, exist_ok=True)
-        self.stereo_camera.save_images("images/phase3/", "damage_assessment")
+        self.stereo_camera.save_images("images/phase3/", "damage_assessment", on_image=self.publish_frame)
         self.log_queue.put(("Payload", f"Image taken and saved in {current_path}/{directory}"))
 
         return 
@@ -112,11 +208,15 @@ class PayloadController:
     def take_distance(self):
         return self.distance_sensor.get_distance()
 
-    def detect_apriltag(self):
-        tagfinder_obj = tag_finder.Detector(0.049)
-        tagfinder_obj.capture_Camera()
-        if not tagfinder_obj.getPose(): 
+    def detect_apriltag(self, yaw_rate=None, stream=None):
+        poses = self.apriltag_detector.detect(yaw_rate=yaw_rate, stream=stream)
+        if not poses:
             return None
-        
-        pose = tagfinder_obj.Poses[-1]
-        return pose
\ No newline at end of file
+
+        return poses[-1]
+
+    def get_apriltag_timings(self):
+        return self.apriltag_detector.get_timings()
+
+    def get_apriltag_statistics(self):
+        return self.apriltag_detector.get_statistics()
\ No newline at end of file
@@ -32,6 +32,7 @@ class StereoCamera:
         
         # Initialize cameras with proper timing and error handling
         self._initialize_cameras()
+        self._start_grabbing()
         self._initialized = True
     
     def _initialize_cameras(self):
@@ -43,6 +44,17 @@ class StereoCamera:
         self._initialize_right_camera()
 
     
+    def _start_grabbing(self):
+        """Start the background frame grabber of each available camera"""
+        for side, camera, available in (("left", self.left_camera, self.left_camera_available), ("right", self.right_camera, self.right_camera_available)):
+            if not available:
+                continue
+            try:
+                camera.start_grabbing()
+            except Exception as e:
+                # Frames are then captured on demand
+                print(f"Failed to start {side} frame grabber: {e}")
+
     def _initialize_left_camera(self):
         """Initialize left camera with error handling"""
         try:
@@ -139,6 +151,38 @@ class StereoCamera:
             self.right_camera_available = False
             raise RuntimeError(f"Failed to get right camera frame: {e}")
     
+    def get_synced_pair(self, max_skew=None, stream="main", timeout=1.0):
+        """
+        Latest left and right frames whose sensor timestamps are at most max_skew (s, default half a frame period)
+        apart, as (left_image, right_image, left_timestamp, right_timestamp). Lores frames are grayscale.
+        The cameras run free at the same frame rate, so when the latest frames are too far apart the older side
+        waits for its next frame, which is the closest one to the other side's.
+        """
+        if not self.is_stereo_available():
+            raise RuntimeError("A synced pair requires both cameras to be available")
+        if not (self.left_camera.is_grabbing(stream) and self.right_camera.is_grabbing(stream)):
+            raise RuntimeError(f"Both cameras must be grabbing the {stream} stream")
+        if max_skew is None:
+            max_skew = 0.5 / self.left_camera.framerate
+
+        deadline = time.monotonic() + timeout
+        gray = stream == "lores"
+        left = self.left_camera.get_latest(stream, gray=gray, timeout=timeout)
+        right = self.right_camera.get_latest(stream, gray=gray, timeout=timeout)
+        while left is not None and right is not None:
+            skew = left[1] - right[1]
+            if abs(skew) <= max_skew:
+                return left[0], right[0], left[1], right[1]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if skew < 0:
+                left = self.left_camera.get_latest(stream, gray=gray, newer_than=left[2], timeout=remaining)
+            else:
+                right = self.right_camera.get_latest(stream, gray=gray, newer_than=right[2], timeout=remaining)
+
+        raise RuntimeError(f"No left and right frames within {max_skew * 1000:.1f} ms of each other after {timeout} s")
+
     def get_depth_map(self):
         """Calculate depth map from stereo images with error handling"""
         if not self.is_stereo_available():
@@ -171,39 +215,60 @@ class StereoCamera:
             print(f"Error in depth map calculation: {e}")
             raise RuntimeError(f"Failed to calculate depth map: {e}")
 
-    def save_images(self, path, file_name):
-        """Save images from available cameras with error handling"""
-        images_saved = []
-        
-        # Try to save left image
-        if self.left_camera_available:
+    def capture_images(self, stream="main"):
+        """
+        Capture an image from each available camera, as a list of (side, camera_index, image, timestamp).
+        A synced pair when both cameras are grabbing, lores images are grayscale.
+        """
+        if self.is_stereo_available() and self.left_camera.is_grabbing(stream) and self.right_camera.is_grabbing(stream):
             try:
-                left_image = self.get_left_image()
-                left_path = f"{path}{file_name}_left.jpg"
-                cv.imwrite(left_path, left_image)
-                images_saved.append(left_path)
-                print(f"Left image saved at {left_path}")
+                left_image, right_image, left_timestamp, right_timestamp = self.get_synced_pair(stream=stream)
+                return [("left", self.left_camera.camera_index, left_image, left_timestamp),
+                        ("right", self.right_camera.camera_index, right_image, right_timestamp)]
             except Exception as e:
-                print(f"Failed to save left image: {e}")
-        else:
-            print("Left camera not available - skipping left image")
-        
-        # Try to save right image
-        if self.right_camera_available:
+                print(f"Failed to get synced pair, capturing images one by one: {e}")
+
+        images = []
+        for side in ("left", "right"):
+            camera = self.left_camera if side == "left" else self.right_camera
+            if not (self.left_camera_available if side == "left" else self.right_camera_available):
+                print(f"{side.capitalize()} camera not available - skipping {side} image")
+                continue
             try:
-                right_image = self.get_right_image()
-                right_path = f"{path}{file_name}_right.jpg"
-                cv.imwrite(right_path, right_image)
-                images_saved.append(right_path)
-                print(f"Right image saved at {right_path}")
+                if stream == "main":
+                    image = self.get_left_image() if side == "left" else self.get_right_image()
+                else:
+                    image = camera.get_gray_frame(stream)
+                images.append((side, camera.camera_index, image, time.monotonic()))
             except Exception as e:
-                print(f"Failed to save right image: {e}")
-        else:
-            print("Right camera not available - skipping right image")
-        
+                print(f"Failed to capture {side} image: {e}")
+
+        if not images:
+            raise RuntimeError("No images could be captured - no cameras available")
+
+        return images
+
+    def save_images(self, path, file_name, stream="main", on_image=None):
+        """
+        Save images from available cameras with error handling (lores images are saved in grayscale).
+        on_image(camera_index, image, timestamp) is called for each image saved, e.g. to publish it to the frame ring.
+        """
+        images_saved = []
+
+        for side, camera_index, image, timestamp in self.capture_images(stream):
+            image_path = f"{path}{file_name}_{side}.jpg"
+            try:
+                cv.imwrite(image_path, image)
+                images_saved.append(image_path)
+                print(f"{side.capitalize()} image saved at {image_path}")
+                if on_image is not None:
+                    on_image(camera_index, image, timestamp)
+            except Exception as e:
+                print(f"Failed to save {side} image: {e}")
+
         if not images_saved:
             raise RuntimeError("No images could be saved - no cameras available")
-        
+
         return images_saved
     
     def get_available_image(self):
@@ -222,11 +287,46 @@ class StereoCamera:
         
         raise RuntimeError("No cameras available or all cameras failed")
     
+    def get_available_gray_image(self, stream="lores"):
+        """Grayscale image of a stream from any available camera (see Camera.get_gray_frame)"""
+        for side in ("left", "right"):
+            camera = self.left_camera if side == "left" else self.right_camera
+            if not (self.left_camera_available if side == "left" else self.right_camera_available):
+                continue
+            frame = camera.get_gray_frame(stream)
+            if frame is not None:
+                return frame, side
+            print(f"Failed to get {side} {stream} image")
+
+        raise RuntimeError("No cameras available or all cameras failed")
+
+    def get_camera_params(self, side, stream="main"):
+        """Intrinsics of a camera scaled to a stream"""
+        camera = self.left_camera if side == "left" else self.right_camera
+        return camera.get_camera_params(stream)
+
+    def get_stream_scale(self, stream="main"):
+        """Scale of a stream relative to main (both cameras use the same configuration)"""
+        camera = self.left_camera if self.left_camera is not None else self.right_camera
+        if camera is None:
+            raise RuntimeError("No cameras available")
+        return camera.get_stream_scale(stream)
+
+    def get_grabber_statistics(self):
+        """Statistics of the running frame grabbers by side (see FrameGrabber.get_statistics)"""
+        statistics = {}
+        for side, camera in (("left", self.left_camera), ("right", self.right_camera)):
+            if camera is not None and camera.is_grabbing():
+                statistics[side] = camera.grabber.get_statistics()
+        return statistics
+
     def get_camera_status(self):
         """Get status information about both cameras"""
         return {
             "left_camera_available": self.left_camera_available,
             "right_camera_available": self.right_camera_available,
             "stereo_available": self.is_stereo_available(),
+            "left_camera_grabbing": self.left_camera is not None and self.left_camera.is_grabbing(),
+            "right_camera_grabbing": self.right_camera is not None and self.right_camera.is_grabbing(),
             "total_cameras": sum([self.left_camera_available, self.right_camera_available])
         }
\ No newline at end of file
@@ -1,7 +1,8 @@
 from Payload.stereo_camera import StereoCamera
 import apriltag
-import cv2, math, json
+import cv2, math, json, time
 import numpy as np
+from collections import deque
 import dt_apriltags as dt_april
 import apriltag
 from transforms3d.euler import mat2euler
@@ -9,9 +10,9 @@ from transforms3d.euler import mat2euler
 # Code adapted from: https://github.com/suriono/apriltag
 
 class Detector:
-   def __init__(self, tag_size, camera_obj=StereoCamera()):
+   def __init__(self, tag_size, camera_obj=None):
       self.tag_size = tag_size
-      self.camera_obj = camera_obj
+      self.camera_obj = camera_obj if camera_obj is not None else StereoCamera()
       options = apriltag.DetectorOptions(families="tag25h9") 
       self.detector = apriltag.Detector(options)
       self.dt_detector = dt_april.Detector(searchpath=['apriltags'],
@@ -38,20 +39,7 @@ class Detector:
       self.Poses = []
 
       for result in self.dt_results:
-         pose = {}
-         radian, degree = self.get_Euler(result.pose_R)
-
-         X, Y, Z = result.pose_t * 1000.0 # Convert to mm if result.pose_t is in meters
-
-         position = (X[0], Y[0], Z[0])
-
-         pose['translation'] = position
-         pose['degree'] = degree
-         pose['radian'] = radian
-         pose['tag_family'] = result.tag_family.decode("utf-8")
-         pose['tag_id'] = result.tag_id
-
-         self.Poses.append(pose)
+         self.Poses.append(result_to_pose(result))
 
       return (len(self.dt_results) > 0)
 
@@ -68,11 +56,238 @@ class Detector:
       self.camera_Z = camera_pose[2][3] 
 
    def get_Euler(self, Rmatrix):
-      radian = np.array(mat2euler(Rmatrix[0:3][0:3], 'sxyz')) 
-      degree = np.array(np.rad2deg(mat2euler(Rmatrix[0:3][0:3], 'sxyz'))) 
-      return radian, degree
+      return get_euler(Rmatrix)
 
    def get_All_Tag_Info(self):
       X,Y,Z = self.X, self.Y, self.Z
       yaw,pitch,roll = self.Yaw[0],self.Pitch[0],self.Roll[0]
-      return self.tag_family, self.tag_id, X,Y,Z, yaw,pitch,roll
\ No newline at end of file
+      return self.tag_family, self.tag_id, X,Y,Z, yaw,pitch,roll
+
+def get_euler(Rmatrix):
+   radian = np.array(mat2euler(Rmatrix[0:3][0:3], 'sxyz'))
+   degree = np.rad2deg(radian)
+   return radian, degree
+
+def result_to_pose(result, offset=(0, 0), scale=1, stream_scale=(1, 1)):
+   """
+   Pose dict of a dt_apriltags detection. offset and scale map the detection image back to the full frame of its
+   stream, stream_scale (Camera.get_stream_scale) from that stream to the main stream.
+   """
+   pose = {}
+   radian, degree = get_euler(result.pose_R)
+
+   X, Y, Z = result.pose_t * 1000.0 # Convert to mm if result.pose_t is in meters
+
+   pose['translation'] = (X[0], Y[0], Z[0])
+   pose['degree'] = degree
+   pose['radian'] = radian
+   pose['tag_family'] = result.tag_family.decode("utf-8")
+   pose['tag_id'] = result.tag_id
+   # Image position and apparent size in main stream pixels, used for tracking
+   pose['center'] = ((float(result.center[0]) * scale + offset[0]) / stream_scale[0], (float(result.center[1]) * scale + offset[1]) / stream_scale[1])
+   corners = np.asarray(result.corners, dtype=float)
+   pose['size'] = float(np.linalg.norm(corners - np.roll(corners, 1, axis=0), axis=1).max()) * scale / stream_scale[0]
+   return pose
+
+class DetectorService:
+   """
+   Long-lived AprilTag detector owned by PayloadController.
+   Unlike Detector, it is built once (the dt_apriltags detector and the grayscale buffer are reused between calls),
+   captures exactly one frame per detection and uses the calibration of the camera that took it, scaled to the
+   stream it was taken from: "main" (BGR), "lores" (grayscale Y plane, no conversion) or "auto" (lores once a
+   tracked tag is at least min_tag_pixels there, main otherwise).
+   With tracking, a tag found in the last detection is searched in a region of interest around its predicted
+   position (from its image velocity, or the yaw rate when given) first, downscaled so the tag keeps about
+   min_tag_pixels, and the full frame is only searched when the track is lost.
+   Per stage timings (capture, grayscale, detect, pose) of every detection are kept for get_timings().
+   """
+   STAGES = ("capture", "grayscale", "detect", "pose")
+   YAW_IMAGE_DIRECTION = -1  # Direction the scene moves along the image x axis when the yaw increases
+
+   def __init__(self, tag_size, camera_obj, nthreads=1, stream="main", tracking=True, roi_scale=4.0, min_roi=240, min_tag_pixels=48, max_decimate=4, track_timeout=1.0):
+      self.tag_size = tag_size
+      self.camera_obj = camera_obj
+      self.dt_detector = dt_april.Detector(searchpath=['apriltags'],
+                       families='tag25h9',
+                       nthreads=nthreads,
+                       quad_decimate=1.0,
+                       quad_sigma=0.0,
+                       refine_edges=1,
+                       decode_sharpening=0.25,
+                       debug=0)
+      self.stream = stream
+      self.gray = None
+      self.detections = 0
+      self.last_timings = {}
+      self.total_timings = dict.fromkeys(self.STAGES, 0.0)
+      self.max_timings = dict.fromkeys(self.STAGES, 0.0)
+
+      # Tracking
+      self.tracking = tracking
+      self.roi_scale = roi_scale  # ROI side in tag sizes
+      self.min_roi = min_roi  # px
+      self.min_tag_pixels = min_tag_pixels  # px, tag size to keep after decimation
+      self.max_decimate = max_decimate
+      self.track_timeout = track_timeout  # s
+      self.track = None
+      self.roi_detections = 0
+      self.full_frame_searches = 0
+      self.track_losses = 0
+      self.detection_times = deque(maxlen=30)
+
+   def _choose_stream(self, stream):
+      if stream != "auto":
+         return stream
+      if self.track is not None and self.track["size"] * self.camera_obj.get_stream_scale("lores")[0] >= self.min_tag_pixels:
+         return "lores"
+      return "main"
+
+   def reset_track(self):
+      self.track = None
+
+   def _predict_roi(self, shape, params, now, yaw_rate=None, stream_scale=(1, 1)):
+      """Region (x0, y0, x1, y1) and decimation to search the tracked tag in, None without a usable track."""
+      track = self.track
+      if track is None or now - track["time"] > self.track_timeout:
+         return None
+
+      # The track is kept in main stream pixels
+      dt = now - track["time"]
+      x, y = track["center"][0] * stream_scale[0], track["center"][1] * stream_scale[1]
+      size = track["size"] * stream_scale[0]
+      if yaw_rate is not None:
+         shift = self.YAW_IMAGE_DIRECTION * params[0] * math.tan(math.radians(yaw_rate * dt))
+      else:
+         shift = track["velocity"] * stream_scale[0] * dt
+      x += shift
+
+      min_roi = self.min_roi * stream_scale[0]
+      half = max(min_roi, size * self.roi_scale) / 2
+      height, width = shape[:2]
+      x0, x1 = int(max(0, x - half - abs(shift) / 2)), int(min(width, x + half + abs(shift) / 2))
+      y0, y1 = int(max(0, y - half)), int(min(height, y + half))
+      if x1 - x0 < min_roi / 2 or y1 - y0 < min_roi / 2 or (x1 - x0) * (y1 - y0) > 0.5 * width * height:
+         return None  # Predicted out of the frame, or no cheaper than the full frame
+
+      decimate = max(1, min(self.max_decimate, int(size // self.min_tag_pixels)))
+      return (x0, y0, x1, y1), decimate
+
+   def _detect_region(self, img, params, region=None, decimate=1, timings=None, stream_scale=(1, 1)):
+      start = time.perf_counter()
+      if img.ndim == 2:
+         # Already grayscale (lores Y plane), cropping is a view
+         x0, y0 = (0, 0) if region is None else region[:2]
+         gray = img if region is None else img[region[1]:region[3], region[0]:region[2]]
+      elif region is None:
+         x0, y0 = 0, 0
+         if self.gray is None or self.gray.shape != img.shape[:2]:
+            self.gray = np.empty(img.shape[:2], dtype=np.uint8)
+         cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self.gray)  # Converted into the same buffer every time
+         gray = self.gray
+      else:
+         x0, y0, x1, y1 = region
+         gray = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+      if decimate > 1:
+         gray = cv2.resize(gray, None, fx=1 / decimate, fy=1 / decimate, interpolation=cv2.INTER_AREA)
+      converted = time.perf_counter()
+
+      # Intrinsics of the cropped and decimated image, so the pose stays in the camera frame
+      fx, fy, cx, cy = params
+      region_params = (fx / decimate, fy / decimate, (cx - x0) / decimate, (cy - y0) / decimate)
+      results = self.dt_detector.detect(gray, True, region_params, self.tag_size)
+      detected = time.perf_counter()
+
+      poses = [result_to_pose(result, offset=(x0, y0), scale=decimate, stream_scale=stream_scale) for result in results]
+      end = time.perf_counter()
+
+      if timings is not None:
+         timings["grayscale"] += converted - start
+         timings["detect"] += detected - converted
+         timings["pose"] += end - detected
+      return poses
+
+   def _update_track(self, pose, now):
+      if pose is None:
+         if self.track is not None:
+            self.track_losses += 1
+         self.track = None
+         return
+      velocity = 0.0
+      if self.track is not None and now > self.track["time"]:
+         velocity = (pose["center"][0] - self.track["center"][0]) / (now - self.track["time"])
+      self.track = {"center": pose["center"], "size": pose["size"], "velocity": velocity, "time": now}
+
+   def detect(self, yaw_rate=None, stream=None):
+      """
+      Capture a frame and detect the AprilTags in it.
+      Parameters:
+         yaw_rate (float): Current yaw rate (deg/s) of the satellite, to predict where a tracked tag moved.
+         stream (str): Camera stream for this detection ("main", "lores" or "auto"), the service's by default.
+      Returns:
+         list: Pose dict (translation in mm, degree, radian, tag_family, tag_id, center and size in main stream px)
+         of every detected tag.
+      """
+      stream = self._choose_stream(stream or self.stream)
+      start = time.perf_counter()
+      if stream == "main":
+         img, side = self.camera_obj.get_available_image()
+      else:
+         img, side = self.camera_obj.get_available_gray_image(stream)
+      captured = time.perf_counter()
+      timings = dict.fromkeys(self.STAGES, 0.0)
+      timings["capture"] = captured - start
+      params = self.camera_obj.get_camera_params(side, stream)
+      stream_scale = self.camera_obj.get_stream_scale(stream)
+
+      poses = []
+      prediction = self._predict_roi(img.shape, params, captured, yaw_rate, stream_scale) if self.tracking else None
+      if prediction is not None:
+         region, decimate = prediction
+         poses = self._detect_region(img, params, region, decimate, timings, stream_scale)
+         if poses:
+            self.roi_detections += 1
+      if not poses:
+         # No track, or the tag left the predicted region
+         poses = self._detect_region(img, params, timings=timings, stream_scale=stream_scale)
+         self.full_frame_searches += 1
+
+      if self.tracking:
+         self._update_track(poses[-1] if poses else None, captured)
+      self._record(timings)
+      self.detection_times.append(time.perf_counter())
+      return poses
+
+   def _record(self, timings):
+      self.detections += 1
+      self.last_timings = timings
+      for stage, duration in timings.items():
+         self.total_timings[stage] += duration
+         self.max_timings[stage] = max(self.max_timings[stage], duration)
+
+   def get_timings(self):
+      """Last, mean and max duration (s) of every stage over the detections so far."""
+      return {
+         stage: {
+            "last": self.last_timings.get(stage, 0.0),
+            "mean": self.total_timings[stage] / self.detections if self.detections else 0.0,
+            "max": self.max_timings[stage]
+         }
+         for stage in self.STAGES
+      }
+
+   def get_statistics(self):
+      """
+      Detection rate and tracking counters.
+      Returns:
+         dict: fps (detections per second over the last calls), processing_fps (1 / mean processing time),
+         roi_detections, full_frame_searches and track_losses.
+      """
+      times = self.detection_times
+      processing = sum(self.total_timings.values()) / self.detections if self.detections else 0.0
+      return {
+         "fps": (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0,
+         "processing_fps": 1 / processing if processing > 0 else 0.0,
+         "roi_detections": self.roi_detections,
+         "full_frame_searches": self.full_frame_searches,
+         "track_losses": self.track_losses
+      }
@@ -4,8 +4,8 @@ from TTC.testttc import TestTTC
 
 event_loop = asyncio.get_event_loop()
 
-def start(pipe, log_queue):
-    ttc = TTC(pipe, event_loop, log_queue)
+def start(pipe, log_queue, timeline=None):
+    ttc = TTC(pipe, event_loop, log_queue, timeline=timeline)
     ttc.log("Starting subsystem...")
     ttc.start_obdh_listener()
     event_loop.run_until_complete(ttc.start_server())
@@ -0,0 +1,214 @@
+import json
+import os
+import time
+from enums import DownlinkPriority
+
+DOWNLINK_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downlink_queue")
+MAX_QUEUE_BYTES = 64 * 1024 * 1024
+# s, queued records older than this are dropped, None to keep them until they are sent (or evicted for space)
+MAX_AGE = {
+    DownlinkPriority.REPLY: 3600,
+    DownlinkPriority.RESULT: None,
+    DownlinkPriority.TELEMETRY: 600,  # Only the latest telemetry is of use
+    DownlinkPriority.LOG: 24 * 3600,
+    DownlinkPriority.FILE: None
+}
+# Classes written through to the SD card before put() returns, the others survive a crash but maybe not a power cut
+SYNCED = (DownlinkPriority.REPLY, DownlinkPriority.RESULT, DownlinkPriority.FILE)
+COMPACT_BYTES = 1024 * 1024  # A journal is rewritten without its sent records once they take this much
+OFFSET_SAVE_INTERVAL = 32  # Records sent between saves of the journal offset
+
+class DownlinkQueue:
+    """
+    Store-and-forward queue of what TT&C could not send to Ground, on disk so that it survives a restart.
+    Each priority class (DownlinkPriority, most urgent first) has an append-only journal of JSON records (the time
+    queued, a kind and a payload) and the offset of its first record not sent yet. peek() gives the oldest record of
+    the most urgent class and pop() drops it once it is sent. Records are sent at least once: the offset is saved
+    every OFFSET_SAVE_INTERVAL records, so a few may be sent again after a crash.
+    The queue is bounded to max_bytes by evicting the oldest records of the least urgent classes, and records older
+    than the max_age of their class are dropped. It is used from the event loop only.
+    """
+    def __init__(self, directory=DOWNLINK_QUEUE_PATH, max_bytes=MAX_QUEUE_BYTES, max_age=MAX_AGE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evicted = {priority: 0 for priority in DownlinkPriority}  # Records dropped unsent, for age or space
+        self._sizes = {}
+        self._offsets = {}
+        self._unsaved = {priority: 0 for priority in DownlinkPriority}
+        self._head = {}  # Class -> (offset, end) of the record last read
+
+        for priority in DownlinkPriority:
+            self._sizes[priority] = self._repair(priority)
+            self._offsets[priority] = min(self._load_offset(priority), self._sizes[priority])
+
+    def _journal(self, priority):
+        return os.path.join(self.directory, f"{priority.name.lower()}.jsonl")
+
+    def _offset_file(self, priority):
+        return os.path.join(self.directory, f"{priority.name.lower()}.offset")
+
+    def _repair(self, priority):
+        """Size of a journal, cut back to its last complete record (one being written when TT&C stopped is lost)."""
+        path = self._journal(priority)
+
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, "rb+") as journal:
+            end = journal.seek(0, os.SEEK_END)
+            position = end
+
+            while position > 0:
+                start = max(0, position - 65536)
+                journal.seek(start)
+                block = journal.read(position - start)
+                newline = block.rfind(b"\n")
+
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+
+                position = start
+
+            if position < end:
+                journal.truncate(position)
+
+            return position
+
+    def _load_offset(self, priority):
+        try:
+            with open(self._offset_file(priority)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _save_offset(self, priority):
+        path = self._offset_file(priority)
+
+        with open(f"{path}.tmp", "w") as f:
+            f.write(str(self._offsets[priority]))
+
+        os.replace(f"{path}.tmp", path)
+        self._unsaved[priority] = 0
+
+    def put(self, priority, kind, payload):
+        """Queue a record, returns the number of records evicted to make room."""
+        line = (json.dumps({"time": time.time(), "kind": kind, "payload": payload}) + "\n").encode()
+
+        with open(self._journal(priority), "ab") as journal:
+            journal.write(line)
+            journal.flush()
+
+            if priority in SYNCED:
+                os.fsync(journal.fileno())
+
+        self._sizes[priority] += len(line)
+
+        return self._evict()
+
+    def pending_bytes(self, priority=None):
+        """Bytes queued in a class, or in all of them."""
+        priorities = DownlinkPriority if priority is None else (priority,)
+        return sum(self._sizes[p] - self._offsets[p] for p in priorities)
+
+    def backlog(self, priority):
+        """Whether records of this class or a more urgent one are queued, a new record must then wait its turn."""
+        return any(self.pending_bytes(p) > 0 for p in DownlinkPriority if p.value <= priority.value)
+
+    def _read(self, priority):
+        """Oldest record of a class, None if there is none. Records that cannot be decoded are dropped."""
+        while self._offsets[priority] < self._sizes[priority]:
+            offset = self._offsets[priority]
+
+            with open(self._journal(priority), "rb") as journal:
+                journal.seek(offset)
+                line = journal.readline()
+
+            self._head[priority] = (offset, offset + len(line))
+
+            try:
+                return json.loads(line)
+            except ValueError:
+                self._advance(priority)
+
+        return None
+
+    def _expired(self, priority, record):
+        max_age = self.max_age.get(priority)
+        return max_age is not None and time.time() - record["time"] > max_age
+
+    def peek(self):
+        """(class, record) of the oldest record of the most urgent class, None if the queue is empty."""
+        for priority in DownlinkPriority:
+            while (record := self._read(priority)) is not None:
+                if not self._expired(priority, record):
+                    return priority, record
+
+                self.evicted[priority] += 1
+                self._advance(priority)
+
+        return None
+
+    def pop(self, priority, record):
+        """Drop a record peek() returned once it is sent, unless it was evicted meanwhile."""
+        if self._read(priority) == record:
+            self._advance(priority)
+
+    def _advance(self, priority):
+        offset, end = self._head.pop(priority)
+
+        if offset != self._offsets[priority]:
+            return
+
+        self._offsets[priority] = end
+        self._unsaved[priority] += 1
+
+        if end >= self._sizes[priority]:
+            # Everything was sent, the journal starts over
+            open(self._journal(priority), "wb").close()
+            self._sizes[priority] = self._offsets[priority] = 0
+            self._save_offset(priority)
+        elif end >= COMPACT_BYTES and end * 2 >= self._sizes[priority]:
+            self._compact(priority)
+        elif self._unsaved[priority] >= OFFSET_SAVE_INTERVAL:
+            self._save_offset(priority)
+
+    def _compact(self, priority):
+        path = self._journal(priority)
+
+        with open(path, "rb") as journal, open(f"{path}.tmp", "wb") as compacted:
+            journal.seek(self._offsets[priority])
+
+            while block := journal.read(65536):
+                compacted.write(block)
+
+            compacted.flush()
+            os.fsync(compacted.fileno())
+
+        # Offset first: a crash before the journal is replaced only sends records again
+        self._sizes[priority] -= self._offsets[priority]
+        self._offsets[priority] = 0
+        self._save_offset(priority)
+        os.replace(f"{path}.tmp", path)
+
+    def _evict(self):
+        evicted = 0
+
+        for priority in reversed(DownlinkPriority):
+            while self.pending_bytes() > self.max_bytes and self._read(priority) is not None:
+                self.evicted[priority] += 1
+                evicted += 1
+                self._advance(priority)
+
+        return evicted
+
+    def flush(self):
+        """Save the journal offsets (on shutdown)."""
+        for priority in DownlinkPriority:
+            if self._unsaved[priority]:
+                self._save_offset(priority)
+
+    def get_statistics(self):
+        return {priority.name.lower(): {"pending_bytes": self.pending_bytes(priority), "evicted": self.evicted[priority]} for priority in DownlinkPriority}
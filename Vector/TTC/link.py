@@ -0,0 +1,194 @@
+import lzma
+import os
+import time
+import zipfile
+import zlib
+from TTC.transfer import WINDOW
+from TTC.utils import STORED_EXTENSIONS
+
+# Chunk sizes of the downlink, a chunk is one WebSocket message
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 64 * 1024
+# Each message costs the Pi about as much CPU whatever its size, chunks grow so fewer than this are sent per second
+MAX_CHUNK_RATE = 500  # chunks/s
+# Above this share of chunks sent again, chunks are made smaller: a corrupted chunk is sent again with the rest of
+# the window, so larger chunks waste more
+LOSS_TARGET = 0.01
+RATE_SMOOTHING = 0.2  # Weight of a new goodput or RTT sample
+LOSS_SMOOTHING = 0.02  # Weight of a new chunk in the share sent again
+STALE_AFTER = 30.0  # s, measurements older than this give way to the link bit rate
+# s, the RTT without queueing is the least measured over this long (the RTT grows as chunks queue up on the link)
+MIN_RTT_WINDOW = 10.0
+BITRATE_EFFICIENCY = 0.5  # 802.11 goodput is about half the bit rate iwconfig reports
+# s, without ACKs (transfer protocol 1) sending a block only measures the link if it waited for the socket this long
+BLOCKED_SEND_TIME = 0.01
+
+# Ways to compress a file, cheapest first: (name, zipfile compress type, compress level)
+CODECS = (
+    ("stored", zipfile.ZIP_STORED, None),
+    ("deflate-1", zipfile.ZIP_DEFLATED, 1),
+    ("deflate-6", zipfile.ZIP_DEFLATED, 6),
+    ("deflate-9", zipfile.ZIP_DEFLATED, 9),
+    ("lzma", zipfile.ZIP_LZMA, None)
+)
+DEFAULT_CODEC = CODECS[2]
+# For the dashboard (transfer protocol 1), archives are opened with whatever zip tool Ground has, many cannot read LZMA
+LEGACY_CODECS = CODECS[:-1]
+# A costlier codec is only chosen if it is expected to finish this much sooner
+CODEC_MARGIN = 0.05
+
+def _compress(codec, data):
+    _, compress_type, level = codec
+
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    if compress_type == zipfile.ZIP_LZMA:
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=[{"id": lzma.FILTER_LZMA1}])
+
+    return data
+
+def probe_codecs(sample, codecs=CODECS):
+    """{codec name: (compression ratio, compression speed in bytes/s)} measured on a sample of a file."""
+    profile = {}
+
+    for codec in codecs:
+        start = time.perf_counter()
+        compressed = _compress(codec, sample)
+        elapsed = time.perf_counter() - start
+        profile[codec[0]] = (len(compressed) / len(sample) if sample else 1.0, len(sample) / elapsed if codec[1] != zipfile.ZIP_STORED and elapsed > 0 else float("inf"))
+
+    return profile
+
+class LinkMonitor:
+    """
+    Estimates of the downlink (goodput, round trip time and share of chunks sent again), measured from the ACKs of
+    chunked transfers, with the bit rate iwconfig reports and the WebSocket ping latency until there are
+    measurements. Used to pick the chunk size of a transfer as it is sent, and how to compress each file so that
+    it is downlinked as soon as possible: the slower the link, the more CPU time compressing is worth.
+    """
+    def __init__(self, window=WINDOW, default_chunk_size=MIN_CHUNK_SIZE):
+        self.window = window
+        self.default_chunk_size = default_chunk_size
+        self.throughput = None  # bytes/s, measured goodput
+        self.rtt = None  # s, measured
+        self.min_rtt = None  # s, least RTT measured since min_rtt_time
+        self.min_rtt_time = None
+        self.loss = 0.0
+        self.updated = None  # Monotonic time of the last measurement
+        self.bitrate = None  # bytes/s, from iwconfig
+        self.latency = None  # s, from the WebSocket keepalive pings
+        self._profiles = {}  # File extension -> last probe_codecs() result
+
+    def set_connection_info(self, connection_info):
+        """Link bit rate from get_connection_info(), the goodput estimate until a transfer measures it."""
+        if connection_info is not None and connection_info.get("Data Transmission Rate") is not None:
+            self.bitrate = connection_info["Data Transmission Rate"] * 1e6 / 8 * BITRATE_EFFICIENCY
+
+    def set_latency(self, latency):
+        if latency is not None and latency > 0:
+            self.latency = latency
+
+    def _smooth(self, current, sample):
+        return sample if current is None else (1 - RATE_SMOOTHING) * current + RATE_SMOOTHING * sample
+
+    def record_delivery(self, rate, rtt=None):
+        """A goodput sample (bytes/s, delivered over a round trip) and the RTT (s) of the chunk it was measured on."""
+        now = time.monotonic()
+
+        if self.updated is None or now - self.updated > STALE_AFTER:
+            self.throughput = self.rtt = self.min_rtt = None  # The link may have changed since
+
+        if rate is not None and rate > 0:
+            self.throughput = self._smooth(self.throughput, rate)
+
+        if rtt is not None and rtt > 0:
+            self.rtt = self._smooth(self.rtt, rtt)
+
+            if self.min_rtt is None or rtt <= self.min_rtt or now - self.min_rtt_time > MIN_RTT_WINDOW:
+                self.min_rtt, self.min_rtt_time = rtt, now
+
+        self.updated = now
+
+    def record_sent(self, again):
+        """A chunk was sent, for the first time or again."""
+        self.loss = (1 - LOSS_SMOOTHING) * self.loss + LOSS_SMOOTHING * (1.0 if again else 0.0)
+
+    def goodput(self):
+        """Expected goodput (bytes/s), None if unknown."""
+        if self.throughput is not None and time.monotonic() - self.updated <= STALE_AFTER:
+            return self.throughput
+
+        return self.bitrate
+
+    def round_trip_time(self, queueing=True):
+        """RTT (s), with the time chunks spend queued on the link or without, None if unknown."""
+        if self.rtt is not None and time.monotonic() - self.updated <= STALE_AFTER:
+            return self.rtt if queueing else self.min_rtt
+
+        return self.latency
+
+    def chunk_size(self):
+        """
+        Chunk size for the current link: enough for a window of chunks to hold twice the bandwidth-delay product (so
+        the window does not limit the goodput) and to send at most MAX_CHUNK_RATE chunks per second, made smaller if
+        many chunks are sent again. The RTT without queueing is used, larger chunks would only queue up on the link.
+        """
+        throughput = self.goodput()
+
+        if throughput is None:
+            return self.default_chunk_size
+
+        size = throughput / MAX_CHUNK_RATE
+        rtt = self.round_trip_time(queueing=False)
+
+        if rtt is not None:
+            size = max(size, 2 * throughput * rtt / self.window)
+
+        if self.loss > LOSS_TARGET:
+            size = min(size, MAX_CHUNK_SIZE * LOSS_TARGET / self.loss)
+
+        # Powers of two, so that noise in the estimates does not change the size all the time
+        chunk_size = MIN_CHUNK_SIZE
+
+        while chunk_size < size and chunk_size < MAX_CHUNK_SIZE:
+            chunk_size *= 2
+
+        return chunk_size
+
+    def choose_codec(self, path, sample, codecs=CODECS):
+        """
+        Codec (one of codecs) expected to get a file downlinked soonest, given a sample of its start. Compressing and
+        sending overlap, so a file takes the longer of the two: the codec with the least of
+        max(size / compression speed, compressed size / goodput), preferring cheaper codecs within CODEC_MARGIN.
+        Files of a STORED_EXTENSIONS type are stored, and DEFAULT_CODEC is used while the goodput is unknown.
+        """
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension in STORED_EXTENSIONS:
+            return CODECS[0]
+
+        throughput = self.goodput()
+
+        if throughput is None:
+            return DEFAULT_CODEC
+
+        # A file no larger than the sample costs about as much to probe as to compress, the last probe of its type is
+        # used if there is one
+        size = os.path.getsize(path)
+        profile = self._profiles.get(extension) if size <= len(sample) else None
+
+        if profile is None or any(codec[0] not in profile for codec in codecs):
+            profile = probe_codecs(sample, codecs)
+            self._profiles[extension] = profile
+
+        times = {codec[0]: max(size / profile[codec[0]][1], size * profile[codec[0]][0] / throughput) for codec in codecs}
+        best = min(times.values())
+
+        for codec in codecs:
+            if times[codec[0]] <= best * (1 + CODEC_MARGIN):
+                return codec
+
+    def get_statistics(self):
+        return {"goodput": self.goodput(), "rtt": self.round_trip_time(), "min_rtt": self.round_trip_time(queueing=False), "loss": round(self.loss, 4), "chunk_size": self.chunk_size()}
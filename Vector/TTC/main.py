@@ -4,12 +4,17 @@ import asyncio
 import socket
 import websockets
 import json
-from enums import TTCState, MessageType
+from enums import TTCState, MessageType, DownlinkPriority
 from datetime import datetime
-from TTC.utils import get_connection_info, zip_file, zip_folder
+from TTC.utils import get_connection_info, archive_files, zip_stream, zip_bytes, encode_frame
+from TTC.transfer import OutgoingTransfer, PROTOCOL_VERSION, ACK_TIMEOUT
+from TTC.link import LinkMonitor, CODECS, LEGACY_CODECS, BLOCKED_SEND_TIME
+from TTC.downlink_queue import DownlinkQueue
+from timeline import StartupTimeline
+from frame_ring import FrameRing
 
 class TTC:
-    def __init__(self, pipe, event_loop, log_queue, port=8000, buffer_size=1024, format="utf-8", byteorder_length=8, max_retries=3):
+    def __init__(self, pipe, event_loop, log_queue, port=8000, buffer_size=1024, format="utf-8", byteorder_length=8, max_retries=3, timeline=None, downlink_queue=None):
         log_queue.put(("TT&C", "Initialising..."))
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 0))
@@ -23,6 +28,7 @@ class TTC:
         self.FORMAT = format
         self.BYTEORDER_LENGTH = byteorder_length
         self.MAX_RETRIES = max_retries
+        self.timeline = timeline if timeline is not None else StartupTimeline("TTC")
 
         # connection configuration
         self.host_name = socket.gethostname()
@@ -30,6 +36,15 @@ class TTC:
         self.port = port
         self.connection = None
         self.last_command_received = None
+        self.frame_ring = None  # Attached on the first frame request, the Payload creates it
+        self.transfer_protocol = 1  # 1: whole file in one go, 2: chunked (TTC/transfer.py), chosen by Ground
+        self.transfers = {}  # Chunked transfers not acknowledged yet by ID, kept for Ground to resume
+        self.MAX_TRANSFERS = 8
+        self.link = LinkMonitor(default_chunk_size=buffer_size)  # Picks chunk sizes and compression for the downlink
+        self.link_queried = False  # iwconfig was asked for the bit rate on this connection
+        self.downlink_queue = downlink_queue if downlink_queue is not None else DownlinkQueue()  # What Ground missed
+        self.drain_task = None
+        self.DRAIN_DELAY = 1.0  # s after Ground connects, for it to choose the transfer protocol before queued files
 
         log_queue.put(("TT&C", "Initialised"))
 
@@ -39,7 +54,8 @@ class TTC:
     def health_check(self):
         self.log("Performing subsystem health check...")
         health_check = {}
-        connection_info = get_connection_info()        
+        connection_info = get_connection_info()
+        self.link.set_connection_info(connection_info)
 
         for metric, value in connection_info.items():
             if value is not None:
@@ -68,56 +84,78 @@ class TTC:
 
     def handle_instructions(self):
         while True:
-            if self.pipe.poll():
+            # Blocks until OBDH sends an instruction instead of spinning on poll()
+            try:
                 instruction = self.pipe.recv()
-                command = instruction[0]
-                args = instruction[1] if len(instruction) == 2 else None
+            except (EOFError, OSError):
+                self.log("OBDH pipe closed, OBDH listener shutting down...")
+                break
+            command = instruction[0]
+            args = instruction[1] if len(instruction) == 2 else None
+
+            # Log batches are frequent, logging them here would log every line again
+            if command != "log":
                 self.log(f"Received instruction: {command} with args: {args}")
 
-                match command:                    
-                    case "get_state":
-                        self.pipe.send(self.state)
-                    case "log":
-                        asyncio.run_coroutine_threadsafe(self.send_log(args["message"]), self.event_loop)
-                    case "send_message":
-                        asyncio.run_coroutine_threadsafe(self.send_message(args["message"]), self.event_loop)
-                    case "send_data":
-                        asyncio.run_coroutine_threadsafe(self.send_data(args["data"]), self.event_loop)
-                    case "send_file":
-                        asyncio.run_coroutine_threadsafe(self.send_file(args["path"]), self.event_loop)
-                    case "health_check":
-                        health = self.health_check()
-                        self.pipe.send(health)
-                    case "stop":
-                        self.log("OBDH listener shutting down...")
-                        self.event_loop.call_soon_threadsafe(self.event_loop.stop)
-                        break
-                    case _:
-                        self.log(f"Invalid instruction received from OBDH: {command}")
+            match command:                    
+                case "get_state":
+                    self.pipe.reply(self.state)
+                case "log" if "messages" in args:
+                    asyncio.run_coroutine_threadsafe(self.send_logs(args["messages"], args.get("dropped", 0)), self.event_loop)
+                case "log":
+                    asyncio.run_coroutine_threadsafe(self.send_log(args["message"]), self.event_loop)
+                case "send_message":
+                    priority = DownlinkPriority[args.get("priority", "result").upper()]
+                    asyncio.run_coroutine_threadsafe(self.send_message(args["message"], priority), self.event_loop)
+                case "send_data":
+                    asyncio.run_coroutine_threadsafe(self.send_data(args["data"]), self.event_loop)
+                case "send_file":
+                    asyncio.run_coroutine_threadsafe(self.send_file(args["path"]), self.event_loop)
+                case "send_frame":
+                    asyncio.run_coroutine_threadsafe(self.send_frame(args.get("sequence")), self.event_loop)
+                case "health_check":
+                    health = self.health_check()
+                    self.pipe.reply(health)
+                case "stop":
+                    self.log("OBDH listener shutting down...")
+                    self.event_loop.call_soon_threadsafe(self.downlink_queue.flush)
+                    self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+                    break
+                case _:
+                    self.log(f"Invalid instruction received from OBDH: {command}")
 
     async def start_server(self):
         try:
             await websockets.serve(self.handle_connection, self.ip, self.port)
             self.log(f"Listening for connections on {self.host_name} ({self.ip}:{self.port})")
             self.state = TTCState.READY
-            self.pipe.send(self.state == TTCState.READY)
+            self.timeline.mark("server")
+            self.pipe.send(("ready", {"ready": True, "timeline": self.timeline.to_dict()}))
             self.log("Ready")
         except Exception as e:
             self.log(f"[ERROR] Could not start WebSocket server: {e}")
+            self.pipe.send(("ready", {"ready": False, "timeline": self.timeline.to_dict()}))
 
     async def handle_connection(self, connection):
         self.connection = connection
         self.state = TTCState.CONNECTED
+        self.transfer_protocol = 1
+        self.link_queried = False
         self.last_command_received = datetime.now().strftime("%d-%m-%Y %H:%M:%S GMT")
         self.log(f"Connection established with {self.connection.remote_address[0]}:{self.connection.remote_address[1]}")
+        self.start_drain(self.DRAIN_DELAY)
 
-        while self.state == TTCState.CONNECTED:
+        # Ground may reconnect before a dropped connection is noticed, this handler then leaves the new one alone
+        while self.state == TTCState.CONNECTED and self.connection is connection:
             try:
                 await self.handle_message()
             except websockets.exceptions.ConnectionClosed:
-                self.log(f"Connection with {self.connection.remote_address[0]}:{self.connection.remote_address[1]} dropped")
-                self.connection = None
-                self.state = TTCState.READY
+                self.log(f"Connection with {connection.remote_address[0]}:{connection.remote_address[1]} dropped")
+
+                if self.connection is connection:
+                    self.connection = None
+                    self.state = TTCState.READY
+
                 break
             except Exception as e:
                 self.log(f"[ERROR] WebSocket connection handler failed: {e}")
@@ -125,6 +163,12 @@ class TTC:
     async def handle_message(self):
         message = await self.connection.recv()
         self.last_command_received = datetime.now().strftime("%d-%m-%Y %H:%M:%S GMT")
+
+        # Transfer acknowledgements are frequent, they are not logged (logs are sent to Ground too)
+        if message.startswith(("ack ", "nack ", "done ")):
+            self.handle_acknowledgement(message)
+            return
+
         self.log(f"({self.last_command_received}) TT&C received: {message}")
         await self.process_command(message)
 
@@ -134,44 +178,112 @@ class TTC:
         except Exception as err:
             self.log(f"[ERROR] Failed to send \"pong\": {err}")
 
+    async def downlink(self, message, priority):
+        """
+        Send a message to Ground, or queue it if Ground is not connected or messages as urgent are still queued (it
+        is sent in its turn when the queue drains). Returns whether it was sent now.
+        """
+        if self.connection is not None and not self.downlink_queue.backlog(priority):
+            try:
+                await self.connection.send(message)
+                return True
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        self.enqueue(priority, "message", message)
+        return False
+
+    def enqueue(self, priority, kind, payload):
+        evicted = self.downlink_queue.put(priority, kind, payload)
+
+        if evicted:
+            self.log(f"[ERROR] Downlink queue full, dropped {evicted} queued records ({self.downlink_queue.get_statistics()})")
+
+        if self.connection is not None:
+            self.start_drain()
+
+    def start_drain(self, delay=0.0):
+        if self.downlink_queue.pending_bytes() > 0 and (self.drain_task is None or self.drain_task.done()):
+            self.drain_task = asyncio.ensure_future(self.drain_downlink(delay))
+
+    async def drain_downlink(self, delay=0.0):
+        """Send what was queued while Ground was away, most urgent first, until the queue is empty or Ground leaves."""
+        await asyncio.sleep(delay)
+        sent = 0
+        failed = set()  # Files Ground did not get on this drain, queued again behind the other files
+
+        while (connection := self.connection) is not None and (queued := self.downlink_queue.peek()) is not None:
+            priority, record = queued
+
+            if record["kind"] == "file":
+                if record["payload"] in failed:
+                    break
+
+                if not os.path.isfile(record["payload"]):
+                    self.log(f"[ERROR] Queued {record['payload']} no longer exists, dropped")
+                # Popped only once Ground has the whole file, over the chunked protocol once it answered done
+                elif not await self.send_archive(record["payload"], "file", wait=True):
+                    if self.connection is not connection:
+                        break  # Ground left, the file stays queued
+
+                    # e.g. the link dropped before the connection handler noticed, or Ground stopped acknowledging
+                    self.log(f"[ERROR] Queued {record['payload']} could not be sent, queued again")
+                    failed.add(record["payload"])
+                    self.downlink_queue.pop(priority, record)
+                    self.enqueue(priority, "file", record["payload"])
+                    continue
+            else:
+                try:
+                    await connection.send(record["payload"])
+                except websockets.exceptions.ConnectionClosed:
+                    break
+
+            self.downlink_queue.pop(priority, record)
+            sent += 1
+
+        if sent:
+            self.log(f"Sent {sent} queued records to Ground, queue: {self.downlink_queue.get_statistics()}")
+
     async def send_log(self, message):
-        if (self.state == TTCState.CONNECTED):
-            self.log(f"Sending \"{message}\" to Ground...")
+        await self.send_logs([message])
 
-            try:
-                await self.connection.send(json.dumps({"type": MessageType.LOG.name.lower(), "data": message}))
-                self.log(f"Sent \"{message}\" to Ground")
-            except Exception as err:
-                self.log(f"[ERROR] Failed to send \"{message}\": {err}")
-        else:
-            self.log("Not connected to ground, log not sent")
+    async def send_logs(self, messages, dropped=0):
+        """
+        Send a batch of OBDH log lines (see OBDH.ttc_handler.TTCHandler) to Ground as one log message, a line each,
+        with the number of records the handler left out. Sent lines are not logged again here.
+        """
+        if dropped:
+            messages = messages + [f"[{dropped} log records not forwarded (rate limited)]"]
+
+        if not messages:
+            return
+
+        if not await self.downlink(json.dumps({"type": MessageType.LOG.name.lower(), "data": "\n".join(messages)}), DownlinkPriority.LOG):
+            self.log(f"Not connected to ground, {len(messages)} log lines queued")
 
     async def send_data(self, data):
         self.log(f"Sending {data} to Ground...")
 
-        try:
-            await self.connection.send(json.dumps({"type": MessageType.DATA.name.lower(), "data": data}))
+        if await self.downlink(json.dumps({"type": MessageType.DATA.name.lower(), "data": data}), DownlinkPriority.RESULT):
             self.log(f"Sent {data} to Ground")
-        except Exception as err:
-            self.log(f"[ERROR] Failed to send {data}: {err}")    
-    
-    async def send_message(self, message):
+        else:
+            self.log(f"Queued {data} for Ground")
+
+    async def send_message(self, message, priority=DownlinkPriority.REPLY):
         self.log(f"Sending \"{message}\" to Ground...")
 
-        try:
-            await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.MESSAGE.name.lower(), "data": message}))
+        if await self.downlink(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.MESSAGE.name.lower(), "data": message}), priority):
             self.log(f"Sent \"{message}\" to Ground")
-        except Exception as err:
-            self.log(f"[ERROR] Failed to send \"{message}\": {err}")
+        else:
+            self.log(f"Queued \"{message}\" for Ground")
 
     async def send_error(self, message):
         self.log(f"Sending \"{message}\" to Ground...")
 
-        try:
-            await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.MESSAGE.name.lower(), "data": f"[ERROR] {message}"}))
+        if await self.downlink(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.MESSAGE.name.lower(), "data": f"[ERROR] {message}"}), DownlinkPriority.REPLY):
             self.log(f"Sent \"{message}\" to Ground")
-        except Exception as err:
-            self.log(f"[ERROR] Failed to send \"{message}\": {err}")
+        else:
+            self.log(f"Queued \"{message}\" for Ground")
 
     async def process_command(self, msg):
         self.log("Processing command...")
@@ -194,6 +306,22 @@ class TTC:
                         await self.send_error(f"{path} does not exist!")
                 else:
                     await self.send_error("No file path provided!")
+            case "transfer_protocol":
+                protocol = int(arguments[0]) if arguments else 1
+
+                if protocol in (1, PROTOCOL_VERSION):
+                    self.transfer_protocol = protocol
+                    await self.send_message(f"Transfer protocol {protocol}")
+                else:
+                    await self.send_error(f"{protocol} is not a valid transfer protocol!")
+            case "resume":
+                if arguments and len(arguments) == 2:
+                    await self.resume_transfer(int(arguments[0]), int(arguments[1]))
+                else:
+                    await self.send_error("No transfer or chunk provided!")
+            case "get_frame":
+                sequence = int(arguments[0]) if arguments else None
+                await self.send_frame(sequence)
             case "test_wheel":
                 kp = arguments[0]
                 ki = arguments[1]
@@ -201,6 +329,10 @@ class TTC:
                 #time = arguments[3]
                 self.pipe.send(("test_wheel", [kp, ki, kd]))
                 await self.send_message("Testing wheel...")
+            case "tune_wheel":
+                samples = int(arguments[0]) if arguments else 2000
+                self.pipe.send(("tune_wheel", {"samples": samples}))
+                await self.send_message("Tuning wheel...")
             case "start_phase":
                 if arguments:
                     phase = int(arguments[0])
@@ -237,90 +369,269 @@ class TTC:
                 self.log(f"[ERROR] Invalid command received: {command}")
                 await self.send_error(f"{command} is not a valid command!")
 
-    async def send_file(self, path):
-        retries = 0
-        
-        while retries < self.MAX_RETRIES:
-            self.log(f"Sending file {path} to Ground... (Attempt {retries + 1})")
+    def handle_acknowledgement(self, message):
+        kind, transfer_id, *sequence = message.split(" ")
+        transfer = self.transfers.get(int(transfer_id))
 
-            try:
-                if not os.path.exists(path):
-                    self.log(f"[ERROR] {path} does not exist!")
-                    break
+        if transfer is None:
+            return
 
-                if not os.path.isfile(path):
-                    self.log(f"[ERROR] {path} is not a file!")
-                    break
+        match kind:
+            case "ack":
+                transfer.acknowledge(int(sequence[0]))
+            case "nack":
+                transfer.rewind(int(sequence[0]))
+            case "done":
+                transfer.finish()
 
-                zip_path = zip_file(path)
-                zip_file_size = os.path.getsize(zip_path)
-                self.log("Sending file metadata...")
-                await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEMETADATA.name.lower(), "data": {"size": zip_file_size, "name": f"{os.path.basename(path)}.zip"}}))
-                self.log("Sent file metadata")
+    async def send_chunk(self, message):
+        if self.connection is None:
+            raise ConnectionError("Not connected to Ground")
 
-                with open(zip_path, "rb") as f:
-                    self.log("Sending file data...")
-                    await self.connection.send("File transfer started")
+        await self.connection.send(message)
 
-                    while chunk := f.read(self.BUFFER_SIZE):
-                        await self.connection.send(chunk)
+    async def send_summary(self, summary):
+        await self.send_chunk(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEDATA.name.lower(), "data": summary}))
 
-                    self.log("Sent file data")
-                    await self.connection.send("File transfer complete")
+    async def start_transfer(self, name, data=None, extra=None, stream=None):
+        """
+        Announce a file (data, or a stream of blocks, see OutgoingTransfer) over the chunked protocol and send it in
+        the background (ACKs come in through handle_message).
+        """
+        await self.update_link()
+        transfer = OutgoingTransfer(name, data, self.BUFFER_SIZE, extra=extra, stream=stream, monitor=self.link)
 
-                break
-            except Exception as err:
-                # Handle other general errors
-                self.log(f"[ERROR] {err}, retrying...")
-            finally:
-                if zip_path and os.path.exists(zip_path):
-                    os.unlink(zip_path)
+        # Forget the oldest transfers Ground never resumed
+        for stale in [transfer_id for transfer_id, old in self.transfers.items() if old.task is None or old.task.done()][:max(0, len(self.transfers) + 1 - self.MAX_TRANSFERS)]:
+            del self.transfers[stale]
 
-            retries += 1
+        self.transfers[transfer.id] = transfer
+        await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEMETADATA.name.lower(), "data": transfer.metadata()}))
+        transfer.task = asyncio.ensure_future(self.run_transfer(transfer))
 
-        if retries >= self.MAX_RETRIES:
-            self.log(f"[ERROR] Failed to send file {path} after {self.MAX_RETRIES} retries!")
+        return transfer
+
+    async def run_transfer(self, transfer):
+        """Send a chunked transfer, returns whether Ground acknowledged all of it."""
+        self.log(f"Sending {transfer.name} from chunk {transfer.acked} (transfer {transfer.id})...")
+
+        try:
+            complete = await transfer.run(self.send_chunk, self.send_summary, ack_timeout=ACK_TIMEOUT, max_retries=self.MAX_RETRIES)
+        except (websockets.exceptions.ConnectionClosed, ConnectionError) as err:
+            self.log(f"[ERROR] Transfer {transfer.id} interrupted at chunk {transfer.acked} ({err}), Ground can resume it")
+            return False
+        except Exception as err:
+            # e.g. a file of the archive could not be read, there is nothing to resume
+            self.transfers.pop(transfer.id, None)
+            self.log(f"[ERROR] Transfer {transfer.id} of {transfer.name} failed: {err}")
+            return False
+
+        if complete:
+            self.transfers.pop(transfer.id, None)
+            chunk_sizes = ", ".join(f"{size} bytes from chunk {sequence}" for sequence, size in transfer.chunk_sizes)
+            self.log(f"Sent {transfer.name} ({transfer.size} bytes) in {transfer.chunks} chunks ({transfer.sent - transfer.chunks} sent again), chunk size {chunk_sizes}")
+            self.log(f"Downlink: {self.describe_link()}")
+        else:
+            self.log(f"[ERROR] Transfer {transfer.id} not acknowledged after chunk {transfer.acked}, Ground can resume it")
+
+        return complete
+
+    async def resume_transfer(self, transfer_id, sequence):
+        transfer = self.transfers.get(transfer_id)
+
+        if transfer is None:
+            await self.send_error(f"Transfer {transfer_id} is unknown or complete!")
+            return
+
+        transfer.resume(sequence)
+
+        # A transfer still running (e.g. waiting for an ACK when the link dropped) carries on by itself
+        if transfer.task is None or transfer.task.done():
+            transfer.task = asyncio.ensure_future(self.run_transfer(transfer))
+
+    async def update_link(self):
+        """
+        Link estimates that do not come from transfers: the WebSocket ping latency and, until a transfer measured the
+        goodput, the bit rate iwconfig reports (asked once per connection).
+        """
+        self.link.set_latency(getattr(self.connection, "latency", None))
+
+        if self.link.goodput() is None and not self.link_queried:
+            self.link_queried = True
+            self.link.set_connection_info(await asyncio.to_thread(get_connection_info))
+
+    def describe_link(self):
+        statistics = self.link.get_statistics()
+        goodput = f"{statistics['goodput'] / 1e6:.2f} MB/s" if statistics["goodput"] is not None else "unknown"
+        rtt = f"{statistics['rtt'] * 1000:.0f} ms (least {statistics['min_rtt'] * 1000:.0f} ms)" if statistics["rtt"] is not None else "unknown"
+
+        return f"goodput {goodput}, RTT {rtt}, {statistics['loss'] * 100:.1f}% of chunks sent again, chunk size {statistics['chunk_size']} bytes"
+
+    def codec_chooser(self, codecs):
+        """
+        zip_stream choose callback compressing each file as the link estimate makes it quickest to downlink (see
+        LinkMonitor.choose_codec), logging when the choice changes. The choices are kept, so that the archive is the
+        same if the stream is read again for a retry.
+        """
+        choices = {}
+        last = [None]
+
+        def choose(path, sample):
+            if path not in choices:
+                choices[path] = self.link.choose_codec(path, sample, codecs)
+
+                if choices[path][0] != last[0]:
+                    last[0] = choices[path][0]
+                    self.log(f"Compressing {os.path.basename(path)} with {last[0]} ({self.describe_link()})")
+
+            return choices[path][1:]
+
+        return choose
+
+    async def send_archive(self, path, kind, wait=False):
+        """
+        Send a file or folder as a zip archive compressed while it is sent (see zip_stream), over the chunked
+        protocol or, for protocol 1, in one go (retried from the start up to MAX_RETRIES times).
+        Returns whether it was sent. For the chunked protocol, that is whether the transfer started (it can be
+        resumed), or with wait, whether Ground acknowledged the whole archive.
+        """
+        name = f"{os.path.basename(os.path.normpath(path))}.zip"
+
+        if self.transfer_protocol >= PROTOCOL_VERSION:
+            try:
+                files = archive_files(path)
+                choose = self.codec_chooser(CODECS)
+                transfer = await self.start_transfer(name, stream=lambda: zip_stream(files, choose=choose))
+            except Exception as err:
+                self.log(f"[ERROR] Failed to send {kind} {path}: {err}")
+                return False
+
+            return await transfer.task if wait else True
 
-    async def send_folder(self, path):
         retries = 0
-        
+
         while retries < self.MAX_RETRIES:
-            self.log(f"Sending folder {path} to Ground... (Attempt {retries + 1})")
+            self.log(f"Sending {kind} {path} to Ground... (Attempt {retries + 1})")
+            stream = None
 
             try:
-                if not os.path.exists(path):
-                    self.log(f"[ERROR] {path} does not exist!")
-                    break
+                await self.update_link()
+                files = archive_files(path)
+                stream = zip_stream(files, choose=self.codec_chooser(LEGACY_CODECS))
+                # The archive size is only known once it is sent, the size of the files is close for progress
+                size = sum(os.path.getsize(file_path) for file_path, _ in files)
+                self.log(f"Sending {kind} metadata...")
+                await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEMETADATA.name.lower(), "data": {"size": size, "name": name}}))
+                self.log(f"Sent {kind} metadata")
 
-                if not os.path.isdir(path):
-                    self.log(f"[ERROR] {path} is not a folder!")
-                    break
+                self.log(f"Sending {kind} data...")
+                await self.connection.send("File transfer started")
 
-                zip_path = zip_folder(path)
-                zip_file_size = os.path.getsize(zip_path)
-                self.log("Sending folder metadata...")
-                await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEMETADATA.name.lower(), "data": {"size": zip_file_size, "name": f"{os.path.basename(path)}.zip"}}))
-                self.log("Sent folder metadata")
+                # Compressed block by block off the event loop while the previous blocks are sent
+                while (block := await asyncio.to_thread(next, stream, None)) is not None:
+                    chunk_size = self.link.chunk_size()
+                    sending = asyncio.get_running_loop().time()
 
-                with open(zip_path, "rb") as f:
-                    self.log("Sending folder data...")
-                    await self.connection.send("File transfer started")
+                    for start in range(0, len(block), chunk_size):
+                        await self.connection.send(block[start:start + chunk_size])
 
-                    while chunk := f.read(self.BUFFER_SIZE):
-                        await self.connection.send(chunk)
+                    # There are no ACKs, but sends wait for the socket once its buffer is full, they then go at the
+                    # pace of the link
+                    elapsed = asyncio.get_running_loop().time() - sending
 
-                    self.log("Sent folder data")
-                    await self.connection.send("File transfer complete")
+                    if elapsed >= BLOCKED_SEND_TIME:
+                        self.link.record_delivery(len(block) / elapsed)
+
+                self.log(f"Sent {kind} data")
+                await self.connection.send("File transfer complete")
 
                 break
             except Exception as err:
                 # Handle other general errors
                 self.log(f"[ERROR] {err}, retrying...")
             finally:
-                if zip_path and os.path.exists(zip_path):
-                    os.unlink(zip_path)
+                if stream is not None:
+                    stream.close()
 
             retries += 1
 
         if retries >= self.MAX_RETRIES:
-            self.log(f"[ERROR] Failed to send folder {path} after {self.MAX_RETRIES} retries!")
\ No newline at end of file
+            self.log(f"[ERROR] Failed to send {kind} {path} after {self.MAX_RETRIES} retries!")
+            return False
+
+        return True
+
+    async def send_file(self, path):
+        if not os.path.exists(path):
+            self.log(f"[ERROR] {path} does not exist!")
+            return
+
+        if not os.path.isfile(path):
+            self.log(f"[ERROR] {path} is not a file!")
+            return
+
+        # Bulk files go last, after anything more urgent Ground missed
+        if self.connection is None or self.downlink_queue.backlog(DownlinkPriority.FILE):
+            self.log(f"Queued {path} for Ground")
+            self.enqueue(DownlinkPriority.FILE, "file", os.path.abspath(path))
+            return
+
+        connection = self.connection
+
+        if not await self.send_archive(path, "file") and self.connection is not connection:
+            self.log(f"Ground left during the transfer, queued {path} for Ground")
+            self.enqueue(DownlinkPriority.FILE, "file", os.path.abspath(path))
+
+    async def send_frame(self, sequence=None):
+        """Send a frame (the latest by default) straight from the Payload's frame ring as a JPEG, without touching disk."""
+        self.log(f"Sending frame {sequence if sequence is not None else '(latest)'} to Ground...")
+
+        try:
+            if self.frame_ring is None:
+                self.frame_ring = FrameRing.attach()
+
+            frame = self.frame_ring.read(sequence, copy=False)
+
+            if frame is None:
+                await self.send_error(f"Frame {sequence if sequence is not None else '(latest)'} is not available!")
+                return
+
+            image, metadata = frame
+            jpeg = encode_frame(image)
+            del image
+
+            # The slot was encoded in place, make sure the Payload did not overwrite it meanwhile
+            if not self.frame_ring.is_valid(metadata):
+                await self.send_error(f"Frame {metadata['sequence']} was overwritten while encoding!")
+                return
+
+            name = f"frame_{metadata['sequence']}_camera{metadata['camera']}.jpg"
+            data = zip_bytes(name, jpeg)
+
+            if self.transfer_protocol >= PROTOCOL_VERSION:
+                await self.start_transfer(f"{name}.zip", data, extra={"frame": metadata})
+                return
+
+            await self.connection.send(json.dumps({"timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"), "type": MessageType.FILEMETADATA.name.lower(), "data": {"size": len(data), "name": f"{name}.zip", "frame": metadata}}))
+            await self.connection.send("File transfer started")
+
+            for start in range(0, len(data), self.BUFFER_SIZE):
+                await self.connection.send(data[start:start + self.BUFFER_SIZE])
+
+            await self.connection.send("File transfer complete")
+            self.log(f"Sent frame {metadata['sequence']}")
+        except FileNotFoundError:
+            await self.send_error("No frames available, the Payload has not started!")
+        except Exception as err:
+            self.log(f"[ERROR] Failed to send frame: {err}")
+
+    async def send_folder(self, path):
+        if not os.path.exists(path):
+            self.log(f"[ERROR] {path} does not exist!")
+            return
+
+        if not os.path.isdir(path):
+            self.log(f"[ERROR] {path} is not a folder!")
+            return
+
+        await self.send_archive(path, "folder")
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+import zlib
+
+# Chunked file downlink (transfer protocol 2)
+#   TT&C -> Ground: filemetadata JSON with the transfer ID and chunk size (of the first chunk if it adapts to the
+#                   link), and the chunk count and SHA-256 of the file when they are known up front (null for a
+#                   file compressed while it is sent or chunked as the link allows), then
+#                   binary chunks, each a CHUNK_HEADER followed by a chunk of the file, then
+#                   filedata JSON with the transfer ID, size, chunk count and SHA-256 once the last chunk is sent
+#   Ground -> TT&C: "ack <transfer> <next>" once it holds every chunk before next (cumulative),
+#                   "nack <transfer> <sequence>" to have chunks sent again from sequence (bad CRC, gap, bad digest),
+#                   "resume <transfer> <next>" after a reconnect, to carry on from next instead of starting over,
+#                   "done <transfer>" once it has the whole file and its digest matches
+# At most a window of chunks is sent ahead of the last ACK. Without an ACK for ack_timeout the unacknowledged
+# chunks are sent again, and after max_retries such timeouts the transfer is left for the Ground to resume.
+CHUNK_HEADER = struct.Struct(">III")  # transfer ID, sequence number, CRC32 of the chunk data
+PROTOCOL_VERSION = 2
+WINDOW = 32  # chunks
+ACK_TIMEOUT = 5.0  # s
+
+def encode_chunk(transfer_id, sequence, data):
+    return CHUNK_HEADER.pack(transfer_id, sequence, zlib.crc32(data)) + data
+
+def decode_chunk(message):
+    """(transfer ID, sequence number, data) of a chunk, raises ValueError if it is truncated or its CRC is wrong."""
+    if len(message) < CHUNK_HEADER.size:
+        raise ValueError(f"Chunk of {len(message)} bytes is shorter than its header")
+    transfer_id, sequence, crc = CHUNK_HEADER.unpack_from(message)
+    data = bytes(message[CHUNK_HEADER.size:])
+    if zlib.crc32(data) != crc:
+        raise ValueError(f"Chunk {sequence} of transfer {transfer_id} failed its CRC")
+    return transfer_id, sequence, data
+
+def new_transfer_id():
+    return random.getrandbits(32)
+
+def _read_blocks(blocks, size):
+    """At least size bytes of blocks from an iterator, and whether it ended."""
+    read, total = [], 0
+    while total < size:
+        block = next(blocks, None)
+        if block is None:
+            return read, True
+        read.append(block)
+        total += len(block)
+    return read, False
+
+class OutgoingTransfer:
+    """
+    Sending end of a transfer, of data in memory or of a stream: a function returning an iterator over the file in
+    blocks (e.g. TTC.utils.zip_stream), read as the chunks are sent. Only the chunks the Ground has not acknowledged
+    are kept, so a retry or a resume after a reconnect only sends what the Ground is missing. Going back further
+    (the digest did not match) replays the stream from the start.
+    With a monitor (TTC.link.LinkMonitor), the ACKs are timed to measure the link and each new chunk is cut to the
+    size the monitor gives, so the chunk size follows the link during the transfer.
+    """
+    def __init__(self, name, data=None, chunk_size=1024, transfer_id=None, extra=None, stream=None, monitor=None):
+        self.id = transfer_id if transfer_id is not None else new_transfer_id()
+        self.name = name
+        self.monitor = monitor
+        self.chunk_size = monitor.chunk_size() if monitor is not None else chunk_size
+        self.chunk_sizes = [(0, self.chunk_size)]  # (first chunk, size) each time the chunk size changed
+        self.extra = extra or {}
+        self.acked = 0  # The Ground holds every chunk before this one
+        self.next = 0  # Next chunk to send
+        self.sent = 0  # Chunks sent, retransmissions included
+        self.done = False  # The Ground checked the digest
+        self.progress = asyncio.Event()
+        self.task = None
+
+        self.streamed = data is None
+        self._stream = (lambda: iter((data,))) if data is not None else stream
+        self._blocks = None
+        self._buffer = bytearray()  # Unacknowledged part of the file
+        self._buffer_start = 0  # Offset of _buffer in the file
+        self._produced = 0  # Bytes read from the stream in this pass
+        self._exhausted = False
+        self._replay = False
+        self._summary_sent = False
+        self._offsets = [0]  # Start of each chunk cut so far and end of the last one
+        self._first_sent = 0  # Chunks sent at least once, the others sent are sent again
+        self._sent_at = {}  # Chunk sent once and not acknowledged -> (send time, bytes acknowledged then)
+        self._hash = hashlib.sha256()
+        self._hashed = 0
+        self.chunks = None
+        if data is not None:
+            self.size, self.digest = len(data), hashlib.sha256(data).hexdigest()
+            self._hashed = len(data)
+            if monitor is None:
+                self.chunks = max(1, -(-self.size // chunk_size))  # An empty file is one empty chunk
+        else:
+            self.size = self.digest = None
+
+    @property
+    def complete(self):
+        return self.done
+
+    def metadata(self):
+        return {"size": self.size, "name": self.name, "protocol": PROTOCOL_VERSION, "transfer": self.id, "chunk_size": self.chunk_size,
+                "chunks": self.chunks, "sha256": self.digest, **self.extra}
+
+    def summary(self):
+        return {"transfer": self.id, "size": self.size, "chunks": self.chunks, "sha256": self.digest}
+
+    def _restart(self, offset):
+        if self._blocks is not None and hasattr(self._blocks, "close"):
+            self._blocks.close()
+        self._blocks = None
+        self._buffer = bytearray()
+        self._buffer_start = offset
+        self._produced = 0
+        self._exhausted = False
+
+    def _append(self, block):
+        start = self._produced
+        self._produced += len(block)
+        if self._produced > self._hashed:
+            self._hash.update(memoryview(block)[self._hashed - start:])
+            self._hashed = self._produced
+        kept = self._buffer_start + len(self._buffer)
+        if self._produced > kept:
+            self._buffer += memoryview(block)[max(0, kept - start):]
+
+    def _next_chunk_size(self, sequence):
+        if self.monitor is not None:
+            size = self.monitor.chunk_size()
+            if size != self.chunk_size:
+                self.chunk_size = size
+                self.chunk_sizes.append((sequence, size))
+        return self.chunk_size
+
+    async def chunk(self, sequence):
+        """Chunk message, None past the end of the file."""
+        if self._replay:
+            # Only here, the stream may be being read on another thread at any other time
+            self._replay = False
+            self._restart(0)
+            self._hash = hashlib.sha256()
+            self._hashed = 0
+            self._offsets = [0]
+            self.size = self.chunks = self.digest = None
+        if self.chunks is not None and sequence >= self.chunks:
+            return None
+        cut = sequence == len(self._offsets) - 1  # A new chunk, sent for the first time
+        start = self._offsets[sequence]
+        end = start + self._next_chunk_size(sequence) if cut else self._offsets[sequence + 1]
+        if start < self._buffer_start:
+            self._restart(start)
+        if self._produced < end and not self._exhausted:
+            if self._blocks is None:
+                self._blocks = iter(self._stream())
+            # Reading and compressing the source files must not hold up the event loop. The blocks are added here,
+            # as ACKs release the start of the buffer meanwhile.
+            blocks, self._exhausted = await asyncio.to_thread(_read_blocks, self._blocks, end - self._produced)
+            for block in blocks:
+                self._append(block)
+            if self._exhausted and self.digest is None:
+                self.size, self.digest = self._produced, self._hash.hexdigest()
+        if cut:
+            if self._exhausted and start >= self._produced and sequence > 0:
+                self.chunks = sequence  # The file ended with the last chunk, an empty file is one empty chunk
+                return None
+            end = min(end, self._produced)
+            self._offsets.append(end)
+            if self._exhausted and end >= self._produced:
+                self.chunks = sequence + 1
+        offset = start - self._buffer_start
+        return encode_chunk(self.id, sequence, bytes(self._buffer[offset:offset + end - start]))
+
+    def _sent(self, sequence):
+        again = sequence < self._first_sent
+        if again:
+            self._sent_at.pop(sequence, None)  # The ACK could be for either copy, it does not measure the link
+        else:
+            self._first_sent = sequence + 1
+            self._sent_at[sequence] = (time.monotonic(), self._offsets[self.acked])
+        if self.monitor is not None:
+            self.monitor.record_sent(again)
+
+    def acknowledge(self, next_sequence):
+        if next_sequence > self.acked:
+            self.acked = min(next_sequence, len(self._offsets) - 1)
+            self.next = max(self.next, self.acked)
+            # Goodput over the round trip of the last chunk acknowledged: what the Ground acknowledged meanwhile
+            sent = self._sent_at.get(self.acked - 1)
+            if sent is not None and self.monitor is not None:
+                elapsed = time.monotonic() - sent[0]
+                self.monitor.record_delivery((self._offsets[self.acked] - sent[1]) / elapsed if elapsed > 0 else None, elapsed)
+            for sequence in [sequence for sequence in self._sent_at if sequence < self.acked]:
+                del self._sent_at[sequence]
+            release = min(self._offsets[self.acked] - self._buffer_start, len(self._buffer))
+            if release > 0:
+                del self._buffer[:release]
+                self._buffer_start += release
+            self.progress.set()
+
+    def resume(self, next_sequence):
+        """Carry on from next_sequence, the first chunk the Ground is missing after a reconnect."""
+        self.acknowledge(next_sequence)
+        self.next = self.acked
+        self._summary_sent = False
+        self.progress.set()
+
+    def rewind(self, sequence):
+        """Send again from sequence (NACK). From 0, the file failed its digest and a stream is hashed again."""
+        sequence = max(0, min(sequence, len(self._offsets) - 1))
+        if sequence == 0 and self.streamed:
+            self._replay = True
+        self.acked = min(self.acked, sequence)
+        self.next = sequence
+        self._summary_sent = False
+        self.progress.set()
+
+    def finish(self):
+        self.done = True
+        self._buffer = bytearray()
+        self.progress.set()
+
+    async def run(self, send, send_summary=None, window=WINDOW, ack_timeout=ACK_TIMEOUT, max_retries=3):
+        """
+        Send the chunks with send(message) and, after the last one, the summary with send_summary(summary), until the
+        Ground confirms the file (True) or max_retries timeouts in a row (False).
+        """
+        retries = 0
+        while not self.done:
+            acked = self.acked
+            while (self.chunks is None or self.next < self.chunks) and self.next < self.acked + window:
+                sequence = self.next
+                message = await self.chunk(sequence)
+                if message is None:
+                    break  # The stream ended, the chunk count is known now
+                if self.next != sequence:
+                    continue  # ACKed or rewound while the stream was read
+                self.next += 1
+                self._sent(sequence)  # Before sending, the ACK may come back before send() returns
+                await send(message)
+                self.sent += 1
+
+            if self.chunks is not None and self.next >= self.chunks and not self._summary_sent:
+                if send_summary is not None:
+                    await send_summary(self.summary())
+                self._summary_sent = True
+
+            if self.acked == acked and not self.done:
+                self.progress.clear()
+                try:
+                    await asyncio.wait_for(self.progress.wait(), ack_timeout)
+                except asyncio.TimeoutError:
+                    retries += 1
+                    if retries >= max_retries:
+                        return False
+                    self.next = self.acked  # Go back to the first unacknowledged chunk
+                    self._summary_sent = False
+                    continue
+            if self.acked > acked:
+                retries = 0
+        self._restart(0)  # Closes the stream (and its files)
+        return True
+
+class IncomingTransfer:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.id = metadata["transfer"]
+        self.chunks = metadata["chunks"]  # None until the summary for a streamed file
+        self.sha256 = metadata["sha256"]
+        self.data = bytearray()
+        self.next = 0
+        self.nacked = None  # Chunk last asked for again, the chunks already in flight after it do not ask again
+
+    def nack(self):
+        if self.nacked == self.next:
+            return []
+        self.nacked = self.next
+        return [f"nack {self.id} {self.next}"]
+
+class FileReceiver:
+    """
+    Reference Ground end of the protocol, independent of the connection: handle_metadata(), handle_chunk() and
+    handle_summary() take what TT&C sent and return the messages to send back. Transfers interrupted by a
+    disconnect are kept, so that resume_messages() can carry them on after reconnecting.
+    """
+    def __init__(self, ack_every=WINDOW // 2):
+        self.ack_every = ack_every
+        self.transfers = {}
+        self.completed = set()  # IDs of the transfers received, to confirm them again if "done" was lost
+        self.corrupted = 0  # Chunks dropped for a bad CRC
+
+    def handle_metadata(self, metadata):
+        transfer = self.transfers.get(metadata["transfer"])
+        if transfer is not None and transfer.metadata["name"] == metadata["name"]:
+            return [f"resume {transfer.id} {transfer.next}"]
+        self.transfers[metadata["transfer"]] = IncomingTransfer(metadata)
+        return []
+
+    def handle_chunk(self, message):
+        """(messages to send back, (name, data) of the file once complete and verified, else None)"""
+        try:
+            transfer_id, sequence, data = decode_chunk(message)
+        except ValueError:
+            self.corrupted += 1
+            if len(message) < CHUNK_HEADER.size:
+                return [], None
+            transfer_id, sequence, _ = CHUNK_HEADER.unpack_from(message)
+            transfer = self.transfers.get(transfer_id)
+            return (transfer.nack() if transfer is not None else []), None
+
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None:
+            return [], None  # Not announced or already complete
+        if sequence < transfer.next:
+            return [], None  # Sent again before our ACK arrived
+        if sequence > transfer.next:
+            return transfer.nack(), None
+
+        transfer.data += data
+        transfer.next += 1
+        if transfer.chunks is not None and transfer.next >= transfer.chunks:
+            return self._verify(transfer)
+        return ([f"ack {transfer_id} {transfer.next}"] if transfer.next % self.ack_every == 0 else []), None
+
+    def handle_summary(self, summary):
+        """Same as handle_chunk(), for the summary sent after the last chunk."""
+        if summary["transfer"] in self.completed:
+            return [f"done {summary['transfer']}"], None
+        transfer = self.transfers.get(summary["transfer"])
+        if transfer is None:
+            return [], None
+        transfer.chunks, transfer.sha256 = summary["chunks"], summary["sha256"]
+        if transfer.next < transfer.chunks:
+            return transfer.nack(), None  # The last chunks were lost
+        return self._verify(transfer)
+
+    def _verify(self, transfer):
+        if transfer.sha256 is None:
+            return [f"ack {transfer.id} {transfer.next}"], None  # Waiting for the summary
+        del self.transfers[transfer.id]
+        if hashlib.sha256(transfer.data).hexdigest() != transfer.sha256:
+            self.transfers[transfer.id] = IncomingTransfer(transfer.metadata)
+            return [f"nack {transfer.id} 0"], None
+        self.completed.add(transfer.id)
+        return [f"done {transfer.id}"], (transfer.metadata["name"], bytes(transfer.data))
+
+    def resume_messages(self):
+        return [f"resume {transfer.id} {transfer.next}" for transfer in self.transfers.values()]
+
+async def receive_files(uri, command, output_dir=".", count=1, reconnect_delay=1.0, max_reconnects=10):
+    """
+    Reference client: connects to TT&C, switches to transfer protocol 2, sends command (e.g. "get_file health.txt")
+    and saves count files in output_dir, reconnecting and resuming if the link drops. Returns the saved paths.
+    """
+    import websockets
+
+    receiver = FileReceiver()
+    saved = []
+    reconnects = 0
+    first = True
+    while len(saved) < count:
+        try:
+            async with websockets.connect(uri) as connection:
+                await connection.send(f"transfer_protocol {PROTOCOL_VERSION}")
+                if first:
+                    await connection.send(command)
+                    first = False
+                for message in receiver.resume_messages():
+                    await connection.send(message)
+
+                async for message in connection:
+                    replies, received = [], None
+                    if isinstance(message, bytes):
+                        replies, received = receiver.handle_chunk(message)
+                    else:
+                        try:
+                            decoded = json.loads(message)
+                        except ValueError:
+                            continue
+                        if not isinstance(decoded, dict):
+                            continue
+                        if decoded.get("type") == "filemetadata" and decoded["data"].get("protocol") == PROTOCOL_VERSION:
+                            replies = receiver.handle_metadata(decoded["data"])
+                        elif decoded.get("type") == "filedata":
+                            replies, received = receiver.handle_summary(decoded["data"])
+                        elif decoded.get("type") == "message":
+                            print(decoded["data"])
+
+                    for reply in replies:
+                        await connection.send(reply)
+                    if received is not None:
+                        name, data = received
+                        path = os.path.join(output_dir, name)
+                        with open(path, "wb") as f:
+                            f.write(data)
+                        saved.append(path)
+                        if len(saved) >= count:
+                            return saved
+        except (OSError, websockets.exceptions.ConnectionClosed) as e:
+            reconnects += 1
+            if reconnects > max_reconnects:
+                raise ConnectionError(f"Gave up after {max_reconnects} reconnects: {e}")
+            print(f"Connection lost ({e}), reconnecting...")
+            await asyncio.sleep(reconnect_delay)
+    return saved
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download files from TT&C over the chunked transfer protocol")
+    parser.add_argument("uri", help="TT&C WebSocket, e.g. ws://192.168.1.10:8000")
+    parser.add_argument("command", help="Command that sends the file(s), e.g. \"get_file health.txt\"")
+    parser.add_argument("-o", "--output", default=".", help="Directory for the received files")
+    parser.add_argument("-n", "--count", type=int, default=1, help="Number of files to wait for")
+    arguments = parser.parse_args()
+
+    for path in asyncio.run(receive_files(arguments.uri, arguments.command, arguments.output, arguments.count)):
+        print(f"Saved {path}")
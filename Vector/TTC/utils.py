@@ -1,5 +1,6 @@
 import subprocess
 import re
+import io
 import os
 import tempfile
 import zipfile
@@ -65,4 +66,99 @@ def zip_folder(folder_path):
                 file_path = os.path.join(root, file)
                 zip_file.write(file_path, os.path.relpath(file_path, folder_path))
 
-    return zip_path
\ No newline at end of file
+    return zip_path
+
+# Already compressed, deflating them again costs CPU for next to nothing
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".npz", ".zip", ".gz")
+STREAM_BLOCK_SIZE = 64 * 1024
+
+class _StreamSink:
+    """Write-only file for zipfile, collecting what it writes until it is taken."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def archive_files(path):
+    """(path, name in the archive) of a file, or of the files of a folder."""
+    if os.path.isfile(path):
+        return [(path, os.path.basename(path))]
+
+    files = []
+
+    for root, _, names in sorted(os.walk(path)):
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            files.append((file_path, os.path.relpath(file_path, path)))
+
+    return files
+
+def zip_stream(files, block_size=STREAM_BLOCK_SIZE, choose=None):
+    """
+    Zip archive of files, a list of (path, name in the archive), generated block by block while the files are read,
+    so it can be sent as it is produced without a temporary file. Memory is bounded by about a block.
+    choose(path, first block) gives the (compress type, compress level) of each file. By default files with a
+    STORED_EXTENSIONS extension are stored and the others deflated.
+    """
+    sink = _StreamSink()
+
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for file_path, name in files:
+            info = zipfile.ZipInfo.from_file(file_path, name)
+
+            with open(file_path, "rb") as source:
+                block = source.read(block_size)
+
+                if choose is not None:
+                    info.compress_type, level = choose(file_path, block)
+                    info._compresslevel = level  # No public attribute before Python 3.13
+                else:
+                    info.compress_type = zipfile.ZIP_STORED if file_path.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+                with archive.open(info, "w") as target:
+                    while block:
+                        target.write(block)
+
+                        if len(sink.buffer) >= block_size:
+                            yield sink.take()
+
+                        block = source.read(block_size)
+
+            if sink.buffer:
+                yield sink.take()
+
+    if sink.buffer:
+        yield sink.take()
+
+def zip_bytes(name, data):
+    """Zip archive (in memory) holding data as a file called name."""
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(name, data, zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED)
+
+    return buffer.getvalue()
+
+def encode_frame(frame, quality=90):
+    """JPEG of a frame from the frame ring, the X channel of XRGB8888 frames is dropped."""
+    import cv2  # Only needed for previews, kept out of the TT&C startup
+
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        frame = frame[:, :, :3]
+
+    success, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+    if not success:
+        raise ValueError("Could not encode frame")
+
+    return jpeg.tobytes()
@@ -0,0 +1,148 @@
+import math
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+FRAME_RING_NAME = "vector_frames"
+
+# Shared memory layout: ring header, one metadata header per slot, then the frame data of each slot
+RING_HEADER = np.dtype([("slots", "<u4"), ("slot_bytes", "<u8"), ("latest", "<u8")])
+SLOT_HEADER = np.dtype([
+    ("sequence", "<u8"),  # 0 while the slot is being written
+    ("timestamp", "<f8"),  # s, sensor timestamp (monotonic clock)
+    ("yaw", "<f8"),  # deg at capture, NaN if unknown
+    ("camera", "<i4"),  # camera index, 0 left, 1 right
+    ("height", "<i4"),
+    ("width", "<i4"),
+    ("channels", "<i4")
+])
+DATA_ALIGNMENT = 64
+
+def _data_offset(slots: int) -> int:
+    size = RING_HEADER.itemsize + slots * SLOT_HEADER.itemsize
+    return (size + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 attaching registers the segment with the resource tracker (shared by all the subsystem
+    # processes), which would unlink it when this process exits although the Payload still owns it.
+    # Unregistering afterwards would also drop the Payload's registration, so registration is skipped instead.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == "shared_memory" else register(name, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+class FrameRing:
+    """
+    Ring of preallocated frame slots in shared memory, written by the Payload and read by any other process
+    (OBDH, TT&C, a vision worker) without disk round-trips or pickling.
+    Each slot has a metadata header (sequence number, timestamp, yaw at capture, camera, shape). There is a single
+    writer. The slot sequence number is cleared while the slot is written and set last, so a reader can tell a frame
+    that was overwritten while it was being read from a complete one (a seqlock).
+    Readers get a view of the slot (zero-copy) or a copy. A view stays valid until the writer wraps around to the
+    slot again, which is_valid() checks.
+    """
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        self._header = np.ndarray((), RING_HEADER, memory.buf)
+        self.slots = int(self._header["slots"])
+        self.slot_bytes = int(self._header["slot_bytes"])
+        self._slot_headers = np.ndarray((self.slots,), SLOT_HEADER, memory.buf, RING_HEADER.itemsize)
+        self._data = np.ndarray((self.slots, self.slot_bytes), np.uint8, memory.buf, _data_offset(self.slots))
+
+    @classmethod
+    def create(cls, name: str = FRAME_RING_NAME, slots: int = 8, slot_bytes: int = 1920 * 1080 * 4) -> "FrameRing":
+        """Allocate the ring (replacing a segment left behind by a previous run)."""
+        size = _data_offset(slots) + slots * slot_bytes
+        try:
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((), RING_HEADER, memory.buf)
+        header["slots"] = slots
+        header["slot_bytes"] = slot_bytes
+        header["latest"] = 0
+        np.ndarray((slots,), SLOT_HEADER, memory.buf, RING_HEADER.itemsize).fill(0)
+        del header
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = FRAME_RING_NAME) -> "FrameRing":
+        """Map an existing ring, raises FileNotFoundError if the Payload has not created it."""
+        return cls(_attach_shared_memory(name), owner=False)
+
+    @property
+    def latest_sequence(self) -> int:
+        """Sequence number of the last complete frame, 0 if none was written yet."""
+        return int(self._header["latest"])
+
+    def write(self, frame: np.ndarray, timestamp: float, yaw: Optional[float] = None, camera: int = -1) -> int:
+        """Copy a uint8 frame (H x W or H x W x C) into the next slot and return its sequence number."""
+        if frame.dtype != np.uint8:
+            raise ValueError(f"Frames must be uint8, not {frame.dtype}")
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"{frame.nbytes} byte frame does not fit in {self.slot_bytes} byte slots")
+
+        sequence = self.latest_sequence + 1
+        slot = sequence % self.slots
+        header = self._slot_headers[slot]
+        header["sequence"] = 0
+        np.copyto(self._data[slot, :frame.nbytes].reshape(frame.shape), frame)
+        header["timestamp"] = timestamp
+        header["yaw"] = math.nan if yaw is None else yaw
+        header["camera"] = camera
+        header["height"], header["width"] = frame.shape[:2]
+        header["channels"] = frame.shape[2] if frame.ndim == 3 else 1
+        header["sequence"] = sequence
+        self._header["latest"] = sequence
+        return sequence
+
+    def read(self, sequence: Optional[int] = None, copy: bool = True) -> Optional[Tuple[np.ndarray, Dict]]:
+        """
+        Frame and metadata of a sequence number (the latest by default).
+        Returns None if there is no such frame, it was overwritten or it is being written.
+        With copy=False the frame is a view of the slot, check is_valid(metadata) once done with it.
+        """
+        if sequence is None:
+            sequence = self.latest_sequence
+        if sequence <= 0 or sequence > self.latest_sequence:
+            return None
+
+        header = self._slot_headers[sequence % self.slots].copy()
+        if int(header["sequence"]) != sequence:
+            return None
+        height, width, channels = int(header["height"]), int(header["width"]), int(header["channels"])
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        frame = self._data[sequence % self.slots, :height * width * channels].reshape(shape)
+        if copy:
+            frame = frame.copy()
+        metadata = {
+            "sequence": sequence,
+            "timestamp": float(header["timestamp"]),
+            "yaw": None if math.isnan(header["yaw"]) else float(header["yaw"]),
+            "camera": int(header["camera"])
+        }
+        if not self.is_valid(metadata):
+            return None
+        return frame, metadata
+
+    def is_valid(self, metadata: Dict) -> bool:
+        """Whether the slot of a frame returned by read() still holds that frame."""
+        return int(self._slot_headers[metadata["sequence"] % self.slots]["sequence"]) == metadata["sequence"]
+
+    def close(self) -> None:
+        """Unmap the ring (views returned by read() must not be used afterwards), the owner also frees it."""
+        del self._header, self._slot_headers, self._data
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
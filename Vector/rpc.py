@@ -0,0 +1,285 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+# Messages on a subsystem pipe:
+#   OBDH -> subsystem: ("request", request_id, msg, args)
+#   subsystem -> OBDH: ("reply", request_id, value) for the answer to a request,
+#                      ("event", value) for anything the subsystem sends on its own, value is usually (msg, args)
+
+_CLOSED = object()  # Queued for receive() once the pipe is closed, None is a valid reply
+
+class RpcEndpoint:
+    """
+    Subsystem end of the pipe. Keeps the Connection interface the subsystems use (recv() returns (msg, args),
+    send() sends an unsolicited event) and adds reply() to answer the last received request.
+    send() and reply() can be called from several threads.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.request_id = None
+        self._send_lock = threading.Lock()
+
+    def recv(self):
+        message = self.conn.recv()
+        if isinstance(message, tuple) and len(message) == 4 and message[0] == "request":
+            _, self.request_id, msg, args = message
+            return msg, args
+        self.request_id = None
+        return message
+
+    def poll(self, timeout=0.0):
+        return self.conn.poll(timeout)
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(("event", message))
+
+    def reply(self, value, request_id=None):
+        """Answer a request (the last one received by default)."""
+        with self._send_lock:
+            self.conn.send(("reply", request_id if request_id is not None else self.request_id, value))
+
+    def close(self):
+        self.conn.close()
+
+class RpcChannel:
+    """
+    OBDH end of a subsystem pipe.
+    A dispatcher thread reads the pipe: replies resolve the Future of their call() by request ID, events go to the
+    subscribers of their message and everything else (including replies to fire-and-forget notify() messages) is
+    queued for receive(), in the order it arrived. Several calls can be outstanding at once.
+    Subscriber callbacks run on the dispatcher thread, so they must not wait for a reply from the same subsystem.
+    Attributes:
+        name (str): Subsystem name.
+        closed (threading.Event): Set once the subsystem end of the pipe is closed (e.g. the process exited).
+        on_message (callable): Called after a message is queued for receive(), so waiters can block instead of polling.
+    """
+    def __init__(self, name: str, conn, logger, on_close: Optional[Callable[[], None]] = None, on_message: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.conn = conn
+        self.logger = logger
+        self.on_close = on_close
+        self.on_message = on_message
+        self.closed = threading.Event()
+        self.inbox = queue.Queue()
+
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = {}  # request id -> (future, msg, send time)
+        self._expired = set()  # request ids of calls that timed out, their replies are dropped
+        self._subscribers = {}  # msg -> list of callbacks
+        self._statistics = {}  # msg -> call statistics
+
+        self._thread = threading.Thread(target=self._dispatch, name=f"{name} RPC", daemon=True)
+        self._thread.start()
+
+    def _send_request(self, msg, args) -> int:
+        request_id = next(self._ids)
+        with self._send_lock:
+            self.conn.send(("request", request_id, msg, args))
+        return request_id
+
+    def call(self, msg: str, args=None, timeout: Optional[float] = None) -> Future:
+        """
+        Send a request and return a Future for its reply.
+        The Future fails with TimeoutError after timeout (s), or with ConnectionError if the subsystem exits.
+        """
+        future = Future()
+        if self.closed.is_set():
+            future.set_exception(ConnectionError(f"{self.name} is not running"))
+            return future
+
+        with self._lock:
+            # Registered before sending, so a fast reply always finds its Future
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, msg, time.monotonic())
+            statistics = self._statistics.setdefault(msg, {"calls": 0, "answered": 0, "timeouts": 0, "errors": 0, "total_latency": 0.0, "max_latency": 0.0})
+            statistics["calls"] += 1
+        try:
+            with self._send_lock:
+                self.conn.send(("request", request_id, msg, args if args is not None else {}))
+        except (BrokenPipeError, EOFError, OSError) as e:
+            self._fail(request_id, ConnectionError(f"Could not send {msg} to {self.name}: {e}"))
+            return future
+
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._fail, (request_id, TimeoutError(f"{self.name} did not answer {msg} within {timeout} s"), True))
+            timer.daemon = True
+            timer.start()
+            future.add_done_callback(lambda _: timer.cancel())
+        return future
+
+    def notify(self, msg: str, args=None) -> None:
+        """Send a message without waiting for a reply, a reply (if any) is queued for receive()."""
+        self._send_request(msg, args if args is not None else {})
+
+    def send(self, message) -> None:
+        """Connection-like send: (msg, args) tuples are sent with notify()."""
+        if isinstance(message, tuple) and len(message) == 2:
+            self.notify(*message)
+        else:
+            self.notify(message)
+
+    def receive(self, timeout: Optional[float] = None, default=None):
+        """
+        Next queued message (an event without subscriber or a reply to notify()).
+        Returns default on timeout or once the pipe is closed (replies can be None, pass another default to tell).
+        """
+        try:
+            message = self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return default
+        if message is _CLOSED:
+            self.inbox.put(_CLOSED)  # Later calls return at once as well
+            return default
+        return message
+
+    def poll(self) -> bool:
+        return not self.inbox.empty()
+
+    def subscribe(self, msg: str, callback: Callable) -> None:
+        """Call callback(args) for every (msg, args) event instead of queueing it."""
+        with self._lock:
+            self._subscribers.setdefault(msg, []).append(callback)
+
+    def unsubscribe(self, msg: str, callback: Callable) -> None:
+        with self._lock:
+            callbacks = self._subscribers.get(msg, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def get_statistics(self) -> Dict[str, Dict[str, float]]:
+        """Per message: calls, answered, timeouts, errors and the mean and max latency (s) of the answered calls."""
+        with self._lock:
+            result = {}
+            for msg, statistics in self._statistics.items():
+                result[msg] = {key: statistics[key] for key in ("calls", "answered", "timeouts", "errors", "max_latency")}
+                result[msg]["mean_latency"] = statistics["total_latency"] / statistics["answered"] if statistics["answered"] > 0 else 0.0
+            return result
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _fail(self, request_id, error, timed_out=False) -> None:
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                return
+            future, msg, _ = entry
+            self._statistics[msg]["timeouts" if timed_out else "errors"] += 1
+            if timed_out:
+                self._expired.add(request_id)
+        if timed_out:
+            self.logger.warning(str(error))
+        if not future.done():
+            future.set_exception(error)
+
+    def _resolve(self, request_id, value) -> None:
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                if request_id in self._expired:
+                    self._expired.discard(request_id)
+                    self.logger.warning(f"Dropped late reply from {self.name} to request {request_id}")
+                    return
+                # Reply to a notify() message
+                self._queue(value)
+                return
+            future, msg, sent = entry
+            latency = time.monotonic() - sent
+            statistics = self._statistics[msg]
+            statistics["answered"] += 1
+            statistics["total_latency"] += latency
+            statistics["max_latency"] = max(statistics["max_latency"], latency)
+        if not future.done():
+            future.set_result(value)
+
+    def _queue(self, value) -> None:
+        self.inbox.put(value)
+        if self.on_message is not None:
+            self.on_message()
+
+    def _publish(self, value) -> None:
+        callbacks = []
+        if isinstance(value, tuple) and len(value) == 2:
+            with self._lock:
+                callbacks = list(self._subscribers.get(value[0], []))
+        if not callbacks:
+            self._queue(value)
+            return
+        for callback in callbacks:
+            try:
+                callback(value[1])
+            except Exception as e:
+                self.logger.error(f"Subscriber of {value[0]} from {self.name} failed: {e}")
+
+    def _dispatch(self) -> None:
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if isinstance(message, tuple) and len(message) == 3 and message[0] == "reply":
+                self._resolve(message[1], message[2])
+            elif isinstance(message, tuple) and len(message) == 2 and message[0] == "event":
+                self._publish(message[1])
+            else:
+                self._publish(message)
+
+        self.closed.set()
+        with self._lock:
+            request_ids = list(self._pending)
+        for request_id in request_ids:
+            self._fail(request_id, ConnectionError(f"{self.name} pipe closed"))
+        self._queue(_CLOSED)
+        if self.on_close is not None:
+            self.on_close()
+
+def _send_periodically(conn, count: int, interval: float) -> None:
+    endpoint = RpcEndpoint(conn)
+    for i in range(count):
+        time.sleep(interval)
+        endpoint.send(("tick", {"i": i}))
+    conn.close()
+
+def benchmark_idle_load(duration: float = 3.0, interval: float = 0.5) -> Dict[str, Dict[str, float]]:
+    """
+    CPU load of waiting for sparse subsystem messages (one every interval s), the old way (spinning on
+    Connection.poll()) and through an RpcChannel (blocking wait). Load is CPU time over wall time of the
+    OBDH process, 1.0 being a full core.
+    """
+    import logging
+    import multiprocessing as mp
+
+    count = max(1, int(duration / interval))
+    results = {}
+    for mode in ("poll_loop", "event_wait"):
+        obdh_end, subsystem_end = mp.Pipe()
+        sender = mp.Process(target=_send_periodically, args=(subsystem_end, count, interval), daemon=True)
+        sender.start()
+        subsystem_end.close()
+
+        received = 0
+        start, cpu_start = time.monotonic(), time.process_time()
+        if mode == "poll_loop":
+            while received < count:
+                if obdh_end.poll():
+                    obdh_end.recv()
+                    received += 1
+        else:
+            channel = RpcChannel("benchmark", obdh_end, logging.getLogger(__name__))
+            while received < count and channel.receive() is not None:
+                received += 1
+        wall, cpu = time.monotonic() - start, time.process_time() - cpu_start
+        sender.join()
+        results[mode] = {"messages": received, "wall_s": round(wall, 3), "cpu_s": round(cpu, 3), "load": round(cpu / wall, 3)}
+    return results
+
+if __name__ == "__main__":
+    for mode, result in benchmark_idle_load().items():
+        print(f"{mode}: {result['messages']} messages in {result['wall_s']} s, CPU {result['cpu_s']} s, load {result['load'] * 100:.1f}% of a core")
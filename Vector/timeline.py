@@ -0,0 +1,41 @@
+import time
+from typing import Dict, Optional
+
+class StartupTimeline:
+    """
+    Durations of the startup stages of a subsystem (import, hardware open, calibration, ...).
+    Created when the subsystem process starts and sent to OBDH with the subsystem's "ready" event.
+    Times come from time.monotonic(), which is shared by all processes, so OBDH can relate them to the spawn time.
+    """
+    def __init__(self, name: str, clock=time):
+        self.name = name
+        self.clock = clock
+        self.start = clock.monotonic()
+        self.last = self.start
+        self.stages = []
+
+    def mark(self, stage: str) -> float:
+        """End a stage (it started at the previous mark) and return its duration (s)."""
+        now = self.clock.monotonic()
+        duration = now - self.last
+        self.stages.append((stage, duration))
+        self.last = now
+        return duration
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "stages": list(self.stages),
+            "total": self.last - self.start
+        }
+
+def format_timeline(timeline: Dict, spawned: Optional[float] = None) -> str:
+    """One line summary of a timeline dict, e.g. "ADCS ready after 9.81 s (spawn 0.05 s, import 0.41 s, ...)"."""
+    stages = list(timeline["stages"])
+    total = timeline["total"]
+    if spawned is not None:
+        stages.insert(0, ("spawn", timeline["start"] - spawned))
+        total += timeline["start"] - spawned
+    details = ", ".join(f"{stage} {duration:.2f} s" for stage, duration in stages)
+    return f"{timeline['name']} ready after {total:.2f} s ({details})"